@@ -0,0 +1,138 @@
+import math
+
+from .incident_columns import get_incident_columns
+
+# Incidents closer together than this many screen pixels share a cluster.
+CLUSTER_RADIUS_PX = 60
+# Deepest zoom level that is clustered. Above it the map shows individual markers.
+MAX_CLUSTER_ZOOM = 16
+# Web Mercator cannot represent the poles.
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def project_mercator(lon, lat):
+    """
+    Projects a coordinate to normalized Web Mercator space, where both axes run 0..1
+    and y grows southwards (the same orientation as map tiles).
+    """
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def _cells_per_axis(zoom):
+    # A world tile is 256px wide at zoom 0 and doubles with every zoom level.
+    return (2 ** zoom) * 256 / CLUSTER_RADIUS_PX
+
+
+class ClusterHierarchy:
+    """
+    Grid-based marker clusters for every zoom level from 0 to MAX_CLUSTER_ZOOM.
+
+    The cell size halves with every zoom level, so the clusters at zoom z are
+    built by merging the four child cells at zoom z + 1. Each cell stores
+    [count, lat_sum, lon_sum, first_position]; the centroid is the mean position.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns (IncidentColumns): The decoded columns of the incidents.
+        """
+        self.levels = [None] * (MAX_CLUSTER_ZOOM + 1)
+        self.levels[MAX_CLUSTER_ZOOM] = build_cluster_level(columns, range(len(columns)), MAX_CLUSTER_ZOOM)
+
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            parent_level = {}
+            for (cx, cy), (count, lat_sum, lon_sum, first_position) in self.levels[zoom + 1].items():
+                parent_cell = (cx // 2, cy // 2)
+                entry = parent_level.get(parent_cell)
+                if entry is None:
+                    parent_level[parent_cell] = [count, lat_sum, lon_sum, first_position]
+                else:
+                    entry[0] += count
+                    entry[1] += lat_sum
+                    entry[2] += lon_sum
+                    entry[3] = min(entry[3], first_position)
+            self.levels[zoom] = parent_level
+
+    def query(self, zoom, min_lon, min_lat, max_lon, max_lat):
+        """
+        Returns the clusters at a zoom level whose cells overlap the bounding box.
+
+        Args:
+            zoom (int): Map zoom level; values above MAX_CLUSTER_ZOOM are clamped.
+
+        Returns:
+            list: (count, centroid_lat, centroid_lon, first_position) tuples.
+        """
+        zoom = max(0, min(MAX_CLUSTER_ZOOM, zoom))
+        return query_cluster_level(self.levels[zoom], zoom, min_lon, min_lat, max_lon, max_lat)
+
+
+def build_cluster_level(columns, positions, zoom):
+    """
+    Groups the geocoded incidents at positions into the grid cells of one zoom level.
+
+    Args:
+        columns (IncidentColumns): The decoded columns of the incidents.
+
+    Returns:
+        dict: Maps (cell_x, cell_y) to [count, lat_sum, lon_sum, first_position].
+    """
+    scale = _cells_per_axis(zoom)
+    level = {}
+    lats, lons = columns.lats, columns.lons
+    for position in columns.geocoded_positions(positions):
+        lat = lats[position]
+        lon = lons[position]
+        x, y = project_mercator(lon, lat)
+        cell = (math.floor(x * scale), math.floor(y * scale))
+        entry = level.get(cell)
+        if entry is None:
+            level[cell] = [1, lat, lon, position]
+        else:
+            entry[0] += 1
+            entry[1] += lat
+            entry[2] += lon
+    return level
+
+
+def query_cluster_level(level, zoom, min_lon, min_lat, max_lon, max_lat):
+    """
+    Returns the clusters of one level (see build_cluster_level) whose cells
+    overlap the bounding box, as (count, centroid_lat, centroid_lon, first_position) tuples.
+    """
+    scale = _cells_per_axis(zoom)
+    # North-west and south-east corners; y grows southwards.
+    x0, y0 = project_mercator(min_lon, max_lat)
+    x1, y1 = project_mercator(max_lon, min_lat)
+    min_cx, min_cy = math.floor(x0 * scale), math.floor(y0 * scale)
+    max_cx, max_cy = math.floor(x1 * scale), math.floor(y1 * scale)
+
+    if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(level):
+        cells = [
+            entry for (cx, cy), entry in level.items()
+            if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy
+        ]
+    else:
+        cells = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                entry = level.get((cx, cy))
+                if entry is not None:
+                    cells.append(entry)
+
+    return [
+        (count, lat_sum / count, lon_sum / count, first_position)
+        for count, lat_sum, lon_sum, first_position in cells
+    ]
+
+
+def get_cluster_hierarchy(snapshot):
+    """
+    Returns the cluster hierarchy for an IncidentSnapshot, building it once per dataset version.
+    """
+    return snapshot.get_derived('cluster_hierarchy', lambda snap: ClusterHierarchy(get_incident_columns(snap)))
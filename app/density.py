@@ -0,0 +1,199 @@
+import math
+
+# Root module; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from incident_repository import ISO_DATE_PREFIX_RE
+from metrics import ROWS_SCANNED
+
+from .clustering import project_mercator
+from .incident_columns import MAX_INCREMENTAL_FRACTION, get_incident_columns
+
+# Side of a density cell in screen pixels. A power-of-two fraction of the 256px
+# tile, so every cell splits exactly into four cells at the next zoom level.
+DENSITY_CELL_PX = 32
+# Deepest zoom level with a density grid; deeper zooms get the grid of this level.
+MAX_DENSITY_ZOOM = 16
+
+
+def _cells_per_axis(zoom):
+    return (2 ** zoom) * 256 // DENSITY_CELL_PX
+
+
+def _density_key(lats, lons, post_dates, position):
+    """
+    Returns (x, y, day) for the row at position of a set of incident columns,
+    where x/y are its normalized Web Mercator coordinates and day its
+    "YYYY-MM-DD" post date ('' if unknown), or None if the row is not geocoded.
+    """
+    lat = lats[position]
+    if lat is None:
+        return None
+    post_date = post_dates[position]
+    day = post_date[:10] if ISO_DATE_PREFIX_RE.match(post_date) else ''
+    x, y = project_mercator(lons[position], lat)
+    return x, y, day
+
+
+def cell_center(cx, cy, zoom):
+    """
+    Returns the (lat, lon) of the center of a density cell.
+    """
+    scale = _cells_per_axis(zoom)
+    x = (cx + 0.5) / scale
+    y = (cy + 0.5) / scale
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, x * 360.0 - 180.0
+
+
+class DensityGrids:
+    """
+    Incident counts per grid cell for every zoom level from 0 to MAX_DENSITY_ZOOM.
+
+    Each level maps (cell_x, cell_y) to [total, {day: count}], so a density
+    query without a date range just reads the totals, and one with a range only
+    sums the per-day counts of the cells in view.
+
+    Grids are never modified once built. updated() returns the grids of a new
+    dataset version by applying just the rows that were appended or had their
+    coordinates filled in, copying only the cells those rows fall in.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns (IncidentColumns): The decoded columns of the incidents.
+        """
+        # The columns of all rows, by position; kept to find the cells of changed rows.
+        self.lats = columns.lats
+        self.lons = columns.lons
+        self.post_dates = columns.post_dates
+        self.levels = [{} for _ in range(MAX_DENSITY_ZOOM + 1)]
+        for position in range(len(columns)):
+            key = _density_key(self.lats, self.lons, self.post_dates, position)
+            if key is not None:
+                self._apply(key, 1, None)
+        ROWS_SCANNED.labels(operation='density_build').inc(len(columns))
+
+    def _apply(self, key, delta, copied):
+        # Adds delta to the cell holding key at every level. copied collects the
+        # cells already copied from the grids these were derived from (None when
+        # building from scratch, where nothing is shared).
+        x, y, day = key
+        for zoom, level in enumerate(self.levels):
+            scale = _cells_per_axis(zoom)
+            cell = (math.floor(x * scale), math.floor(y * scale))
+            entry = level.get(cell)
+            if copied is not None and (zoom, cell) not in copied:
+                copied.add((zoom, cell))
+                if entry is not None:
+                    entry = level[cell] = [entry[0], dict(entry[1])]
+            if entry is None:
+                entry = level[cell] = [0, {}]
+            entry[0] += delta
+            count = entry[1].get(day, 0) + delta
+            if count:
+                entry[1][day] = count
+            else:
+                del entry[1][day]
+            if not entry[0]:
+                del level[cell]
+
+    def updated(self, columns, changed_positions):
+        """
+        Returns the grids for columns, decoded from a later version of the rows
+        these grids were built from, given the positions of the rows that changed
+        in between. Rows that were appended or whose coordinates or date changed
+        are applied to a copy of these grids; if rows were removed or too many
+        changed, the grids are rebuilt.
+        """
+        old_lats, old_lons, old_post_dates = self.lats, self.lons, self.post_dates
+        previous_count = len(old_lats)
+        if len(columns) < previous_count:
+            return DensityGrids(columns)
+        lats, lons, post_dates = columns.lats, columns.lons, columns.post_dates
+        changed = [position for position in changed_positions
+                   if position < previous_count and (old_lats[position] != lats[position]
+                                                     or old_lons[position] != lons[position]
+                                                     or old_post_dates[position] != post_dates[position])]
+        appended = len(columns) - previous_count
+        if len(changed) + appended > MAX_INCREMENTAL_FRACTION * len(columns):
+            return DensityGrids(columns)
+
+        grids = DensityGrids.__new__(DensityGrids)
+        grids.lats, grids.lons, grids.post_dates = lats, lons, post_dates
+        grids.levels = [dict(level) for level in self.levels]
+        copied = set()
+        for position in changed:
+            old_key = _density_key(old_lats, old_lons, old_post_dates, position)
+            if old_key is not None:
+                grids._apply(old_key, -1, copied)
+            new_key = _density_key(lats, lons, post_dates, position)
+            if new_key is not None:
+                grids._apply(new_key, 1, copied)
+        for position in range(previous_count, len(columns)):
+            key = _density_key(lats, lons, post_dates, position)
+            if key is not None:
+                grids._apply(key, 1, copied)
+        ROWS_SCANNED.labels(operation='density_update').inc(len(changed) + appended)
+        return grids
+
+    def query(self, zoom, min_lon, min_lat, max_lon, max_lat, since=None, until=None):
+        """
+        Returns the non-empty cells at a zoom level that overlap the bounding box.
+
+        Args:
+            zoom (int): Map zoom level; values above MAX_DENSITY_ZOOM are clamped.
+            since, until (str, optional): Only count incidents posted in this
+                "YYYY-MM-DD" range; incidents without a date are then left out.
+
+        Returns:
+            list: (cell_x, cell_y, count) tuples.
+        """
+        zoom = max(0, min(MAX_DENSITY_ZOOM, zoom))
+        level = self.levels[zoom]
+        scale = _cells_per_axis(zoom)
+        # North-west and south-east corners; y grows southwards.
+        x0, y0 = project_mercator(min_lon, max_lat)
+        x1, y1 = project_mercator(max_lon, min_lat)
+        min_cx, min_cy = math.floor(x0 * scale), math.floor(y0 * scale)
+        max_cx, max_cy = math.floor(x1 * scale), math.floor(y1 * scale)
+
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(level):
+            cells = [(cx, cy, entry) for (cx, cy), entry in level.items()
+                     if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy]
+        else:
+            cells = []
+            for cx in range(min_cx, max_cx + 1):
+                for cy in range(min_cy, max_cy + 1):
+                    entry = level.get((cx, cy))
+                    if entry is not None:
+                        cells.append((cx, cy, entry))
+
+        if since is None and until is None:
+            return [(cx, cy, entry[0]) for cx, cy, entry in cells]
+        counts = []
+        for cx, cy, (_, days) in cells:
+            count = sum(day_count for day, day_count in days.items()
+                        if day and (since is None or day >= since) and (until is None or day <= until))
+            if count:
+                counts.append((cx, cy, count))
+        return counts
+
+
+def _build_density_grids(snapshot):
+    columns = get_incident_columns(snapshot)
+    previous = snapshot.previous
+    previous_grids = previous.peek_derived('density_grids') if previous is not None else None
+    if previous_grids is not None:
+        changed_positions = snapshot.changes_since(previous.version)
+        if changed_positions is not None:
+            return previous_grids.updated(columns, changed_positions)
+    return DensityGrids(columns)
+
+
+def get_density_grids(snapshot):
+    """
+    Returns the density grids for an IncidentSnapshot. They are built once per
+    dataset version, by updating the previous version's grids when only a few
+    rows were appended or geocoded.
+    """
+    return snapshot.get_derived('density_grids', _build_density_grids)
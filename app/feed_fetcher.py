@@ -0,0 +1,325 @@
+import http.client
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.robotparser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+# Root module; rss_fetcher puts the project root on sys.path before importing this one.
+from file_lock import get_file_lock
+
+USER_AGENT = "uw_incident_mapper/1.0"
+DEFAULT_TIMEOUT_SECONDS = 10
+# Idle keep-alive connections kept per host.
+MAX_IDLE_CONNECTIONS_PER_HOST = 4
+# A failing feed is retried after BACKOFF_BASE_SECONDS, doubling per consecutive failure up to the max.
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+# robots.txt decisions are reused for this long.
+ROBOTS_TTL_SECONDS = 60 * 60
+# Redirects followed per request.
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+FEED_OK = 'ok'
+FEED_NOT_MODIFIED = 'not_modified'
+FEED_BACKING_OFF = 'backing_off'
+FEED_DISALLOWED = 'disallowed'
+FEED_ERROR = 'error'
+
+
+class HttpResponse:
+    def __init__(self, status, headers, body, url=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # The URL that answered, after any redirects.
+        self.url = url
+
+
+class RedirectNotAllowed(Exception):
+    """
+    Raised by PooledHttpClient.get when a redirect leads to a URL that its
+    allow_url callback refuses (e.g. one disallowed by that host's robots.txt).
+    """
+
+    def __init__(self, url):
+        super().__init__(f"redirect to {url} is not allowed")
+        self.url = url
+
+
+class PooledHttpClient:
+    """
+    Minimal HTTP/1.1 client that keeps idle keep-alive connections per host and
+    reuses them across requests and threads, so polling the same feeds repeatedly
+    does not pay for a new TCP (and TLS) handshake every time.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT_SECONDS, max_idle_per_host=MAX_IDLE_CONNECTIONS_PER_HOST):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool_for(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = queue.LifoQueue(maxsize=self.max_idle_per_host)
+            return pool
+
+    def _new_connection(self, scheme, host, port):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def get(self, url, headers=None, max_redirects=MAX_REDIRECTS, allow_url=None):
+        """
+        Performs a GET request, following up to max_redirects redirects.
+
+        Args:
+            allow_url (callable, optional): Called with the target of every
+                redirect that leads to another host; returning False stops there.
+
+        Returns:
+            HttpResponse: status, headers (case-insensitive message object), body
+            bytes and the URL that answered.
+
+        Raises:
+            OSError, http.client.HTTPException: On network or protocol errors,
+                including more than max_redirects redirects.
+            RedirectNotAllowed: If allow_url refused a redirect target.
+        """
+        for _ in range(max_redirects + 1):
+            response = self._get_once(url, headers)
+            location = response.headers.get('Location') if response.status in REDIRECT_STATUSES else None
+            if not location:
+                response.url = url
+                return response
+            target = urljoin(url, location)
+            if (allow_url is not None and urlsplit(target).netloc != urlsplit(url).netloc
+                    and not allow_url(target)):
+                raise RedirectNotAllowed(target)
+            url = target
+        raise http.client.HTTPException(f"more than {max_redirects} redirects")
+
+    def _get_once(self, url, headers):
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        key = (scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+        request_headers.update(headers or {})
+
+        pool = self._pool_for(key)
+        # A pooled connection may have been closed by the server while idle; retry once on a fresh one.
+        for attempt in range(2):
+            try:
+                connection = pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                connection = self._new_connection(scheme, parts.hostname, parts.port)
+                reused = False
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                try:
+                    pool.put_nowait(connection)
+                except queue.Full:
+                    connection.close()
+            return HttpResponse(response.status, response.headers, body)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class FeedStateStore:
+    """
+    Per-feed validators (ETag / Last-Modified) and backoff state, persisted as
+    JSON so conditional requests keep working across restarts.
+
+    The file is shared by every process that fetches (web workers and the CLI):
+    it is read on every access, and an update re-reads it and changes only its
+    own feed's entry under a FileLock on "<path>.lock".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = get_file_lock(path + '.lock')
+
+    def _read(self):
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, feed_url):
+        return dict(self._read().get(feed_url, {}))
+
+    def update(self, feed_url, **changes):
+        with self._lock:
+            state = self._read()
+            state.setdefault(feed_url, {}).update(changes)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, mode='w', encoding='utf-8') as state_file:
+                    json.dump(state, state_file, indent=2, sort_keys=True)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+
+class FeedResult:
+    def __init__(self, feed_url, status, body=None, detail='', etag=None, last_modified=None):
+        self.feed_url = feed_url
+        self.status = status
+        self.body = body
+        self.detail = detail
+        # Validators of a FEED_OK response; stored only by FeedFetcher.commit_validators.
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class FeedFetcher:
+    """
+    Polls a list of RSS feeds concurrently.
+
+    Each feed is requested with If-None-Match / If-Modified-Since from the
+    validators committed after its items were last stored, so an unchanged feed
+    costs a 304 with no body. A feed that fails is skipped with exponential
+    backoff until its next retry time. robots.txt is honoured: a feed whose path
+    is disallowed for our user agent is never requested.
+    """
+
+    def __init__(self, feed_urls, state_path, client=None, max_workers=4, respect_robots_txt=True):
+        """
+        Args:
+            feed_urls (list): Feed URLs to poll.
+            state_path (str): JSON file for validators and backoff state.
+            client (PooledHttpClient, optional): Shared HTTP client.
+            max_workers (int): Feeds fetched in parallel.
+            respect_robots_txt (bool): Check robots.txt before fetching a feed.
+        """
+        self.feed_urls = list(feed_urls)
+        self.state = FeedStateStore(state_path)
+        self.client = client or PooledHttpClient()
+        self.max_workers = max_workers
+        self.respect_robots_txt = respect_robots_txt
+        self._robots = {}
+        self._robots_lock = threading.Lock()
+
+    def _robots_allows(self, feed_url):
+        parts = urlsplit(feed_url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._robots_lock:
+            cached = self._robots.get(origin)
+        if cached is None or time.time() - cached[0] > ROBOTS_TTL_SECONDS:
+            parser = urllib.robotparser.RobotFileParser()
+            response = self.client.get(origin + '/robots.txt')
+            # Same interpretation as RobotFileParser.read(): 401/403 forbid everything,
+            # any other error status means there are no rules.
+            if response.status in (401, 403):
+                parser.disallow_all = True
+            elif response.status >= 400:
+                parser.allow_all = True
+            else:
+                parser.parse(response.body.decode('utf-8', errors='replace').splitlines())
+            cached = (time.time(), parser)
+            with self._robots_lock:
+                self._robots[origin] = cached
+        return cached[1].can_fetch(USER_AGENT, feed_url)
+
+    def _record_failure(self, feed_url, entry, detail):
+        failures = entry.get('failures', 0) + 1
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** (failures - 1)), BACKOFF_MAX_SECONDS)
+        self.state.update(feed_url, failures=failures, next_attempt_at=time.time() + delay, last_error=detail)
+        return FeedResult(feed_url, FEED_ERROR, detail=f"{detail} (retrying in {delay}s)")
+
+    def fetch_feed(self, feed_url):
+        """
+        Fetches one feed, returning a FeedResult.
+        """
+        entry = self.state.get(feed_url)
+        if entry.get('next_attempt_at', 0) > time.time():
+            return FeedResult(feed_url, FEED_BACKING_OFF, detail=f"backing off after {entry.get('failures', 0)} failures")
+
+        try:
+            if self.respect_robots_txt and not self._robots_allows(feed_url):
+                return FeedResult(feed_url, FEED_DISALLOWED, detail="disallowed by robots.txt")
+
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            # A feed that moved to another host is only followed if that host's robots.txt allows it.
+            response = self.client.get(feed_url, headers=headers,
+                                       allow_url=self._robots_allows if self.respect_robots_txt else None)
+        except RedirectNotAllowed as e:
+            return FeedResult(feed_url, FEED_DISALLOWED, detail=f"redirected to {e.url}, disallowed by robots.txt")
+        except Exception as e:
+            return self._record_failure(feed_url, entry, f"request failed: {e}")
+
+        if response.status == 304:
+            self.state.update(feed_url, failures=0, next_attempt_at=0, last_error=None)
+            return FeedResult(feed_url, FEED_NOT_MODIFIED)
+        if response.status != 200:
+            return self._record_failure(feed_url, entry, f"HTTP {response.status}")
+
+        # The validators are not stored yet: see commit_validators.
+        self.state.update(feed_url, failures=0, next_attempt_at=0, last_error=None)
+        return FeedResult(feed_url, FEED_OK, body=response.body, etag=response.headers.get('ETag'),
+                          last_modified=response.headers.get('Last-Modified'))
+
+    def commit_validators(self, result):
+        """
+        Stores the ETag / Last-Modified of a FEED_OK result, so the next fetch of
+        that feed is conditional. Call it only once the feed's items are stored:
+        if parsing or storing fails after the validators were saved, the next
+        fetch would get a 304 and those items would never be ingested.
+        """
+        self.state.update(result.feed_url, etag=result.etag, last_modified=result.last_modified)
+
+    def fetch_all(self):
+        """
+        Fetches every configured feed concurrently.
+
+        Returns:
+            list: One FeedResult per feed, in configuration order.
+        """
+        if not self.feed_urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.feed_urls))) as executor:
+            return list(executor.map(self.fetch_feed, self.feed_urls))
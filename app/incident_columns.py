@@ -0,0 +1,150 @@
+import math
+import re
+
+# Root module; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from incident_repository import normalize_post_date
+from metrics import ROWS_SCANNED
+
+# post_date exactly as it is stored since dates are normalized on ingest.
+STORED_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# The indexes built from the columns (the time index, the density grids) are
+# updated like IncidentColumns.updated() when a new dataset version arrives,
+# unless more than this fraction of the rows changed; then they are rebuilt.
+MAX_INCREMENTAL_FRACTION = 0.25
+
+
+def parse_float(value):
+    """
+    Converts a CSV latitude/longitude string to a float.
+
+    Returns:
+        float or None: The parsed value, or None if it is blank or not a finite number.
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(number) or math.isinf(number):
+        return None
+    return number
+
+
+def incident_ref(incident, position):
+    """
+    Returns the identifier used for an incident by the map formats and
+    /api/incidents/<ref>: its id column, or "row-<position>" for rows without an
+    id (incidents appended from RSS are stored with a blank id). Positions are
+    stable because rows are only ever appended.
+    """
+    return incident.get('id') or f"row-{position}"
+
+
+def indexed_post_date(value):
+    """
+    Returns a row's post_date in normalized "YYYY-MM-DD" form. Values stored
+    since normalization on ingest are already in that form and are taken as
+    they are; only legacy rows go through normalize_post_date.
+    """
+    if value and STORED_DATE_RE.match(value):
+        return value
+    return normalize_post_date(value)
+
+
+def _row_values(incident, position):
+    # (ref, lat, lon, post_date) of one row; lat/lon are both None unless both parse.
+    lat = parse_float(incident.get('latitude'))
+    lon = parse_float(incident.get('longitude'))
+    if lat is None or lon is None:
+        lat = lon = None
+    return incident_ref(incident, position), lat, lon, indexed_post_date(incident.get('post_date'))
+
+
+class IncidentColumns:
+    """
+    The columns the indexes and the compact map formats work from, decoded
+    once per dataset version into parallel lists indexed by row position:
+    refs, lats and lons (None for rows that are not geocoded) and normalized
+    post_dates.
+
+    Rows of a shared snapshot are JSON that is decoded on every access, so
+    building each index straight from the rows would decode every row once per
+    index and version. updated() instead copies the previous version's columns
+    and decodes only the rows that were appended or changed.
+    """
+
+    def __init__(self, incidents=()):
+        """
+        Args:
+            incidents (Sequence): Incident dictionaries, in storage order.
+        """
+        self.refs = []
+        self.lats = []
+        self.lons = []
+        self.post_dates = []
+        for position in range(len(incidents)):
+            self._append(_row_values(incidents[position], position))
+        ROWS_SCANNED.labels(operation='columns_build').inc(len(incidents))
+
+    def __len__(self):
+        return len(self.refs)
+
+    def _append(self, values):
+        ref, lat, lon, post_date = values
+        self.refs.append(ref)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.post_dates.append(post_date)
+
+    def updated(self, incidents, changed_positions):
+        """
+        Returns the columns for incidents, a later version of the rows these
+        columns were decoded from, given the positions of the rows that changed
+        in between. Only those rows are decoded; if rows were removed, all are.
+        """
+        if len(incidents) < len(self):
+            return IncidentColumns(incidents)
+        columns = IncidentColumns.__new__(IncidentColumns)
+        columns.refs = list(self.refs)
+        columns.lats = list(self.lats)
+        columns.lons = list(self.lons)
+        columns.post_dates = list(self.post_dates)
+        decoded = 0
+        for position in changed_positions:
+            if position < len(self):
+                (columns.refs[position], columns.lats[position], columns.lons[position],
+                 columns.post_dates[position]) = _row_values(incidents[position], position)
+                decoded += 1
+        for position in range(len(self), len(incidents)):
+            columns._append(_row_values(incidents[position], position))
+            decoded += 1
+        ROWS_SCANNED.labels(operation='columns_update').inc(decoded)
+        return columns
+
+    def geocoded_positions(self, positions=None):
+        """
+        Yields the positions (all, or those among positions) of geocoded rows.
+        """
+        lats = self.lats
+        if positions is None:
+            positions = range(len(lats))
+        for position in positions:
+            if lats[position] is not None:
+                yield position
+
+
+def _build_incident_columns(snapshot):
+    previous = snapshot.previous
+    previous_columns = previous.peek_derived('columns') if previous is not None else None
+    if previous_columns is not None:
+        changed_positions = snapshot.changes_since(previous.version)
+        if changed_positions is not None:
+            return previous_columns.updated(snapshot.incidents, changed_positions)
+    return IncidentColumns(snapshot.incidents)
+
+
+def get_incident_columns(snapshot):
+    """
+    Returns the IncidentColumns of an IncidentSnapshot. They are decoded once per
+    dataset version, by updating the previous version's columns when possible.
+    """
+    return snapshot.get_derived('columns', _build_incident_columns)
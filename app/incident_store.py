@@ -0,0 +1,182 @@
+import hashlib
+import json
+import threading
+
+# Root modules; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from metrics import time_stage
+from shared_snapshot import load_shared_snapshot, normalize_signature
+
+
+class IncidentSnapshot:
+    """
+    An immutable view of the incident data at one point in time.
+
+    The JSON payload, ETag and Last-Modified values are computed once when the
+    snapshot is built, so serving it is just a matter of writing bytes.
+    """
+
+    def __init__(self, incidents, version, signature, last_modified, previous=None,
+                 json_bytes=None, etag=None, change_log=None):
+        """
+        Args:
+            incidents (Sequence): Incident dictionaries, in storage order.
+            json_bytes (bytes or memoryview, optional): incidents encoded as a JSON
+                array; computed from incidents if not given.
+            etag (str, optional): Hash of json_bytes; computed if not given.
+            change_log (MappedSnapshot, optional): Source of the rows changed in
+                recent versions; without one, deltas are not available.
+        """
+        self.incidents = incidents
+        self.version = version
+        self.signature = signature
+        self.last_modified = last_modified
+        if json_bytes is None:
+            json_bytes = json.dumps(list(incidents), separators=(',', ':')).encode('utf-8')
+        self.json_bytes = json_bytes
+        # Strong ETag derived from the exact bytes we serve.
+        self.etag = etag or hashlib.sha1(json_bytes).hexdigest()
+        self._derived = {}
+        # Guards _key_locks only; each derived structure is built under its own lock.
+        self._derived_lock = threading.Lock()
+        self._key_locks = {}
+        # The snapshot this one replaced, so derived structures can be updated
+        # incrementally instead of rebuilt (see search_index, density). Only one level is kept.
+        self.previous = previous
+        self.change_log = change_log
+
+    def get_derived(self, key, builder):
+        """
+        Returns a structure derived from this snapshot (an index, a cached
+        response body, ...), building it on first use.
+
+        Args:
+            key (hashable): Cache key for the derived value.
+            builder (callable): Called with this snapshot to build the value.
+        """
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        # One lock per key: a slow build (e.g. the search index) only blocks
+        # requests waiting for that same structure, not those needing others.
+        with self._derived_lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = threading.Lock()
+        with key_lock:
+            if key not in self._derived:
+                self._derived[key] = builder(self)
+            return self._derived[key]
+
+    def changes_since(self, version):
+        """
+        Returns the sorted positions of the rows appended or changed after a
+        dataset version, or None if that version is too old (or unknown) to
+        compute a delta from, in which case clients should reload everything.
+        """
+        if version == self.version:
+            return []
+        if self.change_log is None:
+            return None
+        return self.change_log.changed_positions(version)
+
+    def peek_derived(self, key):
+        """
+        Returns a derived structure if it has already been built, else None.
+        """
+        return self._derived.get(key)
+
+
+class IncidentStore:
+    """
+    Process-level view of the incident repository's contents.
+
+    Rather than parsing the data file, every process maps the repository's
+    shared snapshot (see shared_snapshot.py), which writers regenerate under the
+    write lock. It is remapped only when the repository's signature (for a CSV:
+    inode, mtime and size) changes, e.g. after append_incidents_to_csv or
+    geocode_csv_data has written to it.
+
+    The dataset version, Last-Modified and ETag come from the snapshot file, so
+    all workers agree on them. Versions only ever increase.
+    """
+
+    def __init__(self, repository):
+        """
+        Args:
+            repository (IncidentRepository): Where the incidents are stored.
+        """
+        self.repository = repository
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _load(self, previous=None):
+        with time_stage('api', 'snapshot_load'):
+            mapped = load_shared_snapshot(self.repository)
+        if previous is not None:
+            # Keep a single generation so old snapshots (and their mappings) can be released.
+            previous.previous = None
+        # The snapshot's creation time stands in for the data's modification time.
+        return IncidentSnapshot(mapped.incidents, mapped.version, mapped.source_signature, mapped.created,
+                                previous=previous, json_bytes=mapped.json_body, etag=mapped.content_hash,
+                                change_log=mapped)
+
+    def get_snapshot(self):
+        """
+        Returns the current snapshot, reloading the data first if it changed on disk.
+
+        Raises:
+            FileNotFoundError: If the data file does not exist.
+        """
+        signature = normalize_signature(self.repository.signature())
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we were waiting for the lock.
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.signature == signature:
+                return snapshot
+            snapshot = self._load(previous=self._snapshot)
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        """
+        Drops the cached snapshot so the next request maps the data again.
+        """
+        with self._lock:
+            self._snapshot = None
+
+
+class ChangeNotifier:
+    """
+    Wakes up threads waiting for the data to change, e.g. the Server-Sent Events
+    streams of /api/incidents/stream when a fetch has appended new incidents.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def notify(self):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, seen_generation, timeout):
+        """
+        Blocks until notify() has been called since seen_generation was returned,
+        or until timeout seconds have passed.
+
+        Returns:
+            int: The current generation, to pass to the next call.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._generation != seen_generation, timeout)
+            return self._generation
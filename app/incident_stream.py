@@ -0,0 +1,120 @@
+import base64
+import bisect
+import json
+
+# Largest page a client may request with ?limit=.
+MAX_PAGE_SIZE = 5000
+# Rows encoded per chunk written to the response stream.
+ROWS_PER_CHUNK = 500
+
+
+def encode_cursor(position):
+    """
+    Encodes a row position as an opaque pagination cursor.
+
+    Rows are only ever appended (geocoding fills in columns in place), so a
+    position stays valid across dataset versions.
+    """
+    return base64.urlsafe_b64encode(str(position).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("malformed cursor") from e
+    if position < 0:
+        raise ValueError("malformed cursor")
+    return position
+
+
+def parse_fields(fields_string, allowed_fields):
+    """
+    Parses a comma-separated field projection such as "id,latitude,longitude".
+
+    Returns:
+        list or None: The requested fields in the given order, or None for all fields.
+
+    Raises:
+        ValueError: If a field is not one of allowed_fields.
+    """
+    if not fields_string:
+        return None
+    fields = [field.strip() for field in fields_string.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed_fields]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def select_page(positions, cursor_position, limit):
+    """
+    Picks one page out of a sorted list of row positions.
+
+    Args:
+        positions (list): Sorted row positions matching the query.
+        cursor_position (int or None): Only positions at or after this one are returned.
+        limit (int or None): Maximum number of rows; None returns everything.
+
+    Returns:
+        tuple: (page_positions, next_cursor) where next_cursor is None on the last page.
+    """
+    start = bisect.bisect_left(positions, cursor_position) if cursor_position is not None else 0
+    if limit is None:
+        return positions[start:], None
+    page = positions[start:start + limit]
+    if start + limit < len(positions):
+        return page, encode_cursor(positions[start + limit])
+    return page, None
+
+
+def _encode_rows(incidents, positions, fields):
+    # Rows of a mapped snapshot are already JSON; without a projection they are copied as is.
+    raw_json = getattr(incidents, 'raw_json', None) if fields is None else None
+    for start in range(0, len(positions), ROWS_PER_CHUNK):
+        rows = []
+        for position in positions[start:start + ROWS_PER_CHUNK]:
+            if raw_json is not None:
+                rows.append(raw_json(position).decode('utf-8'))
+                continue
+            incident = incidents[position]
+            if fields is not None:
+                incident = {field: incident.get(field, '') for field in fields}
+            rows.append(json.dumps(incident, separators=(',', ':')))
+        yield ','.join(rows)
+
+
+def stream_incidents_json(incidents, positions, fields=None, envelope=False, next_cursor=None, refs=None):
+    """
+    Yields the JSON encoding of the selected incidents chunk by chunk, so only a
+    few hundred encoded rows are in memory at any time.
+
+    Args:
+        incidents (Sequence): All incidents of a snapshot.
+        positions (list): Positions of the rows to emit, in order.
+        fields (list, optional): Projection; None emits every column.
+        envelope (bool): Emit {"incidents": [...], "refs": [...], "next_cursor": ...}
+            instead of a bare array.
+        next_cursor (str, optional): Cursor for the following page (envelope only).
+        refs (list, optional): incident_ref of every row by position, for the
+            envelope's "refs" (the key the compact map formats use for each row).
+    """
+    yield '{"incidents":[' if envelope else '['
+    first = True
+    for chunk in _encode_rows(incidents, positions, fields):
+        if not first:
+            yield ','
+        yield chunk
+        first = False
+    if envelope:
+        yield '],"refs":' + json.dumps([refs[position] for position in positions] if refs is not None else [])
+        yield ',"next_cursor":' + json.dumps(next_cursor) + '}'
+    else:
+        yield ']'
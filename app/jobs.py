@@ -0,0 +1,219 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Root module; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from file_lock import get_file_lock
+
+# Finished jobs kept around for status polling; older ones are forgotten.
+MAX_FINISHED_JOBS = 100
+# A queued or running job whose state has not been saved for this long is taken
+# to have died with its worker process, and a new job of its kind may start.
+# Running jobs save their state on every progress report.
+JOB_STALE_SECONDS = 15 * 60
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+
+class Job:
+    """
+    One unit of background work and its observable state.
+    """
+
+    def __init__(self, kind, manager=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.progress = {"stage": JOB_QUEUED, "message": "Waiting to start.", "completed": 0, "total": None}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.updated_at = self.created_at
+        self._manager = manager
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, state):
+        job = cls(state['kind'])
+        for name in ('id', 'status', 'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at',
+                     'updated_at'):
+            setattr(job, name, state[name])
+        return job
+
+    @property
+    def finished(self):
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    @property
+    def stale(self):
+        return not self.finished and time.time() - self.updated_at > JOB_STALE_SECONDS
+
+    def report_progress(self, stage, message, completed=None, total=None):
+        """
+        Progress callback handed to the job's function.
+        """
+        with self._lock:
+            self.progress = {"stage": stage, "message": message, "completed": completed, "total": total}
+        self._save()
+
+    def _save(self):
+        if self._manager is not None:
+            self._manager._save(self)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "updated_at": self.updated_at,
+            }
+
+
+class JobStore:
+    """
+    Job records shared by every process serving the app, kept in a JSON file:
+
+        {"jobs": {id: job}, "active": {kind: id}, "finished": [id, ...]}
+
+    Changes are made under a FileLock on "<path>.lock", and the file is
+    replaced by renaming a new one over it, so readers need no lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = get_file_lock(path + '.lock')
+
+    def read(self):
+        try:
+            with open(self.path, encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {"jobs": {}, "active": {}, "finished": []}
+
+    def write(self, state):
+        # Only called under self.lock; a unique temporary file keeps a crashed
+        # writer's leftovers from being picked up by the next one.
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as state_file:
+                json.dump(state, state_file)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+class JobManager:
+    """
+    Runs jobs on a small worker pool.
+
+    Submitting a job of a kind that is already queued or running returns the
+    existing job instead of starting another, so a burst of "fetch" clicks
+    results in a single in-flight run that every caller can poll.
+
+    Job records live in a JobStore file, so with several WSGI workers any of
+    them can report on a job, and a job started by one worker is joined by
+    the others rather than run twice.
+    """
+
+    def __init__(self, state_path, max_workers=2, logger=None):
+        """
+        Args:
+            state_path (str): JSON file holding the job records (see JobStore).
+            max_workers (int): Jobs this process runs at once.
+            logger (logging.Logger, optional): Receives job failures.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self.store = JobStore(state_path)
+        self._logger = logger
+
+    def submit(self, kind, func):
+        """
+        Queues func(report_progress) unless a job of the same kind is already active.
+
+        Args:
+            kind (str): Coalescing key, e.g. "fetch-new-incidents".
+            func (callable): Called with the job's report_progress callback; its
+                return value becomes the job result.
+
+        Returns:
+            tuple: (job, created) where created is False if an active job was reused.
+        """
+        with self.store.lock:
+            state = self.store.read()
+            active_id = state['active'].get(kind)
+            if active_id in state['jobs']:
+                active = Job.from_dict(state['jobs'][active_id])
+                if not active.finished and not active.stale:
+                    return active, False
+            job = Job(kind, manager=self)
+            state['jobs'][job.id] = job.to_dict()
+            state['active'][kind] = job.id
+            self.store.write(state)
+        self._executor.submit(self._run, job, func)
+        return job, True
+
+    def _save(self, job):
+        # Writes the job's current state to the store, with a fresh heartbeat.
+        with job._lock:
+            job.updated_at = time.time()
+        record = job.to_dict()
+        with self.store.lock:
+            state = self.store.read()
+            state['jobs'][job.id] = record
+            if job.finished:
+                if state['active'].get(job.kind) == job.id:
+                    del state['active'][job.kind]
+                state['finished'].append(job.id)
+                while len(state['finished']) > MAX_FINISHED_JOBS:
+                    state['jobs'].pop(state['finished'].pop(0), None)
+            self.store.write(state)
+
+    def _run(self, job, func):
+        with job._lock:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+        job.report_progress(JOB_RUNNING, "Started.")
+        try:
+            result = func(job.report_progress)
+        except Exception as e:
+            if self._logger is not None:
+                self._logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            with job._lock:
+                job.progress = {"stage": JOB_FAILED, "message": f"Failed: {e}", "completed": None, "total": None}
+                job.status = JOB_FAILED
+                job.error = str(e)
+                job.finished_at = time.time()
+        else:
+            with job._lock:
+                job.progress = {"stage": JOB_SUCCEEDED, "message": "Finished.", "completed": None, "total": None}
+                job.status = JOB_SUCCEEDED
+                job.result = result
+                job.finished_at = time.time()
+        job._save()
+
+    def get(self, job_id):
+        """
+        Returns the job with this id, or None if it is unknown or was forgotten.
+        """
+        state = self.store.read().get('jobs', {}).get(job_id)
+        return Job.from_dict(state) if state is not None else None
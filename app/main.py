@@ -1,66 +1,613 @@
-from flask import Flask, jsonify, render_template, request
-import csv
+from flask import Flask, Response, g, jsonify, render_template, request, url_for
+import hashlib
+import json
 import os
+import time
 from .rss_fetcher import fetch_parse_and_geocode # Relative import for rss_fetcher
+from .incident_store import ChangeNotifier, IncidentStore
+from .jobs import JobManager
+from .incident_columns import get_incident_columns
+from .spatial_index import get_grid_index, parse_bbox
+from .clustering import MAX_CLUSTER_ZOOM, build_cluster_level, get_cluster_hierarchy, query_cluster_level
+from .time_index import get_time_index, intersect_positions, parse_time_range
+from .search_index import get_search_index
+from .density import DENSITY_CELL_PX, MAX_DENSITY_ZOOM, cell_center, get_density_grids
+from .map_formats import MAP_FORMATS, choose_encoding, encode_map_format, find_incident_position, get_precompressed_body
+from .incident_stream import MAX_PAGE_SIZE, decode_cursor, encode_cursor, parse_fields, select_page, stream_incidents_json
+# Importing rss_fetcher put the project root on sys.path, so root modules are importable here.
+from incident_repository import CSV_FIELDNAMES, open_incident_repository, resolve_data_path
+from metrics import CONTENT_TYPE, DATASET_ROWS, HTTP_REQUEST_SECONDS, render_metrics
+from structured_logging import configure_logging
+
+# Before the app is created, so Flask's logger uses the same handler as everything else.
+configure_logging()
 
 app = Flask(__name__)
 
-# Path to the main CSV data file, relative to the project root
+# Path to the main data file, relative to the project root.
+# Set INCIDENT_DATA_PATH to e.g. data/incidents.sqlite3 (see migrate_csv_to_sqlite.py) to serve from SQLite.
 # This will be used by fetch_parse_and_geocode, which expects a path relative to project root.
-CSV_FILE_PATH_RELATIVE_TO_ROOT = 'data/incidents.csv'
+CSV_FILE_PATH_RELATIVE_TO_ROOT = os.environ.get('INCIDENT_DATA_PATH', 'data/incidents.csv')
+
+# Absolute path of the same file, used in error messages from get_incidents.
+CSV_FILE_PATH_FOR_GET_INCIDENTS = resolve_data_path(CSV_FILE_PATH_RELATIVE_TO_ROOT)
+
+# Process-level view of the shared snapshot (see shared_snapshot.py); remapped only when the data changes.
+incident_store = IncidentStore(open_incident_repository(CSV_FILE_PATH_FOR_GET_INCIDENTS))
+
+# Signalled by the fetch job after each batch of new incidents is stored, to wake the SSE streams.
+data_changed = ChangeNotifier()
+# An SSE stream checks for changes made by other processes (e.g. geocode_incidents.py)
+# and sends a keep-alive comment at least this often.
+SSE_POLL_SECONDS = 15
+# An SSE stream ends after this long, so an open map tab does not hold a server
+# thread (or a sync worker) forever; EventSource reconnects after SSE_RETRY_MILLISECONDS.
+SSE_MAX_STREAM_SECONDS = 5 * 60
+SSE_RETRY_MILLISECONDS = 3000
+
+# Background workers for long-running tasks such as fetching new incidents. Job
+# records are kept in <data file>.jobs.json, shared by every worker process.
+job_manager = JobManager(CSV_FILE_PATH_FOR_GET_INCIDENTS + '.jobs.json', max_workers=2, logger=app.logger)
+FETCH_JOB_KIND = 'fetch-new-incidents'
+
+# Results per /api/incidents/search page when no limit is given.
+DEFAULT_SEARCH_PAGE_SIZE = 20
+
+# Bodies served straight from the snapshot mapping are written in chunks of this size.
+MAPPED_BODY_CHUNK_BYTES = 64 * 1024
+
+
+def _count_geocoded(snapshot):
+    return sum(1 for _ in get_incident_columns(snapshot).geocoded_positions())
+
+
+# Dataset size is read from the current snapshot whenever /metrics is scraped.
+DATASET_ROWS.labels(kind='total').set_function(lambda: len(incident_store.get_snapshot().incidents))
+DATASET_ROWS.labels(kind='geocoded').set_function(
+    lambda: incident_store.get_snapshot().get_derived('geocoded_count', _count_geocoded))
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        # Label by route pattern (e.g. /api/jobs/<job_id>), not by concrete path, to bound the label set.
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.labels(method=request.method, route=route, status=response.status_code).observe(
+            time.perf_counter() - started_at)
+    return response
+
 
+def _load_snapshot():
+    """
+    Returns (snapshot, None) on success or (None, error_response) if the CSV cannot be loaded.
+    """
+    try:
+        return incident_store.get_snapshot(), None
+    except FileNotFoundError:
+        return None, (jsonify({"error": f"The data file was not found at {CSV_FILE_PATH_FOR_GET_INCIDENTS}"}), 404)
+    except Exception as e:
+        return None, (jsonify({"error": f"An error occurred while processing the data file: {str(e)}"}), 500)
+
+
+def _parse_bbox_arg():
+    """
+    Returns (bbox, None) where bbox is None if the 'bbox' argument is absent,
+    or (None, error_response) if it is malformed.
+    """
+    bbox_param = request.args.get('bbox')
+    if not bbox_param:
+        return None, None
+    try:
+        return parse_bbox(bbox_param), None
+    except ValueError as e:
+        return None, (jsonify({"error": f"Invalid bbox parameter: {str(e)}"}), 400)
 
-# Path to the CSV file for direct reading in get_incidents, relative to this main.py script
-# main.py is in app/, data/ is in ../data/
-CSV_FILE_PATH_FOR_GET_INCIDENTS = os.path.join(os.path.dirname(__file__), '..', 'data', 'incidents.csv')
+
+def _parse_time_range_args():
+    """
+    Returns ((since, until), None) for the 'since'/'until' arguments, (None, None)
+    if both are absent, or (None, error_response) if they are malformed.
+    """
+    try:
+        return parse_time_range(request.args.get('since'), request.args.get('until')), None
+    except ValueError as e:
+        return None, (jsonify({"error": f"Invalid date range: {str(e)}"}), 400)
+
+
+def _filtered_positions(snapshot, bbox, time_range):
+    """
+    Returns the sorted row positions matching an optional bbox and date range,
+    using the grid index and the time index of the snapshot.
+    """
+    positions = None
+    if time_range is not None:
+        positions = get_time_index(snapshot).query(*time_range)
+    if bbox is not None:
+        bbox_positions = get_grid_index(snapshot).query(*bbox)
+        positions = bbox_positions if positions is None else intersect_positions(positions, bbox_positions)
+    if positions is None:
+        positions = range(len(snapshot.incidents))
+    return positions
+
+
+def _delta_payload(snapshot, since_version, bbox=None, time_range=None, fields=None):
+    """
+    Builds the body of a delta: {"version", "reset", "incidents", "refs"} with the
+    rows appended or changed after since_version, and refs[i] the incident_ref of
+    incidents[i] (the key the compact map formats use). "reset" is true, with no
+    incidents, if the delta cannot be computed and the client should reload everything.
+    """
+    positions = snapshot.changes_since(since_version)
+    if positions is None:
+        return {"version": snapshot.version, "reset": True, "incidents": [], "refs": []}
+    if bbox is not None or time_range is not None:
+        positions = intersect_positions(positions, list(_filtered_positions(snapshot, bbox, time_range)))
+    incidents = [snapshot.incidents[position] for position in positions]
+    if fields is not None:
+        incidents = [{field: incident.get(field, '') for field in fields} for incident in incidents]
+    refs = get_incident_columns(snapshot).refs
+    return {"version": snapshot.version, "reset": False, "incidents": incidents,
+            "refs": [refs[position] for position in positions]}
+
+
+def _iter_mapped_body(body):
+    for start in range(0, len(body), MAPPED_BODY_CHUNK_BYTES):
+        yield bytes(body[start:start + MAPPED_BODY_CHUNK_BYTES])
+
+
+def _conditional_json_response(body, snapshot, etag=None, content_encoding=None):
+    """
+    Wraps JSON (pre-encoded bytes, or a generator of chunks or a memoryview of
+    the snapshot mapping together with an explicit etag) in a response carrying
+    a strong ETag and the snapshot's Last-Modified, answering 304 if the
+    client's copy is current. Pass content_encoding when body is already compressed.
+    """
+    content_length = None
+    if isinstance(body, memoryview):
+        # Copy the mapping to the socket a chunk at a time rather than into one bytes object.
+        content_length = len(body)
+        body = _iter_mapped_body(body)
+    response = Response(body, mimetype='application/json')
+    if content_length is not None:
+        response.content_length = content_length
+    if content_encoding:
+        response.content_encoding = content_encoding
+    response.set_etag(etag or hashlib.sha1(body).hexdigest())
+    response.last_modified = snapshot.last_modified
+    response.headers['X-Dataset-Version'] = str(snapshot.version)
+    # Let clients cache the body but always revalidate it with us.
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/api/incidents')
 def get_incidents():
     """
     API endpoint to serve incident data from a CSV file.
+    Responses carry a strong ETag and Last-Modified so repeat polls get a 304.
+
+    Query parameters:
+        bbox (optional): "minLon,minLat,maxLon,maxLat"; only incidents inside the box are returned.
+        since, until (optional): "YYYY-MM-DD"; only incidents posted on or after
+            since and on or before until are returned. Combinable with every other parameter.
+        fields (optional): Comma-separated columns to include, e.g. "id,latitude,longitude".
+        limit (optional): Page size (at most MAX_PAGE_SIZE). Turns the response into
+            {"incidents": [...], "refs": [...], "next_cursor": ...}.
+        cursor (optional): The next_cursor of the previous page.
+        since_version (optional): A dataset version (the X-Dataset-Version header of
+            an earlier response). Returns only what changed since then, as
+            {"version", "reset", "incidents": [...], "refs": [...]}; "reset" is true if that version is
+            too old and everything must be reloaded. Combinable with bbox/since/until/fields.
+        format (optional): "json" (default), or one of the compact map formats
+            "columnar" ({"ids", "lats", "lons"}) and "geojson". The compact formats
+            only carry ids and coordinates and cannot be combined with fields/limit/cursor.
+
+    Filtered, projected and paginated responses are encoded row by row while
+    they are streamed, instead of being built in memory first. Full-dataset
+    responses are precompressed (brotli/gzip) once per dataset version.
     """
-    incidents = []
+    bbox, error_response = _parse_bbox_arg()
+    if error_response:
+        return error_response
+    time_range, error_response = _parse_time_range_args()
+    if error_response:
+        return error_response
+
+    map_format = request.args.get('format', 'json')
+    if map_format not in MAP_FORMATS:
+        return jsonify({"error": f"Invalid format parameter: expected one of {', '.join(MAP_FORMATS)}"}), 400
+
     try:
-        with open(CSV_FILE_PATH_FOR_GET_INCIDENTS, mode='r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                incidents.append(row)
-        return jsonify(incidents)
-    except FileNotFoundError:
-        return jsonify({"error": f"The data file was not found at {CSV_FILE_PATH_FOR_GET_INCIDENTS}"}), 404
-    except Exception as e:
-        return jsonify({"error": f"An error occurred while processing the data file: {str(e)}"}), 500
+        fields = parse_fields(request.args.get('fields'), CSV_FIELDNAMES)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid fields parameter: {str(e)}"}), 400
+
+    limit = None
+    cursor_position = None
+    try:
+        if request.args.get('limit'):
+            limit = int(request.args['limit'])
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        if request.args.get('cursor'):
+            cursor_position = decode_cursor(request.args['cursor'])
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameter: {str(e)}"}), 400
+    paginated = limit is not None or cursor_position is not None
+    if map_format != 'json' and (fields is not None or paginated):
+        return jsonify({"error": "The columnar and geojson formats cannot be combined with fields, limit or cursor."}), 400
+
+    since_version = None
+    if request.args.get('since_version'):
+        try:
+            since_version = int(request.args['since_version'])
+        except ValueError:
+            return jsonify({"error": "Invalid since_version parameter: expected an integer dataset version."}), 400
+        if map_format != 'json' or paginated:
+            return jsonify({"error": "since_version cannot be combined with format, limit or cursor."}), 400
+
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    if since_version is not None:
+        body = json.dumps(_delta_payload(snapshot, since_version, bbox, time_range, fields),
+                          separators=(',', ':')).encode('utf-8')
+        return _conditional_json_response(body, snapshot)
+
+    if bbox is None and time_range is None and fields is None and not paginated:
+        # Whole dataset: serve the body precompressed for this dataset version.
+        encoding = choose_encoding(request.accept_encodings)
+        body = get_precompressed_body(snapshot, map_format, encoding)
+        etag = snapshot.etag if map_format == 'json' else hashlib.sha1(f"{snapshot.etag}:{map_format}".encode('utf-8')).hexdigest()
+        if encoding:
+            etag = f"{etag}-{encoding}"
+        response = _conditional_json_response(body, snapshot, etag=etag, content_encoding=encoding)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    positions = _filtered_positions(snapshot, bbox, time_range)
+    if map_format != 'json':
+        body = encode_map_format(snapshot, map_format, positions)
+        return _conditional_json_response(body, snapshot)
+
+    page_positions, next_cursor = select_page(positions, cursor_position, limit)
+
+    refs = get_incident_columns(snapshot).refs if paginated else None
+    body = stream_incidents_json(snapshot.incidents, page_positions, fields=fields,
+                                 envelope=paginated, next_cursor=next_cursor, refs=refs)
+    # The body is fully determined by the dataset version and the query, so the
+    # ETag can be computed without encoding it first.
+    etag = hashlib.sha1(f"{snapshot.etag}?{request.query_string.decode('utf-8')}".encode('utf-8')).hexdigest()
+    return _conditional_json_response(body, snapshot, etag=etag)
+
+@app.route('/api/incidents/search')
+def search_incidents():
+    """
+    API endpoint for full-text search over incident titles, addresses and summaries.
+
+    Query parameters:
+        q (required): Search terms, e.g. "bike theft". Every term must match; a
+            term also matches words it is the beginning of ("assa" finds "assault").
+        limit (optional): Page size, default DEFAULT_SEARCH_PAGE_SIZE, at most MAX_PAGE_SIZE.
+        cursor (optional): The next_cursor of the previous page.
+        bbox, since, until (optional): Restrict the results as for /api/incidents.
+
+    Returns {"query", "total", "results": [{"score", "incident"}], "next_cursor"},
+    best match first. Search uses an inverted index built once per dataset version
+    and extended with just the appended rows when new incidents are added.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "The q parameter is required."}), 400
+
+    bbox, error_response = _parse_bbox_arg()
+    if error_response:
+        return error_response
+    time_range, error_response = _parse_time_range_args()
+    if error_response:
+        return error_response
+
+    try:
+        limit = int(request.args.get('limit') or DEFAULT_SEARCH_PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        # Search cursors hold an offset into the ranked results rather than a row position.
+        offset = decode_cursor(request.args['cursor']) if request.args.get('cursor') else 0
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameter: {str(e)}"}), 400
+
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    ranked = get_search_index(snapshot).search(query)
+    if bbox is not None or time_range is not None:
+        allowed = set(_filtered_positions(snapshot, bbox, time_range))
+        ranked = [(position, score) for position, score in ranked if position in allowed]
+
+    page = ranked[offset:offset + limit]
+    body = json.dumps({
+        "query": query,
+        "total": len(ranked),
+        "results": [{"score": round(score, 4), "incident": snapshot.incidents[position]} for position, score in page],
+        "next_cursor": encode_cursor(offset + limit) if offset + limit < len(ranked) else None,
+    }, separators=(',', ':')).encode('utf-8')
+    return _conditional_json_response(body, snapshot)
+
+@app.route('/api/incidents/density')
+def get_incident_density():
+    """
+    API endpoint serving incident counts per grid cell, for drawing a heatmap.
+
+    Query parameters:
+        z (required): Leaflet zoom level; cells are DENSITY_CELL_PX screen pixels wide.
+        bbox (optional): "minLon,minLat,maxLon,maxLat"; defaults to the whole world.
+        since, until (optional): "YYYY-MM-DD"; count only the incidents posted in this range.
+
+    Returns {"zoom", "cell_size_px", "max_count", "lats", "lons", "counts"}, with
+    the center of each non-empty cell. The counts come from grids pre-aggregated
+    for every zoom level once per dataset version.
+    """
+    try:
+        zoom = int(request.args.get('z', ''))
+    except ValueError:
+        return jsonify({"error": "The z parameter is required and must be an integer zoom level."}), 400
+    zoom = max(0, min(MAX_DENSITY_ZOOM, zoom))
+
+    bbox, error_response = _parse_bbox_arg()
+    if error_response:
+        return error_response
+    if bbox is None:
+        bbox = (-180.0, -90.0, 180.0, 90.0)
+    time_range, error_response = _parse_time_range_args()
+    if error_response:
+        return error_response
+    since, until = time_range if time_range is not None else (None, None)
+
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    lats, lons, counts = [], [], []
+    for cx, cy, count in get_density_grids(snapshot).query(zoom, *bbox, since=since, until=until):
+        lat, lon = cell_center(cx, cy, zoom)
+        lats.append(round(lat, 6))
+        lons.append(round(lon, 6))
+        counts.append(count)
+
+    body = json.dumps({
+        "zoom": zoom,
+        "cell_size_px": DENSITY_CELL_PX,
+        "max_count": max(counts, default=0),
+        "lats": lats,
+        "lons": lons,
+        "counts": counts,
+    }, separators=(',', ':')).encode('utf-8')
+    return _conditional_json_response(body, snapshot)
+
+@app.route('/api/incidents/stream')
+def stream_incident_changes():
+    """
+    Server-Sent Events stream of changes to the dataset.
+
+    Query parameters:
+        since_version (optional): Dataset version the client already has. The
+            Last-Event-ID header sent by a reconnecting EventSource takes precedence.
+
+    Every change is sent as an "incidents" event whose id is the new dataset
+    version and whose data is a delta as returned by /api/incidents?since_version=.
+    Without a version, the stream starts with a "version" event carrying the
+    current one. New incidents are pushed as soon as each batch of a fetch is
+    stored; changes by other processes are picked up within SSE_POLL_SECONDS.
+
+    The stream ends after SSE_MAX_STREAM_SECONDS. The browser's EventSource then
+    reconnects by itself and sends the last event id as Last-Event-ID, so no
+    change is missed.
+    """
+    since_param = request.headers.get('Last-Event-ID') or request.args.get('since_version')
+    try:
+        since_version = int(since_param) if since_param else None
+    except ValueError:
+        return jsonify({"error": "Invalid since_version parameter: expected an integer dataset version."}), 400
+
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    def events(snapshot, last_version):
+        deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+        generation = data_changed.generation
+        if last_version is None:
+            last_version = snapshot.version
+            yield (f"retry: {SSE_RETRY_MILLISECONDS}\nevent: version\nid: {last_version}\n"
+                   f"data: {json.dumps({'version': last_version})}\n\n")
+        else:
+            # No data, so no event is dispatched, but the id becomes the Last-Event-ID
+            # of the reconnect even if nothing changes before the stream ends.
+            yield f"retry: {SSE_RETRY_MILLISECONDS}\nid: {last_version}\n\n"
+        # A client that has gone away is noticed when the next write (at the latest
+        # the keep-alive) fails: the server then closes this generator at its yield.
+        while True:
+            if snapshot.version != last_version:
+                delta = json.dumps(_delta_payload(snapshot, last_version), separators=(',', ':'))
+                yield f"event: incidents\nid: {snapshot.version}\ndata: {delta}\n\n"
+                last_version = snapshot.version
+            else:
+                yield ": keep-alive\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            generation = data_changed.wait(generation, min(SSE_POLL_SECONDS, remaining))
+            try:
+                snapshot = incident_store.get_snapshot()
+            except Exception as e:
+                app.logger.warning(f"Incident stream could not reload the data: {str(e)}")
+
+    response = Response(events(snapshot, since_version), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Stop reverse proxies such as nginx from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/incidents/<incident_ref>')
+def get_incident(incident_ref):
+    """
+    API endpoint serving a single incident, used by map.js to fill in popups
+    lazily for markers loaded from the compact map formats.
+
+    Args:
+        incident_ref (str): The incident's id, or "row-<n>" for rows without one
+            (as emitted in the "ids" of the compact formats).
+    """
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    position = find_incident_position(snapshot, incident_ref)
+    if position is None:
+        return jsonify({"error": f"No incident with id {incident_ref}"}), 404
+
+    body = json.dumps(snapshot.incidents[position], separators=(',', ':')).encode('utf-8')
+    return _conditional_json_response(body, snapshot)
+
+@app.route('/api/incidents/clusters')
+def get_incident_clusters():
+    """
+    API endpoint serving precomputed marker clusters for one zoom level.
+
+    Query parameters:
+        z (required): Leaflet zoom level.
+        bbox (optional): "minLon,minLat,maxLon,maxLat"; defaults to the whole world.
+        since, until (optional): "YYYY-MM-DD"; cluster only the incidents posted in this range.
+
+    Clusters holding a single incident include the full incident row and its
+    incident_ref, so it can be drawn as a normal marker with a popup.
+    """
+    try:
+        zoom = int(request.args.get('z', ''))
+    except ValueError:
+        return jsonify({"error": "The z parameter is required and must be an integer zoom level."}), 400
+
+    bbox, error_response = _parse_bbox_arg()
+    if error_response:
+        return error_response
+    time_range, error_response = _parse_time_range_args()
+    if error_response:
+        return error_response
+
+    snapshot, error_response = _load_snapshot()
+    if error_response:
+        return error_response
+
+    if time_range is None:
+        if bbox is None:
+            bbox = (-180.0, -90.0, 180.0, 90.0)
+        cluster_rows = get_cluster_hierarchy(snapshot).query(zoom, *bbox)
+    else:
+        # The precomputed hierarchy covers every incident; for a date range, cluster
+        # the matching incidents in the viewport at the requested zoom level only.
+        zoom = max(0, min(MAX_CLUSTER_ZOOM, zoom))
+        level = build_cluster_level(get_incident_columns(snapshot), _filtered_positions(snapshot, bbox, time_range), zoom)
+        if bbox is None:
+            bbox = (-180.0, -90.0, 180.0, 90.0)
+        cluster_rows = query_cluster_level(level, zoom, *bbox)
+
+    clusters = []
+    refs = get_incident_columns(snapshot).refs
+    for count, lat, lon, first_position in cluster_rows:
+        cluster = {"lat": lat, "lon": lon, "count": count}
+        if count == 1:
+            cluster["incident"] = snapshot.incidents[first_position]
+            cluster["ref"] = refs[first_position]
+        clusters.append(cluster)
+
+    body = json.dumps({
+        "zoom": zoom,
+        "max_cluster_zoom": MAX_CLUSTER_ZOOM,
+        "clusters": clusters,
+    }, separators=(',', ':')).encode('utf-8')
+    return _conditional_json_response(body, snapshot)
+
+def _run_fetch_new_incidents(report_progress):
+    """
+    Background job body for /api/fetch-new-incidents. Returns the summary that
+    used to be the endpoint's synchronous response.
+    """
+    # fetch_parse_and_geocode expects the path relative to the project root.
+    # CSV_FILE_PATH_RELATIVE_TO_ROOT is already defined as 'data/incidents.csv'
+    result = fetch_parse_and_geocode(csv_filepath_relative_to_root=CSV_FILE_PATH_RELATIVE_TO_ROOT,
+                                     progress_callback=report_progress, on_data_changed=data_changed.notify)
+
+    appended_count = result.get("appended", 0)
+    geocoded_updated_count = result.get("geocoded_updated", 0)
+
+    message = f"Processing complete. Appended: {appended_count} new incidents. Geocoded/Updated: {geocoded_updated_count} incidents."
+
+    return {
+        "status": "success",
+        "message": message,
+        "new_incidents_appended": appended_count,
+        "incidents_geocoded_or_updated": geocoded_updated_count,
+        "details": result # contains appended, geocoded_processed, geocoded_updated
+    }
 
 @app.route('/api/fetch-new-incidents', methods=['POST'])
 def handle_fetch_new_incidents():
     """
     API endpoint to trigger fetching new incidents from RSS,
     appending them to the CSV, and geocoding them.
+
+    The work runs in the background: the response is 202 with a job id, and
+    /api/jobs/<id> reports progress and, once finished, the result. Requests
+    arriving while a fetch is already queued or running join that job.
     """
     try:
-        # fetch_parse_and_geocode expects the path relative to the project root.
-        # CSV_FILE_PATH_RELATIVE_TO_ROOT is already defined as 'data/incidents.csv'
-        result = fetch_parse_and_geocode(csv_filepath_relative_to_root=CSV_FILE_PATH_RELATIVE_TO_ROOT)
-        
-        appended_count = result.get("appended", 0)
-        geocoded_updated_count = result.get("geocoded_updated", 0)
-        
-        message = f"Processing complete. Appended: {appended_count} new incidents. Geocoded/Updated: {geocoded_updated_count} incidents."
-        
-        return jsonify({
-            "status": "success",
-            "message": message,
-            "new_incidents_appended": appended_count,
-            "incidents_geocoded_or_updated": geocoded_updated_count,
-            "details": result # contains appended, geocoded_processed, geocoded_updated
-        }), 200
-        
+        job, created = job_manager.submit(FETCH_JOB_KIND, _run_fetch_new_incidents)
     except Exception as e:
-        # This will catch unexpected errors in fetch_parse_and_geocode or path issues
+        # This will catch failures to queue the job (e.g. the worker pool was shut down)
         app.logger.error(f"Error in /api/fetch-new-incidents: {str(e)}")
         return jsonify({"status": "error", "message": f"An unexpected error occurred: {str(e)}"}), 500
 
+    status_url = url_for('get_job', job_id=job.id)
+    response = jsonify({
+        "status": "accepted",
+        "message": "Fetch started." if created else "A fetch is already in progress; following it.",
+        "job_id": job.id,
+        "status_url": status_url,
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """
+    API endpoint reporting the status, progress and result of a background job.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No job with id {job_id}"}), 404
+    response = jsonify(job.to_dict())
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint: request and pipeline stage latencies, geocoder
+    and cache counters, rows scanned/written and dataset size for this process.
+    """
+    response = Response(render_metrics(), content_type=CONTENT_TYPE)
+    response.cache_control.no_store = True
+    return response
+
 @app.route('/')
 def index():
     """
@@ -0,0 +1,113 @@
+import gzip
+import json
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+from .incident_columns import get_incident_columns
+
+# Values accepted by /api/incidents?format=
+MAP_FORMATS = ('json', 'columnar', 'geojson')
+
+# Content codings we can precompress into, in order of preference.
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _build_ref_index(snapshot):
+    refs = {}
+    for position, ref in enumerate(get_incident_columns(snapshot).refs):
+        # The first row wins if an id is duplicated.
+        refs.setdefault(ref, position)
+        refs.setdefault(f"row-{position}", position)
+    return refs
+
+
+def find_incident_position(snapshot, ref):
+    """
+    Returns the row position for an incident ref, or None if it is unknown.
+    """
+    return snapshot.get_derived('ref_index', _build_ref_index).get(ref)
+
+
+def _geocoded(columns, positions):
+    for position in columns.geocoded_positions(positions):
+        yield columns.refs[position], round(columns.lats[position], 6), round(columns.lons[position], 6)
+
+
+def encode_columnar(columns, positions, version):
+    """
+    Encodes the geocoded incidents among positions as parallel arrays:
+    {"version": v, "ids": [...], "lats": [...], "lons": [...]}.
+    Only what a marker needs is sent; popups fetch /api/incidents/<id> on demand.
+    """
+    ids, lats, lons = [], [], []
+    for ref, lat, lon in _geocoded(columns, positions):
+        ids.append(ref)
+        lats.append(lat)
+        lons.append(lon)
+    return json.dumps({"version": version, "ids": ids, "lats": lats, "lons": lons},
+                      separators=(',', ':')).encode('utf-8')
+
+
+def encode_geojson(columns, positions, version):
+    """
+    Encodes the geocoded incidents among positions as a GeoJSON FeatureCollection
+    of Points whose only property is the incident id.
+    """
+    features = [
+        {"type": "Feature", "id": ref,
+         "geometry": {"type": "Point", "coordinates": [lon, lat]},
+         "properties": {"id": ref}}
+        for ref, lat, lon in _geocoded(columns, positions)
+    ]
+    return json.dumps({"type": "FeatureCollection", "version": version, "features": features},
+                      separators=(',', ':')).encode('utf-8')
+
+
+def encode_map_format(snapshot, map_format, positions=None):
+    """
+    Encodes incidents (all of them, or only those at positions) in one of MAP_FORMATS.
+    """
+    if positions is None:
+        if map_format == 'json':
+            return snapshot.json_bytes
+        positions = range(len(snapshot.incidents))
+    if map_format == 'columnar':
+        return encode_columnar(get_incident_columns(snapshot), positions, snapshot.version)
+    if map_format == 'geojson':
+        return encode_geojson(get_incident_columns(snapshot), positions, snapshot.version)
+    return json.dumps([snapshot.incidents[p] for p in positions], separators=(',', ':')).encode('utf-8')
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        # brotli wants bytes, not the memoryview of the snapshot mapping.
+        return brotli.compress(bytes(body))
+    if encoding == 'gzip':
+        # mtime=0 keeps the output (and therefore the ETag) identical across workers.
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+
+def choose_encoding(accept_encodings):
+    """
+    Picks the preferred supported content coding from a werkzeug Accept-Encoding
+    header, or None for identity.
+    """
+    for encoding in SUPPORTED_ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def get_precompressed_body(snapshot, map_format, encoding):
+    """
+    Returns the full-dataset body in map_format, compressed with encoding (or
+    uncompressed for None). Computed once per dataset version.
+    """
+    body = snapshot.get_derived(('map_body', map_format), lambda snap: encode_map_format(snap, map_format))
+    if encoding is None:
+        return body
+    return snapshot.get_derived(('map_body', map_format, encoding), lambda snap: compress(body, encoding))
@@ -1,349 +1,504 @@
 import csv
+import io
 import os
 import re
 import xml.etree.ElementTree as ET
+from datetime import datetime
 
-# Relative import for geocode_csv_data from the geocode_incidents.py script (in parent directory)
+# Relative import for geocode_rows and the incident repository from the project root
 # This assumes geocode_incidents.py is in the project root and rss_fetcher.py is in app/
 import sys
 # Add the parent directory (project root) to the Python path
 # to allow the relative import from ..geocode_incidents
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from geocode_incidents import geocode_csv_data
+from geocode_incidents import geocode_rows
+from incident_repository import CSV_FIELDNAMES, normalize_post_date, open_incident_repository, resolve_data_path
+from metrics import ROWS_SCANNED, time_stage
+from structured_logging import configure_logging, get_logger
 
 
-# The view_text_website tool is imported implicitly by the execution environment
-# from your_tool_module import view_text_website # Hypothetical direct import
+from .feed_fetcher import FEED_NOT_MODIFIED, FEED_OK, FeedFetcher
+
+logger = get_logger(__name__)
 
 # Define the RSS feed URL
 RSS_FEED_URL = "https://emergency.uw.edu/feed/"
+# Feeds polled by fetch_and_parse_rss: a comma-separated list in RSS_FEED_URLS, or just RSS_FEED_URL.
+RSS_FEED_URLS = [url.strip() for url in os.environ.get('RSS_FEED_URLS', RSS_FEED_URL).split(',') if url.strip()]
+# Per-feed ETag/Last-Modified validators and backoff state, relative to the project root.
+FEED_STATE_PATH = os.environ.get('RSS_FEED_STATE_PATH', 'data/feed_state.json')
+# New incidents are geocoded and appended this many at a time, so each batch is
+# stored (and pushed to listening maps) without waiting for the whole fetch.
+APPEND_BATCH_SIZE = 10
+
+# One fetcher per process, so its pooled keep-alive connections, stored
+# validators and robots.txt decisions are reused from one fetch to the next.
+_default_feed_fetcher = None
+
+
+def _get_default_feed_fetcher():
+    global _default_feed_fetcher
+    if _default_feed_fetcher is None:
+        _default_feed_fetcher = FeedFetcher(RSS_FEED_URLS, resolve_data_path(FEED_STATE_PATH))
+    return _default_feed_fetcher
+
+
+# Extraction patterns, compiled once rather than per item.
+# The address regex is a very basic heuristic and may not capture all addresses accurately.
+# It looks for patterns like "Number Street Name/Type" or "Number block of Street Name/Type"
+ADDRESS_RE = re.compile(
+    r"(\d{2,4}\s*(?:block of)?\s+[\w\s.-]+\s+(?:Ave|St|Rd|Way|Blvd|Pl|Ct|Dr|Ln|Pkwy|Cir|Sq|Ter|Trl|NE|NW|SE|SW|N|S|E|W)\b\.?)",
+    re.IGNORECASE)
+REPORTED_TO_UWPD_RE = re.compile(r"Reported to UWPD:?", re.IGNORECASE)
+# e.g. "Occurred Monday 7/1/24 at 11:30 AM." -- the time is captured for incident_time_approx.
+OCCURRED_RE = re.compile(r"Occurred\s+\w+\s+\d+/\d+/\d{2,4}\s+at\s+(\d{1,2}:\d{2})\s+([APM]{2})\.", re.IGNORECASE)
+
+
+def fetch_and_parse_rss(feed_fetcher=None, is_known_source_url=None):
+    """
+    Fetches the configured RSS feeds and parses them into a list of incident dictionaries.
 
-# Define the expected CSV header
-CSV_FIELDNAMES = [
-    "id", "title", "post_date", "incident_time_approx", "address_string",
-    "latitude", "longitude", "summary_text", "source_url"
-]
+    Feeds are polled concurrently and conditionally: a feed that has not changed
+    since the last fetch answers 304 and contributes nothing. robots.txt is
+    respected, so a feed whose site disallows automated access (as UW's emergency
+    feed currently does) is skipped rather than fetched.
 
-def fetch_and_parse_rss():
-    """
-    Fetches RSS feed content (hypothetically) and parses it into a list of incident dictionaries.
-    In a real-world scenario, direct fetching might be blocked by robots.txt.
+    The fetched feeds' validators are committed as soon as they are parsed.
+    Callers that store the incidents should use fetch_rss_feeds instead and
+    commit them once the incidents are stored.
+
+    Args:
+        feed_fetcher (FeedFetcher, optional): Defaults to a process-wide fetcher
+            for RSS_FEED_URLS.
+        is_known_source_url (callable, optional): Returns True for a link that is
+            already stored; parsing of a feed stops at its first known item.
     """
-    rss_content = None
+    feed_fetcher = feed_fetcher or _get_default_feed_fetcher()
     incidents = []
+    for feed in fetch_rss_feeds(feed_fetcher, is_known_source_url):
+        incidents.extend(feed.incidents)
+        if feed.complete:
+            feed_fetcher.commit_validators(feed.result)
+    return incidents
+
+
+class ParsedFeed:
+    def __init__(self, result, incidents, complete):
+        self.result = result
+        self.incidents = incidents
+        # False if the feed's XML was malformed part way through; its validators
+        # must not be committed, so the next fetch reads the whole feed again.
+        self.complete = complete
+
+
+def fetch_rss_feeds(feed_fetcher=None, is_known_source_url=None):
+    """
+    Like fetch_and_parse_rss, but leaves the validators of the fetched feeds
+    uncommitted, so a failure to store their incidents makes the next fetch
+    download them again instead of getting a 304.
+
+    Returns:
+        list: One ParsedFeed per FEED_OK feed. Pass feed.result to
+        feed_fetcher.commit_validators once feed.incidents are stored, and only
+        if feed.complete.
+    """
+    parsed_feeds = []
+    feed_fetcher = feed_fetcher or _get_default_feed_fetcher()
+
+    logger.info("Fetching RSS feeds", feeds=len(feed_fetcher.feed_urls))
+    with time_stage('fetch', 'fetch'):
+        results = feed_fetcher.fetch_all()
+    for result in results:
+        if result.status == FEED_NOT_MODIFIED:
+            logger.info("Feed not modified since the last fetch", feed_url=result.feed_url)
+        elif result.status != FEED_OK:
+            logger.warning("Could not fetch RSS feed", feed_url=result.feed_url, status=result.status,
+                           detail=result.detail)
+        else:
+            with time_stage('fetch', 'parse'):
+                incidents, complete = parse_rss_feed(result.body, is_known_source_url)
+            parsed_feeds.append(ParsedFeed(result, incidents, complete))
+    return parsed_feeds
+
 
-    # --- Hypothetical Web Fetching ---
-    # The following call to view_text_website is for demonstration purposes.
-    # Many websites, including UW's emergency feed, may disallow direct scraping
-    # via their robots.txt file. This call will likely fail or return an error
-    # in an environment that respects robots.txt.
-    print(f"Attempting to fetch RSS feed from: {RSS_FEED_URL}")
+def parse_rss_items(rss_content, is_known_source_url=None):
+    """
+    Parses the content of one RSS feed into a list of incident dictionaries.
+
+    Args:
+        rss_content (bytes or str): The feed XML.
+        is_known_source_url (callable, optional): See iter_rss_items.
+
+    Returns:
+        list: Parsed incidents. If the XML is malformed part way through, the
+            items before the error are kept.
+    """
+    return parse_rss_feed(rss_content, is_known_source_url)[0]
+
+
+def parse_rss_feed(rss_content, is_known_source_url=None):
+    """
+    Like parse_rss_items, but also reports whether the whole feed was read.
+
+    Returns:
+        tuple: (incidents, complete), where complete is False if the XML is
+            malformed part way through (incidents then holds the items before the error).
+    """
+    if isinstance(rss_content, str):
+        rss_content = rss_content.encode('utf-8')
+    incidents = []
     try:
-        # This tool is provided by the agent's environment.
-        # In a standard Python script, you'd use a library like 'requests'.
-        # rss_content = view_text_website(url=RSS_FEED_URL)
-        # For now, as view_text_website is not available in this context directly for me to call,
-        # I will simulate a failure.
-        # In a real execution, if view_text_website was available and failed, the except block would catch it.
-        raise Exception("Simulated RobotDisallowedError or other fetching error due to robots.txt")
-    except Exception as e: # Catches RobotDisallowedError, ConnectionError, etc.
-        print(f"Error: Could not fetch RSS feed from {RSS_FEED_URL}.")
-        print(f"This is likely due to restrictions (e.g., robots.txt) or network issues.")
-        print(f"Details: {e}")
-        return []  # Return an empty list as per requirements
-
-    # --- XML Parsing (if fetching was hypothetically successful) ---
-    # This part of the code would run if rss_content was successfully fetched.
-    if rss_content:
-        try:
-            print("Parsing XML content...")
-            root = ET.fromstring(rss_content)
-            
-            for item in root.findall('.//channel/item'):
-                title = item.findtext('title', default='').strip()
-                link = item.findtext('link', default='').strip()
-                pub_date = item.findtext('pubDate', default='').strip()
-                description = item.findtext('description', default='').strip()
-
-                # Address Extraction (Heuristic)
-                # This is a very basic regex and may not capture all addresses accurately.
-                # It looks for patterns like "Number Street Name/Type" or "Number block of Street Name/Type"
-                address_regex = r"(\d{2,4}\s*(?:block of)?\s+[\w\s.-]+\s+(?:Ave|St|Rd|Way|Blvd|Pl|Ct|Dr|Ln|Pkwy|Cir|Sq|Ter|Trl|NE|NW|SE|SW|N|S|E|W)\b\.?)"
-                match = re.search(address_regex, description, re.IGNORECASE)
-                extracted_address = match.group(1).strip() if match else ""
-                
-                # Clean up description if address is found at the beginning (common in UW alerts)
-                # and remove common boilerplate phrases
-                summary_text = description
-                if extracted_address and summary_text.lower().startswith(extracted_address.lower()):
-                    summary_text = summary_text[len(extracted_address):].lstrip(' ,.-')
-                
-                # Remove "Reported to UWPD:" and similar phrases
-                summary_text = re.sub(r"Reported to UWPD:?", "", summary_text, flags=re.IGNORECASE).strip()
-                summary_text = re.sub(r"Occurred\s+\w+\s+\d+/\d+/\d{2,4}\s+at\s+\d{1,2}:\d{2}\s+[APM]{2}\.", "", summary_text, flags=re.IGNORECASE).strip()
-
-
-                incident = {
-                    "id": "",  # ID might be derived later (e.g., from CSV row count or a hash)
-                    "title": title,
-                    "post_date": pub_date, # Needs parsing/standardization for CSV
-                    "incident_time_approx": "", # Requires more sophisticated parsing from description
-                    "address_string": extracted_address,
-                    "latitude": "",
-                    "longitude": "",
-                    "summary_text": summary_text,
-                    "source_url": link
-                }
-                incidents.append(incident)
-            print(f"Successfully parsed {len(incidents)} items from the RSS feed.")
-        except ET.ParseError as e:
-            print(f"Error: Could not parse XML content from RSS feed. Details: {e}")
-            return [] # Return empty list if parsing fails
-        except Exception as e:
-            print(f"An unexpected error occurred during XML parsing: {e}")
-            return []
-    else:
-        # This case would be hit if the simulated error above was removed AND view_text_website returned None or empty
-        print("No RSS content was fetched, so no parsing will be done.")
+        for incident in iter_rss_items(io.BytesIO(rss_content), is_known_source_url):
+            incidents.append(incident)
+        logger.info("Parsed RSS feed", items=len(incidents), feed_bytes=len(rss_content))
+    except ET.ParseError as e:
+        logger.error("Could not parse XML content from RSS feed", items_parsed=len(incidents), error=str(e))
+        return incidents, False
+    except Exception as e:
+        logger.error("Unexpected error during XML parsing", items_parsed=len(incidents), error=str(e))
+        return incidents, False
+    return incidents, True
 
-    return incidents
 
+def iter_rss_items(source, is_known_source_url=None):
+    """
+    Streams incidents out of an RSS document without building the whole tree.
+
+    Each <item> is turned into an incident as soon as its end tag is read and is
+    then discarded, so memory use does not grow with the size of the feed
+    (large archive or backfill feeds included).
+
+    Args:
+        source (str or file object): A filename or a binary file object with the feed XML.
+        is_known_source_url (callable, optional): Called with each item's link.
+            Feeds list the newest items first, so once an item is already stored
+            everything after it is too, and iteration stops there.
+
+    Yields:
+        dict: One incident per new item, in feed order.
 
-def append_incidents_to_csv(new_incidents, csv_filepath):
+    Raises:
+        xml.etree.ElementTree.ParseError: If the XML is malformed.
+    """
+    channel = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'channel':
+                channel = element
+            continue
+        if element.tag != 'item':
+            continue
+
+        incident = _incident_from_item(element)
+        # Drop the processed item (and anything before it) from the partially built tree.
+        if channel is not None:
+            del channel[:]
+        else:
+            element.clear()
+
+        if is_known_source_url is not None and incident['source_url'] and is_known_source_url(incident['source_url']):
+            logger.info("Reached an already stored item; skipping the rest of the feed", source_url=incident['source_url'])
+            return
+        yield incident
+
+
+def _normalize_incident_time(description):
+    """
+    Returns the "Occurred ... at 11:30 AM." time from a description as "11:30 AM",
+    matching incidents.csv, or "" if there is none.
+    """
+    match = OCCURRED_RE.search(description)
+    if not match:
+        return ""
+    try:
+        return datetime.strptime(f"{match.group(1)} {match.group(2).upper()}", "%I:%M %p").strftime("%I:%M %p")
+    except ValueError:
+        return ""
+
+
+def _incident_from_item(item):
+    title = item.findtext('title', default='').strip()
+    link = item.findtext('link', default='').strip()
+    pub_date = item.findtext('pubDate', default='').strip()
+    description = item.findtext('description', default='').strip()
+
+    match = ADDRESS_RE.search(description)
+    extracted_address = match.group(1).strip() if match else ""
+
+    # Clean up description if address is found at the beginning (common in UW alerts)
+    # and remove common boilerplate phrases
+    summary_text = description
+    if extracted_address and summary_text.lower().startswith(extracted_address.lower()):
+        summary_text = summary_text[len(extracted_address):].lstrip(' ,.-')
+
+    # Remove "Reported to UWPD:" and similar phrases
+    summary_text = REPORTED_TO_UWPD_RE.sub("", summary_text).strip()
+    summary_text = OCCURRED_RE.sub("", summary_text).strip()
+
+    return {
+        "id": "",  # ID might be derived later (e.g., from CSV row count or a hash)
+        "title": title,
+        "post_date": normalize_post_date(pub_date),
+        "incident_time_approx": _normalize_incident_time(description),
+        "address_string": extracted_address,
+        "latitude": "",
+        "longitude": "",
+        "summary_text": summary_text,
+        "source_url": link
+    }
+
+
+def append_incidents_to_csv(new_incidents, csv_filepath, prepare_rows=None):
     """
-    Appends new, unique incidents to a CSV file.
+    Appends new, unique incidents to the incident repository at csv_filepath
+    (a CSV file, or an SQLite database if the path ends in .sqlite3/.sqlite/.db).
 
     Args:
         new_incidents (list): A list of incident dictionaries to potentially add.
-        csv_filepath (str): The path to the CSV file.
+        csv_filepath (str): The path to the data file.
+        prepare_rows (callable, optional): Called with the list of unique incidents
+            just before they are written, and may modify them in place
+            (fetch_parse_and_geocode uses this to geocode only the new rows).
     
     Returns:
-        int: The number of new incidents actually appended to the CSV.
+        int: The number of new incidents actually appended.
+
+    Raises:
+        Exception: Whatever the repository raised if the stored source URLs could
+            not be read or the write failed. The error is logged first.
     """
     if not new_incidents:
-        print("No new incidents provided to append.")
+        logger.info("No new incidents provided to append")
         return 0
 
-    existing_source_urls = set()
-    
-    # Construct the full path to the CSV file relative to this script's location
-    # app/rss_fetcher.py -> ../data/incidents.csv
-    # So, if csv_filepath is "../data/incidents.csv", it's already relative to the project root.
-    # If this script is in 'app/', and csv_filepath is relative to the project root,
-    # we need to ensure the path is correct.
-    # For this project, csv_filepath is passed as os.path.join(os.path.dirname(__file__), '..', 'data', 'incidents.csv')
-    # or similar from the calling script, or just "data/incidents.csv" if called from root.
-    # The default `../data/incidents.csv` assumes this script is in `app/`.
-    
-    # Correctly resolve CSV file path relative to this script if a relative path like "../data/" is given
+    # Paths like "../data/incidents.csv" are relative to this script (in app/);
+    # anything else is resolved by the repository relative to the project root.
     if csv_filepath.startswith("../"):
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        resolved_csv_filepath = os.path.join(base_dir, csv_filepath)
-    else: # Assumes path is absolute or relative to CWD
-        resolved_csv_filepath = csv_filepath
-
-    print(f"Operating on CSV file: {resolved_csv_filepath}")
-
+        csv_filepath = os.path.join(base_dir, csv_filepath)
+    repository = open_incident_repository(csv_filepath)
 
     try:
-        if os.path.exists(resolved_csv_filepath) and os.path.getsize(resolved_csv_filepath) > 0:
-            with open(resolved_csv_filepath, mode='r', newline='', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                # Ensure 'source_url' is in fieldnames to prevent KeyError
-                if 'source_url' in reader.fieldnames:
-                    for row in reader:
-                        if row.get('source_url'):
-                            existing_source_urls.add(row['source_url'])
-                else:
-                    print(f"Warning: 'source_url' column not found in {resolved_csv_filepath}. Cannot check for duplicates effectively.")
-        else:
-            print(f"CSV file {resolved_csv_filepath} does not exist or is empty. Will create it if new incidents are added.")
-    except FileNotFoundError:
-        print(f"CSV file {resolved_csv_filepath} not found. Will create it if new incidents are added.")
+        with time_stage('fetch', 'dedup'):
+            existing_source_urls = repository.existing_source_urls(
+                incident.get('source_url') for incident in new_incidents
+            )
     except Exception as e:
-        print(f"Error reading existing CSV file {resolved_csv_filepath}: {e}")
-        return 0 # Stop if we can't read existing URLs, to avoid creating many duplicates
+        logger.error("Error reading existing data file", path=repository.path, error=str(e))
+        raise # Stop if we can't read existing URLs, to avoid creating many duplicates
+    ROWS_SCANNED.labels(operation='dedup_check').inc(len(new_incidents))
 
     incidents_to_write = []
+    skipped_count = 0
     for incident in new_incidents:
         if incident.get('source_url') not in existing_source_urls:
             incidents_to_write.append(incident)
-            existing_source_urls.add(incident['source_url']) # Add to set to prevent duplicates from same batch
+            existing_source_urls.add(incident.get('source_url')) # Add to set to prevent duplicates from same batch
         else:
-            print(f"Skipping duplicate incident (already in CSV): {incident.get('title')}")
+            skipped_count += 1
+    if skipped_count:
+        logger.info("Skipped incidents that are already stored", skipped=skipped_count)
 
 
     if not incidents_to_write:
-        print("No new unique incidents to append to the CSV.")
+        logger.info("No new unique incidents to append", path=repository.path)
         return 0
 
+    if prepare_rows is not None:
+        prepare_rows(incidents_to_write)
+
     try:
-        # Check if file exists and is empty to determine if header needs to be written
-        file_exists = os.path.exists(resolved_csv_filepath)
-        write_header = not file_exists or os.path.getsize(resolved_csv_filepath) == 0
-        
-        # Ensure parent directory exists
-        os.makedirs(os.path.dirname(resolved_csv_filepath), exist_ok=True)
-
-        with open(resolved_csv_filepath, mode='a', newline='', encoding='utf-8') as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
-            if write_header:
-                writer.writeheader()
-                print(f"Written header to {resolved_csv_filepath}.")
-            
-            writer.writerows(incidents_to_write)
-        
-        print(f"Successfully appended {len(incidents_to_write)} new incidents to {resolved_csv_filepath}.")
-        return len(incidents_to_write)
+        with time_stage('fetch', 'write'):
+            appended_count = repository.add_incidents(incidents_to_write)
+        logger.info("Appended new incidents", appended=appended_count, path=repository.path)
+        return appended_count
 
     except Exception as e:
-        print(f"Error writing to CSV file {resolved_csv_filepath}: {e}")
-        return 0
+        logger.error("Error writing to data file", path=repository.path, error=str(e))
+        raise
+
+# --- Helper Function to manage CSV file path for functions ---
+# This ensures that functions called from within this script (esp. from __main__)
+# correctly resolve paths relative to the project root if they expect paths like "data/incidents.csv"
+# while this script itself is in a subdirectory "app/".
+def _resolve_csv_path(relative_path_from_root):
+    # Relative paths are resolved against the project root, one level above app/.
+    return resolve_data_path(relative_path_from_root)
+
+
+# --- New Wrapper Function ---
+def fetch_parse_and_geocode(csv_filepath_relative_to_root="data/incidents.csv", geocoding_engine=None,
+                            progress_callback=None, on_data_changed=None):
+    """
+    Fetches new incidents, geocodes the ones that are not yet in the CSV and appends them.
+    Args:
+        csv_filepath_relative_to_root (str): Path to the CSV file, relative to project root.
+        geocoding_engine (GeocodingEngine, optional): Engine for the new rows;
+            defaults to Nominatim behind the persistent geocode cache.
+        progress_callback (callable, optional): Called as
+            progress_callback(stage, message, completed=None, total=None) as the run advances.
+        on_data_changed (callable, optional): Called with no arguments after each
+            batch of new incidents has been written (the web app uses this to push them to maps).
+    """
+    with time_stage('fetch', 'total'):
+        return _fetch_parse_and_geocode(csv_filepath_relative_to_root, geocoding_engine, progress_callback,
+                                        on_data_changed)
+
+
+def _fetch_parse_and_geocode(csv_filepath_relative_to_root, geocoding_engine, progress_callback, on_data_changed):
+    def report(stage, message, completed=None, total=None):
+        if progress_callback is not None:
+            progress_callback(stage, message, completed, total)
+
+    # Resolve the CSV path correctly for append_incidents_to_csv
+    # (it has its own internal path resolution, but an absolute path is unambiguous).
+    absolute_csv_filepath = _resolve_csv_path(csv_filepath_relative_to_root)
+    logger.info("Starting fetch, parse and geocode", path=absolute_csv_filepath)
+
+    # 1. Fetch and parse RSS
+    report("fetching", "Fetching the RSS feeds.")
+    # Unchanged feeds answer 304 and contribute nothing; disallowed or failing feeds are skipped.
+    # Parsing a feed stops at its first item that is already stored.
+    repository = open_incident_repository(absolute_csv_filepath)
+
+    def is_known_source_url(source_url):
+        return bool(repository.existing_source_urls([source_url]))
+
+    feed_fetcher = _get_default_feed_fetcher()
+    parsed_feeds = fetch_rss_feeds(feed_fetcher, is_known_source_url=is_known_source_url)
+    fetched_count = sum(len(feed.incidents) for feed in parsed_feeds)
+    logger.info("Fetched potential new incidents from RSS", incidents=fetched_count)
+
+    # 2. Append new incidents to CSV, geocoding them on the way in.
+    # Only the unique new rows are geocoded, so the cost of a fetch scales with the
+    # number of new items rather than with the size of the whole CSV history.
+    geocode_counts = {"processed": 0, "updated": 0}
+
+    def geocode_new_rows(rows):
+        report("geocoding", f"Geocoding {len(rows)} new incidents.", 0, len(rows))
+        with time_stage('fetch', 'geocode'):
+            processed, updated = geocode_rows(
+                rows, engine=geocoding_engine,
+                progress_callback=lambda done, total: report("geocoding", f"Geocoded {done} of {total} new addresses.", done, total),
+            )
+        geocode_counts["processed"] += processed
+        geocode_counts["updated"] += updated
+
+    # append_incidents_to_csv handles its own path resolution if given a relative path like "../data/"
+    # but passing an absolute path is safer.
+    # Batches are appended as soon as they are geocoded, so the first new incidents
+    # are stored while the rate-limited geocoding of the rest is still going.
+    report("appending", f"Checking {fetched_count} fetched incidents for new ones.")
+    appended_count = 0
+    append_error = None
+    for feed in parsed_feeds:
+        try:
+            for start in range(0, len(feed.incidents), APPEND_BATCH_SIZE):
+                batch_appended = append_incidents_to_csv(feed.incidents[start:start + APPEND_BATCH_SIZE],
+                                                         csv_filepath=absolute_csv_filepath,
+                                                         prepare_rows=geocode_new_rows)
+                appended_count += batch_appended
+                if batch_appended and on_data_changed is not None:
+                    on_data_changed()
+        except Exception as e:
+            # The feed's validators stay uncommitted, so the next fetch downloads it
+            # in full again; the items stored before the error are skipped as duplicates.
+            append_error = append_error or e
+            continue
+        # Every item of a completely parsed feed is stored now, so the next fetch of it may
+        # be conditional. A feed cut short by an XML error is downloaded in full again.
+        if feed.complete:
+            feed_fetcher.commit_validators(feed.result)
+    if append_error is not None:
+        raise append_error
+
+    if appended_count > 0:
+        logger.info("Fetch complete", appended=appended_count, geocoded_processed=geocode_counts['processed'],
+                    geocoded_updated=geocode_counts['updated'])
+        return {"appended": appended_count, "geocoded_processed": geocode_counts["processed"], "geocoded_updated": geocode_counts["updated"]}
+    else:
+        logger.info("Fetch complete; no new incidents, so geocoding was skipped")
+        return {"appended": 0, "geocoded_processed": 0, "geocoded_updated": 0}
+
 
 if __name__ == '__main__':
+    configure_logging()
     # Example Usage (for testing purposes)
-    print("--- Testing RSS Fetcher ---")
-    
+    logger.info("Testing RSS fetcher")
+
     # --- Part 1: Test fetching and parsing ---
-    # Because view_text_website will fail as per the problem description,
-    # this will always return an empty list in this simulated environment.
-    # To test the parsing logic, one would need to provide sample XML content manually.
-    
-    print("\nStep 1: Fetching and Parsing RSS Feed (Expect Simulated Failure)")
+    # UW's feed is disallowed by its robots.txt, so with the default configuration
+    # this returns an empty list. Point RSS_FEED_URLS at a local server hosting a
+    # fixture feed to exercise the fetching and parsing path.
+    logger.info("Step 1: fetching and parsing the RSS feeds (expect a robots.txt skip)")
     fetched_incidents = fetch_and_parse_rss()
-    
+
     if not fetched_incidents:
-        print("fetch_and_parse_rss returned no incidents, as expected due to simulated fetch failure.")
-        print("To test parsing, manually provide XML content to fetch_and_parse_rss or a helper.")
-        
+        logger.info("fetch_and_parse_rss returned no incidents (feeds skipped, unchanged or unreachable); "
+                    "pass sample XML content to parse_rss_items to test parsing")
+
         # --- Simulate some fetched data for testing append_incidents_to_csv ---
-        print("\nSimulating fetched data for testing append_incidents_to_csv...")
         fetched_incidents = [
-            { "id": "", "title": "Test Incident 1 (New)", "post_date": "Mon, 01 Jul 2024 12:00:00 +0000", 
-              "incident_time_approx": "11:30 AM", "address_string": "123 Fictional Way NE", 
-              "latitude": "", "longitude": "", 
-              "summary_text": "This is a test incident that is new.", 
+            { "id": "", "title": "Test Incident 1 (New)", "post_date": "Mon, 01 Jul 2024 12:00:00 +0000",
+              "incident_time_approx": "11:30 AM", "address_string": "123 Fictional Way NE",
+              "latitude": "", "longitude": "",
+              "summary_text": "This is a test incident that is new.",
               "source_url": "https://emergency.uw.edu/test1_new" },
-            { "id": "", "title": "Test Incident 2 (Existing)", "post_date": "Tue, 02 Jul 2024 14:00:00 +0000", 
-              "incident_time_approx": "01:30 PM", "address_string": "456 Sample St", 
-              "latitude": "", "longitude": "", 
-              "summary_text": "This is a test incident that might already be in the CSV (from previous runs/manual entry).", 
+            { "id": "", "title": "Test Incident 2 (Existing)", "post_date": "Tue, 02 Jul 2024 14:00:00 +0000",
+              "incident_time_approx": "01:30 PM", "address_string": "456 Sample St",
+              "latitude": "", "longitude": "",
+              "summary_text": "This is a test incident that might already be in the CSV (from previous runs/manual entry).",
               "source_url": "https://emergency.uw.edu/example1" }, # Assumes this matches an entry in data/incidents.csv
-            { "id": "", "title": "Test Incident 3 (New, No Address)", "post_date": "Wed, 03 Jul 2024 16:00:00 +0000", 
-              "incident_time_approx": "03:30 PM", "address_string": "", 
-              "latitude": "", "longitude": "", 
-              "summary_text": "This new test incident has no extractable address.", 
+            { "id": "", "title": "Test Incident 3 (New, No Address)", "post_date": "Wed, 03 Jul 2024 16:00:00 +0000",
+              "incident_time_approx": "03:30 PM", "address_string": "",
+              "latitude": "", "longitude": "",
+              "summary_text": "This new test incident has no extractable address.",
               "source_url": "https://emergency.uw.edu/test3_new_no_address" }
         ]
-        print(f"Simulated {len(fetched_incidents)} incidents.")
+        logger.info("Simulated fetched incidents for testing append_incidents_to_csv", incidents=len(fetched_incidents))
 
     # --- Part 2: Test appending to CSV ---
-    # Define the path to the CSV file relative to the project root for the test
-    # This script (rss_fetcher.py) is in app/, so ../data/ is correct for data/ at project root.
+    # This script (rss_fetcher.py) is in app/, so ../data/ is data/ at the project root.
+    # The test uses data/rss_test_incidents.csv, so the main incidents.csv is not touched.
     test_csv_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'rss_test_incidents.csv')
-    
+
     # Clean up test CSV if it exists from a previous run
     if os.path.exists(test_csv_path):
-        print(f"\nRemoving existing test CSV: {test_csv_path}")
+        logger.info("Removing existing test CSV", path=test_csv_path)
         os.remove(test_csv_path)
 
-    print(f"\nStep 2: Appending Incidents to CSV ({test_csv_path})")
+    logger.info("Step 2: appending incidents to CSV", path=test_csv_path)
     num_appended = append_incidents_to_csv(fetched_incidents, csv_filepath=test_csv_path)
-    print(f"Number of new incidents appended: {num_appended}")
+    logger.info("Appended new incidents", appended=num_appended)
 
     # Second append attempt with the same data to test duplicate filtering
-    print(f"\nStep 3: Appending Same Incidents Again (should append 0 new)")
+    logger.info("Step 3: appending the same incidents again (should append 0 new)")
     num_appended_again = append_incidents_to_csv(fetched_incidents, csv_filepath=test_csv_path)
-    print(f"Number of new incidents appended on second attempt: {num_appended_again}")
+    logger.info("Appended new incidents on second attempt", appended=num_appended_again)
 
-    print("\n--- RSS Fetcher Test Complete ---")
-    # Note: The main incidents.csv is not touched by this test block.
-    # The geocode_incidents.py script would be run separately on data/incidents.csv
-    # and app/main.py would use data/incidents.csv.
-    # This test uses data/rss_test_incidents.csv to avoid side effects.
-
-    print("\n--- Testing Full Fetch, Parse, Append, and Geocode Workflow ---")
-    # Define the path for the main CSV data file for this integrated test
-    # This path is relative to the app/ directory where rss_fetcher.py is located
+    # --- Part 3: Test the full fetch, parse, append and geocode workflow ---
     main_csv_for_integration_test = os.path.join(os.path.dirname(__file__), '..', 'data', 'integration_test_incidents.csv')
 
     # Clean up test CSV if it exists from a previous run
     if os.path.exists(main_csv_for_integration_test):
-        print(f"Removing existing integration test CSV: {main_csv_for_integration_test}")
+        logger.info("Removing existing integration test CSV", path=main_csv_for_integration_test)
         os.remove(main_csv_for_integration_test)
-    
+
     # Create a dummy integration_test_incidents.csv with one existing record to test duplication
-    print(f"Creating dummy integration test CSV: {main_csv_for_integration_test} with one record.")
+    logger.info("Creating integration test CSV with one record", path=main_csv_for_integration_test)
     os.makedirs(os.path.dirname(main_csv_for_integration_test), exist_ok=True)
     with open(main_csv_for_integration_test, mode='w', newline='', encoding='utf-8') as outfile:
         writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
         writer.writeheader()
         writer.writerow({
-            "id": "existing1", "title": "Test Incident 2 (Existing)", 
-            "post_date": "Tue, 02 Jul 2024 14:00:00 +0000", "incident_time_approx": "01:30 PM", 
-            "address_string": "456 Sample St", "latitude": "47.123", "longitude": "-122.456", 
-            "summary_text": "This is a pre-existing test incident.", 
+            "id": "existing1", "title": "Test Incident 2 (Existing)",
+            "post_date": "Tue, 02 Jul 2024 14:00:00 +0000", "incident_time_approx": "01:30 PM",
+            "address_string": "456 Sample St", "latitude": "47.123", "longitude": "-122.456",
+            "summary_text": "This is a pre-existing test incident.",
             "source_url": "https://emergency.uw.edu/example1" # This should match one of the simulated fetched incidents
         })
 
-
-    print(f"\nCalling fetch_parse_and_geocode with CSV: {main_csv_for_integration_test}")
-    # In the test, fetch_and_parse_rss will still return simulated data due to the fetch failure simulation.
-    fetch_parse_and_geocode(csv_filepath=main_csv_for_integration_test)
-
-    print("\n--- Full Workflow Test Complete ---")
-    print(f"Inspect '{main_csv_for_integration_test}' to see the results of the integrated process.")
-    print(f"Note: Geocoding for new entries in '{main_csv_for_integration_test}' would have attempted if new entries were added.")
-
-# --- Helper Function to manage CSV file path for functions ---
-# This ensures that functions called from within this script (esp. from __main__)
-# correctly resolve paths relative to the project root if they expect paths like "data/incidents.csv"
-# while this script itself is in a subdirectory "app/".
-def _resolve_csv_path(relative_path_from_root):
-    # This script (rss_fetcher.py) is in app/
-    # So, to get to the project root, we go one level up.
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.join(project_root, '..')
-    return os.path.join(project_root, relative_path_from_root)
-
-
-# --- New Wrapper Function ---
-def fetch_parse_and_geocode(csv_filepath_relative_to_root="data/incidents.csv"):
-    """
-    Fetches new incidents, appends them to the CSV, and then geocodes the CSV.
-    Args:
-        csv_filepath_relative_to_root (str): Path to the CSV file, relative to project root.
-    """
-    print(f"--- Starting fetch, parse, and geocode process for {csv_filepath_relative_to_root} ---")
-    
-    # Resolve the CSV path correctly for functions that expect it
-    # (append_incidents_to_csv and geocode_csv_data)
-    # append_incidents_to_csv has its own internal path resolution,
-    # but geocode_csv_data expects a direct, valid path.
-    absolute_csv_filepath = _resolve_csv_path(csv_filepath_relative_to_root)
-    print(f"Resolved absolute CSV path: {absolute_csv_filepath}")
-
-    # 1. Fetch and parse RSS
-    # This will return simulated data in the current test setup due to fetch failure simulation
-    new_incidents_from_rss = fetch_and_parse_rss()
-    if not new_incidents_from_rss:
-        print("No incidents were fetched or parsed from RSS (possibly due to fetch simulation).")
-    else:
-        print(f"Fetched/parsed {len(new_incidents_from_rss)} potential new incidents from RSS.")
-
-    # 2. Append new incidents to CSV
-    # append_incidents_to_csv handles its own path resolution if given a relative path like "../data/"
-    # but passing an absolute path is safer.
-    appended_count = append_incidents_to_csv(new_incidents_from_rss, csv_filepath=absolute_csv_filepath)
-    print(f"Appended {appended_count} new unique incidents to {absolute_csv_filepath}.")
-
-    # 3. Geocode if new incidents were added
-    if appended_count > 0:
-        print(f"Geocoding initiated for {absolute_csv_filepath} as {appended_count} new incidents were added.")
-        processed_geo, updated_geo = geocode_csv_data(csv_filepath=absolute_csv_filepath)
-        print(f"Geocoding complete. Processed: {processed_geo}, Updated: {updated_geo}.")
-        return {"appended": appended_count, "geocoded_processed": processed_geo, "geocoded_updated": updated_geo}
-    else:
-        print("No new incidents were appended, so geocoding step was skipped.")
-        return {"appended": 0, "geocoded_processed": 0, "geocoded_updated": 0}
-```
+    # With the default feed configuration fetch_and_parse_rss returns nothing, as above.
+    result = fetch_parse_and_geocode(os.path.abspath(main_csv_for_integration_test))
+    logger.info("Full workflow test complete; inspect the CSV to see the results",
+                path=main_csv_for_integration_test, **result)
@@ -0,0 +1,196 @@
+import bisect
+import math
+import re
+
+# Root module; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from metrics import ROWS_SCANNED
+
+# Indexed columns and the weight of a term occurrence in each; a match in the
+# title says more about an incident than one somewhere in the summary.
+SEARCH_FIELDS = (('title', 3.0), ('address_string', 2.0), ('summary_text', 1.0))
+# Letters and digits; punctuation and underscores separate tokens.
+TOKEN_RE = re.compile(r"[^\W_]+")
+# Query tokens shorter than this only match whole terms, so "a" does not expand to half the vocabulary.
+MIN_PREFIX_LENGTH = 2
+# At most this many terms (the most frequent ones) are matched for one prefix.
+MAX_PREFIX_EXPANSIONS = 50
+# Score multiplier for terms matched by prefix rather than exactly.
+PREFIX_MATCH_WEIGHT = 0.7
+# BM25 parameters: term frequency saturation and document length normalization.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase search terms.
+    """
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def _weighted_terms(incident):
+    """
+    Returns ({term: weighted frequency}, weighted length) for one incident.
+    """
+    frequencies = {}
+    length = 0.0
+    for field, weight in SEARCH_FIELDS:
+        for term in tokenize(incident.get(field)):
+            frequencies[term] = frequencies.get(term, 0.0) + weight
+            length += weight
+    return frequencies, length
+
+
+def _same_text(first, second):
+    return all(first.get(field) == second.get(field) for field, _ in SEARCH_FIELDS)
+
+
+class SearchIndex:
+    """
+    Inverted index over the title, address and summary of every incident.
+
+    postings maps a term to ([positions], [weighted frequencies]) in row order;
+    terms is the sorted vocabulary, used to expand prefixes by binary search.
+    Results are ranked with BM25 and every query term must match (AND).
+
+    An index is never modified once built. extend() returns a new index for a
+    dataset that has had rows appended, copying only the posting lists of the
+    terms that occur in the new rows, so the index of the previous dataset
+    version keeps serving requests that are still running against it.
+    """
+
+    def __init__(self, incidents=()):
+        """
+        Args:
+            incidents (list): Incident dictionaries to index.
+        """
+        self.incidents = []
+        self.postings = {}
+        self.terms = []
+        self.doc_lengths = []
+        self.total_length = 0.0
+        self._add(incidents, 0)
+
+    def _add(self, incidents, start):
+        # Adds incidents[start:] and makes self.incidents point at incidents.
+        new_terms = set()
+        touched = set()
+        for position in range(start, len(incidents)):
+            frequencies, length = _weighted_terms(incidents[position])
+            self.doc_lengths.append(length)
+            self.total_length += length
+            for term, frequency in frequencies.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = ([], [])
+                    new_terms.add(term)
+                elif term not in touched and term not in new_terms:
+                    # Shared with the index this one was copied from; copy before appending.
+                    posting = self.postings[term] = (list(posting[0]), list(posting[1]))
+                touched.add(term)
+                posting[0].append(position)
+                posting[1].append(frequency)
+        ROWS_SCANNED.labels(operation='search_index_build').inc(len(incidents) - start)
+        if new_terms:
+            self.terms = sorted(set(self.terms).union(new_terms)) if self.terms else sorted(new_terms)
+        self.incidents = incidents
+
+    def extend(self, incidents, changed_positions):
+        """
+        Returns an index over incidents, a later version of the rows this index
+        was built from, given the positions of the rows that changed in between.
+        If only rows were appended, or the changed rows kept their text (e.g.
+        they were geocoded), this index is reused and only the appended rows are
+        indexed. Otherwise the index is rebuilt from scratch.
+        """
+        previous = self.incidents
+        if len(incidents) < len(previous) or not all(
+                _same_text(previous[position], incidents[position])
+                for position in changed_positions if position < len(previous)):
+            return SearchIndex(incidents)
+
+        index = SearchIndex.__new__(SearchIndex)
+        index.incidents = previous
+        index.postings = dict(self.postings)
+        index.terms = self.terms
+        index.doc_lengths = list(self.doc_lengths)
+        index.total_length = self.total_length
+        index._add(incidents, len(previous))
+        return index
+
+    def _matching_terms(self, token):
+        """
+        Returns (term, is_exact) for the indexed terms a query token matches:
+        the token itself and, for long enough tokens, the terms it is a prefix of.
+        """
+        if len(token) < MIN_PREFIX_LENGTH:
+            return [(token, True)] if token in self.postings else []
+        start = bisect.bisect_left(self.terms, token)
+        end = bisect.bisect_left(self.terms, token + '\uffff', start)
+        expansions = self.terms[start:end]
+        if len(expansions) > MAX_PREFIX_EXPANSIONS:
+            expansions = sorted(expansions, key=lambda term: -len(self.postings[term][0]))[:MAX_PREFIX_EXPANSIONS]
+            if token in self.postings and token not in expansions:
+                expansions.append(token)
+        return [(term, term == token) for term in expansions]
+
+    def search(self, query):
+        """
+        Finds the incidents matching every term of a query; the last characters
+        of a term may be left out ("thef" finds "theft").
+
+        Args:
+            query (str): Free text, e.g. "bike theft".
+
+        Returns:
+            list: (position, score) tuples, best match first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        doc_count = len(self.doc_lengths)
+        if not tokens or not doc_count:
+            return []
+        average_length = (self.total_length / doc_count) or 1.0
+
+        token_scores = []
+        for token in tokens:
+            scores = {}
+            for term, is_exact in self._matching_terms(token):
+                positions, frequencies = self.postings[term]
+                idf = math.log(1 + (doc_count - len(positions) + 0.5) / (len(positions) + 0.5))
+                if not is_exact:
+                    idf *= PREFIX_MATCH_WEIGHT
+                for position, frequency in zip(positions, frequencies):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / average_length)
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    # A token matching several terms of one incident counts once, with its best match.
+                    if score > scores.get(position, 0.0):
+                        scores[position] = score
+            if not scores:
+                return []
+            token_scores.append(scores)
+
+        # Intersect starting from the most selective token.
+        token_scores.sort(key=len)
+        combined = token_scores[0]
+        for scores in token_scores[1:]:
+            combined = {position: score + scores[position]
+                        for position, score in combined.items() if position in scores}
+        return sorted(combined.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _build_search_index(snapshot):
+    previous = snapshot.previous
+    previous_index = previous.peek_derived('search_index') if previous is not None else None
+    if previous_index is not None:
+        changed_positions = snapshot.changes_since(previous.version)
+        if changed_positions is not None:
+            return previous_index.extend(snapshot.incidents, changed_positions)
+    return SearchIndex(snapshot.incidents)
+
+
+def get_search_index(snapshot):
+    """
+    Returns the search index for an IncidentSnapshot. It is built once per dataset
+    version, by extending the previous version's index when rows were only appended.
+    """
+    return snapshot.get_derived('search_index', _build_search_index)
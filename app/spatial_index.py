@@ -0,0 +1,97 @@
+import math
+
+from .incident_columns import get_incident_columns, parse_float
+
+# Size of one grid cell in degrees. 0.01 deg is roughly 1.1 km north-south,
+# which keeps campus-scale viewports to a handful of cells.
+DEFAULT_CELL_SIZE_DEG = 0.01
+
+
+def parse_bbox(bbox_string):
+    """
+    Parses a "minLon,minLat,maxLon,maxLat" string (Leaflet's toBBoxString format).
+
+    Returns:
+        tuple: (min_lon, min_lat, max_lon, max_lat)
+
+    Raises:
+        ValueError: If the string is malformed or the box is inverted.
+    """
+    parts = bbox_string.split(',')
+    if len(parts) != 4:
+        raise ValueError("bbox must have the form minLon,minLat,maxLon,maxLat")
+    min_lon, min_lat, max_lon, max_lat = (parse_float(part) for part in parts)
+    if None in (min_lon, min_lat, max_lon, max_lat):
+        raise ValueError("bbox values must be numbers")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class GridIndex:
+    """
+    Uniform grid over incident coordinates.
+
+    Each occupied cell keeps the positions (row numbers) of the incidents that
+    fall inside it, so a bounding-box query only looks at the rows in the cells
+    the box overlaps instead of the whole dataset.
+    """
+
+    def __init__(self, columns, cell_size=DEFAULT_CELL_SIZE_DEG):
+        """
+        Args:
+            columns (IncidentColumns): The decoded columns of the incidents.
+            cell_size (float): Grid cell size in degrees.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        # Parallel coordinate arrays shared with the columns; None for rows that are not geocoded yet.
+        self.lats = columns.lats
+        self.lons = columns.lons
+        for position in columns.geocoded_positions():
+            self.cells.setdefault(self._cell_of(self.lons[position], self.lats[position]), []).append(position)
+
+    def _cell_of(self, lon, lat):
+        return (math.floor(lon / self.cell_size), math.floor(lat / self.cell_size))
+
+    def query(self, min_lon, min_lat, max_lon, max_lat):
+        """
+        Finds the incidents whose coordinates fall inside the bounding box.
+
+        Returns:
+            list: Row positions of matching incidents, in CSV order.
+        """
+        min_cx, min_cy = self._cell_of(min_lon, min_lat)
+        max_cx, max_cy = self._cell_of(max_lon, max_lat)
+        cells_in_box = (max_cx - min_cx + 1) * (max_cy - min_cy + 1)
+
+        if cells_in_box > len(self.cells):
+            # Zoomed far out: walking the occupied cells is cheaper than the box's cells.
+            candidate_lists = [
+                positions for (cx, cy), positions in self.cells.items()
+                if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy
+            ]
+        else:
+            candidate_lists = []
+            for cx in range(min_cx, max_cx + 1):
+                for cy in range(min_cy, max_cy + 1):
+                    positions = self.cells.get((cx, cy))
+                    if positions:
+                        candidate_lists.append(positions)
+
+        matches = []
+        for positions in candidate_lists:
+            for position in positions:
+                lat = self.lats[position]
+                lon = self.lons[position]
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                    matches.append(position)
+        matches.sort()
+        return matches
+
+
+def get_grid_index(snapshot):
+    """
+    Returns the grid index for an IncidentSnapshot, building it once per dataset version.
+    """
+    return snapshot.get_derived('grid_index', lambda snap: GridIndex(get_incident_columns(snap)))
@@ -1,74 +1,369 @@
 let map; // Make map global so it can be accessed by refreshMapData
-let currentMarkers = []; // To keep track of current markers on the map
+let currentMarkers = new Map(); // Markers on the map, keyed by incident ref (id, or row-<n> for rows without one)
+let staleMarkers = new Map(); // Markers left over from the previous view, removed once a refresh completes
+let latestRequestId = 0; // Used to ignore responses from superseded viewport requests
+let moveEndTimer = null;
+const INCIDENT_PAGE_SIZE = 500; // Rows per /api/incidents page when loading individual markers
+// Payload used for individual markers: 'columnar' or 'geojson' (ids and coordinates only,
+// popups loaded on demand) or 'json' (full rows, paginated).
+const MAP_DATA_FORMAT = 'columnar';
+const JOB_POLL_INTERVAL_MS = 1000; // How often the fetch button polls /api/jobs/<id>
+let maxClusterZoom = 16; // Updated from the clusters endpoint; above it individual markers are shown
+let heatmapLayer = null; // Density cells from /api/incidents/density, shown while the heatmap box is ticked
+let heatmapRenderer = null; // Canvas renderer, so thousands of cells draw quickly
+let datasetVersion = null; // Dataset version shown on the map (X-Dataset-Version); deltas are requested from it
+let changeStream = null; // EventSource on /api/incidents/stream, pushing deltas as new incidents are stored
 
-function refreshMapData() {
-    // Clear existing markers
-    currentMarkers.forEach(marker => marker.remove());
-    currentMarkers = [];
+function initMap() {
+    // Initialize the map and set its view to UW coordinates
+    map = L.map('map').setView([47.655, -122.308], 14);
 
-    const mapDiv = document.getElementById('map');
-    const fetchStatus = document.getElementById('fetchStatusMessage'); // For initial load error message
+    // Add an OpenStreetMap tile layer
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+    }).addTo(map);
+
+    // Only the incidents inside the viewport are loaded, so reload after panning/zooming.
+    // Debounced so a drag or a zoom animation results in a single request.
+    map.on('moveend', function() {
+        clearTimeout(moveEndTimer);
+        moveEndTimer = setTimeout(refreshMapData, 250);
+    });
+}
+
+function buildPopupContent(incident) {
+    let popupContent = `<h3>${incident.title || 'N/A'}</h3>`;
+    popupContent += `<p><strong>Date:</strong> ${incident.post_date || 'N/A'}</p>`;
+    if (incident.incident_time_approx) {
+        popupContent += `<p><strong>Approx. Time:</strong> ${incident.incident_time_approx}</p>`;
+    }
+    popupContent += `<p><strong>Address:</strong> ${incident.address_string || 'N/A'}</p>`;
+    popupContent += `<p><strong>Summary:</strong> ${incident.summary_text || 'N/A'}</p>`;
+    if (incident.source_url) {
+        popupContent += `<p><a href="${incident.source_url}" target="_blank">Source</a></p>`;
+    }
+    return popupContent;
+}
+
+function incidentMarkerItem(incident, ref) {
+    // ref is the incident's incident_ref, the same key the compact formats and deltas use.
+    const lat = parseFloat(incident.latitude);
+    const lon = parseFloat(incident.longitude);
+    if (isNaN(lat) || isNaN(lon)) {
+        console.warn('Skipping incident due to invalid lat/lon:', incident);
+        return null;
+    }
+    return {
+        key: ref,
+        build: () => L.marker([lat, lon]).bindPopup(buildPopupContent(incident)),
+    };
+}
+
+function lazyIncidentMarkerItem(ref, lat, lon) {
+    // Marker from a compact payload: the popup details are fetched the first time it is opened.
+    return {
+        key: ref,
+        build: () => {
+            const marker = L.marker([lat, lon]).bindPopup('Loading...');
+            let detailsLoaded = false;
+            marker.on('popupopen', () => {
+                if (detailsLoaded) return;
+                fetchJson(`/api/incidents/${encodeURIComponent(ref)}`)
+                    .then(incident => {
+                        detailsLoaded = true;
+                        marker.setPopupContent(buildPopupContent(incident));
+                    })
+                    .catch(error => {
+                        console.error(`Error loading details for incident ${ref}:`, error);
+                        marker.setPopupContent(`<p>Could not load incident details. ${error.message}</p>`);
+                    });
+            });
+            return marker;
+        },
+    };
+}
+
+function compactMarkerItems(data) {
+    // Accepts either compact map format returned by /api/incidents?format=...
+    if (data && Array.isArray(data.ids) && Array.isArray(data.lats) && Array.isArray(data.lons)) {
+        return data.ids.map((ref, i) => lazyIncidentMarkerItem(ref, data.lats[i], data.lons[i]));
+    }
+    if (data && data.type === 'FeatureCollection' && Array.isArray(data.features)) {
+        return data.features.map(feature => {
+            const [lon, lat] = feature.geometry.coordinates;
+            return lazyIncidentMarkerItem(feature.id, lat, lon);
+        });
+    }
+    return null;
+}
 
-    // Fetch incident data from the API
-    fetch('/api/incidents')
+function clusterMarkerItem(cluster, zoom) {
+    if (cluster.count === 1 && cluster.incident) {
+        return incidentMarkerItem(cluster.incident, cluster.ref);
+    }
+    return {
+        // Clusters are only meaningful at the zoom level they were computed for.
+        key: `cluster:${zoom}:${cluster.lat}:${cluster.lon}:${cluster.count}`,
+        build: () => {
+            const size = cluster.count < 10 ? 30 : cluster.count < 100 ? 38 : 46;
+            const bubble = L.marker([cluster.lat, cluster.lon], {
+                icon: L.divIcon({
+                    html: `<div><span>${cluster.count}</span></div>`,
+                    className: 'incident-cluster',
+                    iconSize: L.point(size, size),
+                }),
+            });
+            // Expanding a cluster is just zooming in on it; moveend then loads the finer level.
+            bubble.on('click', () => map.setView([cluster.lat, cluster.lon], Math.min(zoom + 2, map.getMaxZoom())));
+            return bubble;
+        },
+    };
+}
+
+function dateRangeParams() {
+    // "&since=...&until=..." for the date-range inputs; empty bounds are left out
+    // so the server only returns (and clusters) the incidents in the selected slice.
+    let params = '';
+    ['since', 'until'].forEach(name => {
+        const input = document.getElementById(`${name}Date`);
+        if (input && input.value) {
+            params += `&${name}=${encodeURIComponent(input.value)}`;
+        }
+    });
+    return params;
+}
+
+function heatmapColor(ratio) {
+    // Yellow for the sparsest cells through to red for the densest.
+    const green = Math.round(220 * (1 - ratio));
+    return `rgb(240, ${green}, 30)`;
+}
+
+function refreshHeatmap(requestId, bbox, zoom, dateParams) {
+    const enabled = document.getElementById('heatmapToggle');
+    if (!enabled || !enabled.checked) {
+        if (heatmapLayer) {
+            heatmapLayer.remove();
+            heatmapLayer = null;
+        }
+        return;
+    }
+    fetchJson(`/api/incidents/density?z=${zoom}&bbox=${bbox}${dateParams}`)
+        .then(data => {
+            if (requestId !== latestRequestId) {
+                return; // The map moved again while this request was in flight.
+            }
+            if (!data || !Array.isArray(data.counts)) {
+                console.error('Error: Expected density data, but received:', data);
+                return;
+            }
+            if (!heatmapRenderer) {
+                heatmapRenderer = L.canvas();
+            }
+            // Square-root scaling keeps a few very busy cells from washing out the rest.
+            const maxWeight = Math.sqrt(data.max_count || 1);
+            const cells = data.counts.map((count, i) => {
+                const ratio = Math.sqrt(count) / maxWeight;
+                return L.circleMarker([data.lats[i], data.lons[i]], {
+                    renderer: heatmapRenderer,
+                    radius: data.cell_size_px * 0.75,
+                    stroke: false,
+                    fillColor: heatmapColor(ratio),
+                    fillOpacity: 0.2 + 0.5 * ratio,
+                    interactive: false,
+                });
+            });
+            if (heatmapLayer) {
+                heatmapLayer.remove();
+            }
+            heatmapLayer = L.layerGroup(cells).addTo(map);
+        })
+        .catch(error => console.error('Error fetching incident density:', error));
+}
+
+function fetchJson(url) {
+    // 'no-cache' revalidates with the server's ETag, so an unchanged dataset costs a 304.
+    return fetch(url, { cache: 'no-cache' })
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
-            return response.json();
-        })
-        .then(incidents => {
-            if (!Array.isArray(incidents)) {
-                console.error('Error: Expected an array of incidents, but received:', incidents);
-                if (mapDiv) { // Display error on map div if possible
-                     mapDiv.innerHTML = `<p style="text-align:center; padding: 20px;">Failed to load incident data: Invalid format received from server.</p>`;
-                } else {
-                    alert('Failed to load incident data: Invalid format received from server.');
-                }
-                return;
-            }
-            
-            // If map was previously displaying an error, clear it.
-            // This is a simple way; a more robust way would be to have a dedicated error overlay.
-            if (mapDiv.querySelector('p')) {
-                mapDiv.innerHTML = ''; 
-                // Re-initialize map if it was cleared. This is a bit of a heavy-handed recovery.
-                // A better approach would be to not clear the map container itself, but an error overlay.
-                // For now, we assume if mapDiv had a <p>, it was an error message.
-                // Re-initialize map if it was cleared by an error message
-                if (!map || !map.getCenter) { // Check if map object is still valid
-                    map = L.map('map').setView([47.655, -122.308], 14);
-                    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-                        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
-                    }).addTo(map);
-                }
+            // The first load sets the version; after that it only moves forward with applied deltas.
+            const version = Number(response.headers.get('X-Dataset-Version'));
+            if (version && datasetVersion === null) {
+                datasetVersion = version;
             }
+            return response.json();
+        });
+}
 
+function inDateRange(postDate) {
+    const since = document.getElementById('sinceDate');
+    const until = document.getElementById('untilDate');
+    if (since && since.value && !(postDate >= since.value)) return false;
+    if (until && until.value && !(postDate <= until.value)) return false;
+    return true;
+}
 
-            incidents.forEach(incident => {
-                const lat = parseFloat(incident.latitude);
-                const lon = parseFloat(incident.longitude);
+function applyDelta(delta) {
+    // Brings the map up to date with a delta ({version, reset, incidents, refs}) from
+    // /api/incidents?since_version= or the change stream, touching only the
+    // markers of incidents that were added or changed.
+    if (!delta || (datasetVersion !== null && delta.version <= datasetVersion)) {
+        return; // Already applied, e.g. pushed by the stream and fetched after a job.
+    }
+    datasetVersion = delta.version;
+    if (delta.reset) {
+        refreshMapData(); // Too far behind for a delta.
+        return;
+    }
+    if (!delta.incidents.length) {
+        return;
+    }
+    if (map.getZoom() <= maxClusterZoom || (document.getElementById('heatmapToggle') || {}).checked) {
+        // Clusters and density cells are aggregated by the server, so reload the
+        // viewport; markers that did not change stay where they are.
+        refreshMapData();
+        return;
+    }
+    const bounds = map.getBounds();
+    delta.incidents.forEach((incident, i) => {
+        const lat = parseFloat(incident.latitude);
+        const lon = parseFloat(incident.longitude);
+        if (isNaN(lat) || isNaN(lon) || !inDateRange(incident.post_date)) {
+            return; // Not geocoded yet (a later delta brings it) or outside the date range.
+        }
+        const key = delta.refs[i];
+        const existing = currentMarkers.get(key);
+        if (existing) {
+            existing.remove();
+            currentMarkers.delete(key);
+        }
+        if (bounds.contains([lat, lon])) {
+            currentMarkers.set(key, incidentMarkerItem(incident, key).build().addTo(map));
+        }
+    });
+}
 
-                if (!isNaN(lat) && !isNaN(lon)) {
-                    const marker = L.marker([lat, lon]).addTo(map);
-                    
-                    let popupContent = `<h3>${incident.title || 'N/A'}</h3>`;
-                    popupContent += `<p><strong>Date:</strong> ${incident.post_date || 'N/A'}</p>`;
-                    if (incident.incident_time_approx) {
-                        popupContent += `<p><strong>Approx. Time:</strong> ${incident.incident_time_approx}</p>`;
-                    }
-                    popupContent += `<p><strong>Address:</strong> ${incident.address_string || 'N/A'}</p>`;
-                    popupContent += `<p><strong>Summary:</strong> ${incident.summary_text || 'N/A'}</p>`;
-                    if (incident.source_url) {
-                        popupContent += `<p><a href="${incident.source_url}" target="_blank">Source</a></p>`;
-                    }
-                    
-                    marker.bindPopup(popupContent);
-                    currentMarkers.push(marker); // Add to track
-                } else {
-                    console.warn('Skipping incident due to invalid lat/lon:', incident);
+function syncChanges() {
+    // Fetches and applies what changed since the version on the map.
+    if (datasetVersion === null) {
+        refreshMapData();
+        return Promise.resolve();
+    }
+    return fetchJson(`/api/incidents?since_version=${datasetVersion}`)
+        .then(applyDelta)
+        .catch(error => console.error('Error fetching incident changes:', error));
+}
+
+function openChangeStream() {
+    // New incidents are pushed as soon as a fetch stores them. EventSource reconnects
+    // by itself, resuming from the last event id (the dataset version).
+    if (changeStream || typeof EventSource === 'undefined' || datasetVersion === null) {
+        return;
+    }
+    changeStream = new EventSource(`/api/incidents/stream?since_version=${datasetVersion}`);
+    changeStream.addEventListener('incidents', event => applyDelta(JSON.parse(event.data)));
+}
+
+function refreshMapData() {
+    const requestId = ++latestRequestId;
+    const mapDiv = document.getElementById('map');
+    const fetchStatus = document.getElementById('fetchStatusMessage'); // For initial load error message
+
+    // Everything on the map becomes a candidate for removal; markers that show up
+    // again in the new data are moved back (so open popups survive a pan).
+    currentMarkers.forEach((marker, key) => staleMarkers.set(key, marker));
+    currentMarkers = new Map();
+
+    // Adds one batch of marker items to the map. Returns false if a newer refresh
+    // has started, in which case this one stops.
+    function applyItems(items) {
+        if (requestId !== latestRequestId) {
+            return false; // The map moved again while this request was in flight.
+        }
+
+        // If map was previously displaying an error, clear it.
+        // This is a simple way; a more robust way would be to have a dedicated error overlay.
+        if (mapDiv.querySelector('p')) {
+            mapDiv.innerHTML = '';
+            // Re-initialize map if it was cleared. This is a bit of a heavy-handed recovery.
+            // A better approach would be to not clear the map container itself, but an error overlay.
+            // For now, we assume if mapDiv had a <p>, it was an error message.
+            // Re-initialize map if it was cleared by an error message
+            if (!map || !map.getCenter) { // Check if map object is still valid
+                initMap();
+            }
+        }
+
+        items.forEach(item => {
+            if (!item || currentMarkers.has(item.key)) return;
+            const existing = staleMarkers.get(item.key);
+            if (existing) {
+                staleMarkers.delete(item.key);
+                currentMarkers.set(item.key, existing);
+                return;
+            }
+            currentMarkers.set(item.key, item.build().addTo(map)); // Add to track
+        });
+        return true;
+    }
+
+    // Fetch what is inside the current viewport from the API: server-side clusters
+    // while zoomed out, individual incidents once zoomed in past maxClusterZoom.
+    const bbox = encodeURIComponent(map.getBounds().toBBoxString()); // "minLon,minLat,maxLon,maxLat"
+    const zoom = map.getZoom();
+    const dateParams = dateRangeParams();
+    refreshHeatmap(requestId, bbox, zoom, dateParams);
+    let loading;
+    if (zoom <= maxClusterZoom) {
+        loading = fetchJson(`/api/incidents/clusters?z=${zoom}&bbox=${bbox}${dateParams}`)
+            .then(data => {
+                if (!data || !Array.isArray(data.clusters)) {
+                    console.error('Error: Expected cluster data, but received:', data);
+                    throw new Error('Invalid format received from server');
+                }
+                maxClusterZoom = data.max_cluster_zoom;
+                return applyItems(data.clusters.map(cluster => clusterMarkerItem(cluster, zoom)));
+            });
+    } else if (MAP_DATA_FORMAT !== 'json') {
+        loading = fetchJson(`/api/incidents?bbox=${bbox}&format=${MAP_DATA_FORMAT}${dateParams}`)
+            .then(data => {
+                const items = compactMarkerItems(data);
+                if (!items) {
+                    console.error(`Error: Expected ${MAP_DATA_FORMAT} incident data, but received:`, data);
+                    throw new Error('Invalid format received from server');
                 }
+                return applyItems(items);
             });
+    } else {
+        // Load the viewport page by page so the first markers appear before the rest has downloaded.
+        const loadPage = cursor => {
+            const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+            return fetchJson(`/api/incidents?bbox=${bbox}&limit=${INCIDENT_PAGE_SIZE}${dateParams}${cursorParam}`)
+                .then(page => {
+                    if (!page || !Array.isArray(page.incidents)) {
+                        console.error('Error: Expected a page of incidents, but received:', page);
+                        throw new Error('Invalid format received from server');
+                    }
+                    if (!applyItems(page.incidents.map((incident, i) => incidentMarkerItem(incident, page.refs[i])))) {
+                        return false;
+                    }
+                    return page.next_cursor ? loadPage(page.next_cursor) : true;
+                });
+        };
+        loading = loadPage(null);
+    }
+
+    loading
+        .then(completed => {
+            if (!completed || requestId !== latestRequestId) {
+                return;
+            }
+            // Whatever was not seen again has left the viewport.
+            staleMarkers.forEach(marker => marker.remove());
+            staleMarkers.clear();
+            openChangeStream(); // Once the first load has established the dataset version.
             if (fetchStatus) fetchStatus.textContent = 'Map data loaded.'; // Update status on successful load
         })
         .catch(error => {
@@ -82,18 +377,44 @@ function refreshMapData() {
         });
 }
 
-document.addEventListener('DOMContentLoaded', function() {
-    // Initialize the map and set its view to UW coordinates
-    map = L.map('map').setView([47.655, -122.308], 14);
+function pollJob(statusUrl, onProgress) {
+    // Resolves with the job once it has succeeded or failed, calling onProgress on every poll.
+    return fetchJson(statusUrl).then(job => {
+        onProgress(job);
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        return new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+            .then(() => pollJob(statusUrl, onProgress));
+    });
+}
 
-    // Add an OpenStreetMap tile layer
-    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
-    }).addTo(map);
+document.addEventListener('DOMContentLoaded', function() {
+    initMap();
 
     // Initial load of map data
     refreshMapData();
 
+    // Changing the date range reloads the viewport with only the matching incidents.
+    ['sinceDate', 'untilDate'].forEach(id => {
+        const input = document.getElementById(id);
+        if (input) {
+            input.addEventListener('change', refreshMapData);
+        }
+    });
+    const heatmapToggle = document.getElementById('heatmapToggle');
+    if (heatmapToggle) {
+        heatmapToggle.addEventListener('change', refreshMapData);
+    }
+    const clearDatesButton = document.getElementById('clearDateRangeButton');
+    if (clearDatesButton) {
+        clearDatesButton.addEventListener('click', function() {
+            document.getElementById('sinceDate').value = '';
+            document.getElementById('untilDate').value = '';
+            refreshMapData();
+        });
+    }
+
     const fetchButton = document.getElementById('fetchNewIncidentsButton');
     const fetchStatus = document.getElementById('fetchStatusMessage');
 
@@ -119,21 +440,35 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 return response.json();
             })
-            .then(data => {
-                console.log('Fetch new incidents response:', data);
+            .then(accepted => {
+                // The fetch runs as a background job; follow it until it finishes.
+                console.log('Fetch new incidents job accepted:', accepted);
+                return pollJob(accepted.status_url, job => {
+                    if (fetchStatus && job.progress) {
+                        const { message, completed, total } = job.progress;
+                        fetchStatus.textContent = total ? `${message} (${completed}/${total})` : message;
+                    }
+                });
+            })
+            .then(job => {
+                if (job.status !== 'succeeded') {
+                    throw new Error(job.error || 'The fetch job failed.');
+                }
+                const data = job.result;
+                console.log('Fetch new incidents result:', data);
                 if (fetchStatus) {
                     fetchStatus.textContent = data.message || 'Processing complete.';
                     fetchStatus.style.color = 'green';
                     if (data.new_incidents_appended > 0) {
-                        fetchStatus.textContent += ` ${data.new_incidents_appended} new incidents added. Refreshing map...`;
+                        fetchStatus.textContent += ` ${data.new_incidents_appended} new incidents added. Updating map...`;
                     } else {
-                         fetchStatus.textContent += ` No new incidents were added. Map will refresh.`;
+                         fetchStatus.textContent += ` No new incidents were added.`;
                     }
                 }
                 // Re-enable the button
                 fetchButton.disabled = false;
-                // Refresh the map data
-                refreshMapData(); 
+                // Apply just the changes; with the change stream open they are usually on the map already.
+                syncChanges(); 
             })
             .catch(error => {
                 console.error('Error fetching new incidents via button:', error);
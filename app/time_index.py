@@ -0,0 +1,159 @@
+import bisect
+from datetime import datetime
+
+# Root module; app.main imports rss_fetcher first, which puts the project root on sys.path.
+from incident_repository import ISO_DATE_PREFIX_RE
+
+from .incident_columns import MAX_INCREMENTAL_FRACTION, get_incident_columns
+
+
+def parse_date_param(value, name):
+    """
+    Parses a since/until query parameter.
+
+    Args:
+        value (str): A date as "YYYY-MM-DD".
+        name (str): Parameter name for the error message.
+
+    Returns:
+        str: The date in the same normalized form as stored post_date values.
+
+    Raises:
+        ValueError: If the value is not a valid YYYY-MM-DD date.
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD form") from None
+
+
+def parse_time_range(since_param, until_param):
+    """
+    Parses optional since/until parameters into a (since, until) tuple, either
+    bound possibly None, or returns None if neither is given.
+
+    Raises:
+        ValueError: If a date is malformed or since is after until.
+    """
+    if not since_param and not until_param:
+        return None
+    since = parse_date_param(since_param, 'since') if since_param else None
+    until = parse_date_param(until_param, 'until') if until_param else None
+    if since is not None and until is not None and since > until:
+        raise ValueError("since must not be after until")
+    return since, until
+
+
+class TimeIndex:
+    """
+    post_date values of all incidents, sorted, with the row position of each,
+    so a date range is found by two binary searches instead of a full scan.
+
+    Dates come normalized from the incident columns, so rows stored before
+    normalization on ingest are indexed too. Rows without a recognizable date
+    are left out and never match a range.
+
+    An index is never modified once built. updated() returns the index of a
+    new dataset version by inserting the appended rows into, and moving the
+    rows whose date changed within, copies of these lists.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns (IncidentColumns): The decoded columns of the incidents.
+        """
+        entries = []
+        for position, post_date in enumerate(columns.post_dates):
+            if ISO_DATE_PREFIX_RE.match(post_date):
+                entries.append((post_date, position))
+        entries.sort()
+        # The post dates of all rows, by position; kept to find the entries of changed rows.
+        self.post_dates = columns.post_dates
+        self.dates = [post_date for post_date, _ in entries]
+        self.positions = [position for _, position in entries]
+
+    def _entry_index(self, post_date, position):
+        # Entries are sorted by (date, position): find the run of equal dates, then the position within it.
+        start = bisect.bisect_left(self.dates, post_date)
+        end = bisect.bisect_right(self.dates, post_date, start)
+        return bisect.bisect_left(self.positions, position, start, end)
+
+    def updated(self, columns, changed_positions):
+        """
+        Returns the index for columns, decoded from a later version of the rows
+        this index was built from, given the positions of the rows that changed
+        in between. If rows were removed or too many changed, it is rebuilt.
+        """
+        previous = self.post_dates
+        if len(columns) < len(previous):
+            return TimeIndex(columns)
+        post_dates = columns.post_dates
+        changed = [position for position in changed_positions
+                   if position < len(previous) and previous[position] != post_dates[position]]
+        if len(changed) + len(columns) - len(previous) > MAX_INCREMENTAL_FRACTION * len(columns):
+            return TimeIndex(columns)
+
+        index = TimeIndex.__new__(TimeIndex)
+        index.post_dates = post_dates
+        index.dates = list(self.dates)
+        index.positions = list(self.positions)
+        for position in changed:
+            if ISO_DATE_PREFIX_RE.match(previous[position]):
+                entry = index._entry_index(previous[position], position)
+                del index.dates[entry]
+                del index.positions[entry]
+        for position in changed + list(range(len(previous), len(columns))):
+            post_date = post_dates[position]
+            if ISO_DATE_PREFIX_RE.match(post_date):
+                entry = index._entry_index(post_date, position)
+                index.dates.insert(entry, post_date)
+                index.positions.insert(entry, position)
+        return index
+
+    def query(self, since=None, until=None):
+        """
+        Finds the incidents posted between since and until (inclusive, "YYYY-MM-DD").
+
+        Returns:
+            list: Row positions of matching incidents, in CSV order.
+        """
+        start = bisect.bisect_left(self.dates, since) if since is not None else 0
+        end = bisect.bisect_right(self.dates, until) if until is not None else len(self.dates)
+        return sorted(self.positions[start:end])
+
+
+def intersect_positions(first, second):
+    """
+    Intersects two sorted lists of row positions, keeping the order. Each
+    position of the shorter list is binary-searched in the longer one, so a
+    narrow filter stays cheap when combined with a broad one.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    matches = []
+    for position in first:
+        index = bisect.bisect_left(second, position)
+        if index < len(second) and second[index] == position:
+            matches.append(position)
+    return matches
+
+
+def _build_time_index(snapshot):
+    columns = get_incident_columns(snapshot)
+    previous = snapshot.previous
+    previous_index = previous.peek_derived('time_index') if previous is not None else None
+    if previous_index is not None:
+        changed_positions = snapshot.changes_since(previous.version)
+        if changed_positions is not None:
+            return previous_index.updated(columns, changed_positions)
+    return TimeIndex(columns)
+
+
+def get_time_index(snapshot):
+    """
+    Returns the time index for an IncidentSnapshot. It is built once per dataset
+    version, by updating the previous version's index when only a few rows
+    were appended or changed.
+    """
+    return snapshot.get_derived('time_index', _build_time_index)
@@ -0,0 +1,350 @@
+import argparse
+import functools
+import glob
+import http.server
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+# The benchmarks run from a checkout, so make the project root importable.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from synthetic_data import rss_feed_bytes, synthetic_incidents, write_incidents_csv
+from geocode_cache import GeocodeCache
+from geocoding_engine import GeocodingEngine, OfflineGeocoderBackend
+from incident_repository import open_incident_repository
+from structured_logging import configure_logging
+
+DEFAULT_RESULTS_DIR = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+# A scenario whose median gets slower than the baseline by more than this is flagged by --compare.
+REGRESSION_THRESHOLD = 1.10
+SCENARIOS = ('get_incidents', 'append_incidents_to_csv', 'geocode_csv_data', 'fetch_and_parse_rss')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _time(func, repeat, setup=None):
+    """
+    Calls func() repeat times and returns the wall-clock duration of each call.
+    setup() runs before every call and is not timed. The code under test logs
+    to stderr at the level set in main (WARNING unless LOG_LEVEL says otherwise).
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _result(scenario, rows, timings, **extra):
+    return {
+        "scenario": scenario,
+        "rows": rows,
+        "repeat": len(timings),
+        "timings_seconds": [round(t, 6) for t in timings],
+        "min_seconds": round(min(timings), 6),
+        "median_seconds": round(statistics.median(timings), 6),
+        "mean_seconds": round(statistics.mean(timings), 6),
+        "extra": extra,
+    }
+
+
+def _clear_sidecars(csv_path):
+    # Forces the persistent source_url index and the shared snapshot to be rebuilt, as on a first run.
+    for suffix in ('.urls', '.urls.json', '.snapshot', '.lock'):
+        if os.path.exists(csv_path + suffix):
+            os.remove(csv_path + suffix)
+    for snapshot_version in glob.glob(glob.escape(csv_path) + '.snapshot.*'):
+        os.remove(snapshot_version)
+
+
+def bench_get_incidents(corpus_path, rows, repeat):
+    try:
+        from app import main as main_module
+    except ImportError as e:
+        print(f"Skipping get_incidents: {e}")
+        return []
+    from app.incident_store import IncidentStore
+
+    store = IncidentStore(open_incident_repository(corpus_path))
+    main_module.incident_store = store
+    client = main_module.app.test_client()
+
+    def get(url, headers=None):
+        response = client.get(url, headers=headers or {})
+        body = response.get_data()
+        assert response.status_code in (200, 304), response.status_code
+        return response, body
+
+    def forget_snapshot():
+        store.invalidate()
+        _clear_sidecars(corpus_path)
+
+    results = []
+    # First request after a write by an unknown writer: the shared snapshot is rebuilt from the CSV.
+    timings = _time(lambda: get('/api/incidents'), repeat, setup=forget_snapshot)
+    results.append(_result('snapshot_rebuild', rows, timings))
+    # First request of a new worker: the existing snapshot is only mapped.
+    timings = _time(lambda: get('/api/incidents'), repeat, setup=store.invalidate)
+    results.append(_result('get_incidents_cold', rows, timings))
+
+    response, body = get('/api/incidents')
+    timings = _time(lambda: get('/api/incidents'), repeat)
+    results.append(_result('get_incidents_warm', rows, timings, response_bytes=len(body)))
+
+    etag = response.headers.get('ETag')
+    timings = _time(lambda: get('/api/incidents', {'If-None-Match': etag}), repeat)
+    results.append(_result('get_incidents_not_modified', rows, timings))
+
+    # The compressed body and the grid index are built once per dataset version;
+    # the first request pays for that, the timed ones measure steady state.
+    columnar_url = '/api/incidents?format=columnar'
+    get(columnar_url, {'Accept-Encoding': 'gzip'})
+    timings = _time(lambda: get(columnar_url, {'Accept-Encoding': 'gzip'}), repeat)
+    results.append(_result('get_incidents_columnar_gzip', rows, timings))
+
+    bbox_url = '/api/incidents?bbox=-122.32,47.65,-122.30,47.67&fields=id,latitude,longitude'
+    get(bbox_url)
+    timings = _time(lambda: get(bbox_url), repeat)
+    results.append(_result('get_incidents_bbox_fields', rows, timings))
+
+    # The first search builds the inverted index for this dataset version.
+    timings = _time(lambda: get('/api/incidents/search?q=theft'), 1)
+    results.append(_result('search_index_build', rows, timings))
+    search_url = '/api/incidents/search?q=vehicle+pro&limit=20'
+    timings = _time(lambda: get(search_url), repeat)
+    results.append(_result('search_incidents_prefix', rows, timings))
+
+    # Likewise, the first density request builds the grids for every zoom level.
+    density_url = '/api/incidents/density?z=13&bbox=-122.40,47.60,-122.20,47.70'
+    timings = _time(lambda: get(density_url), 1)
+    results.append(_result('density_grids_build', rows, timings))
+    timings = _time(lambda: get(density_url + '&since=2016-01-01'), repeat)
+    results.append(_result('density_since', rows, timings))
+    return results
+
+
+def bench_append_incidents_to_csv(corpus_path, rows, repeat, work_dir, batch_size=100):
+    from app.rss_fetcher import append_incidents_to_csv
+
+    target = os.path.join(work_dir, 'append.csv')
+    # Half of each batch is already stored (exercising deduplication), half is new.
+    known = list(synthetic_incidents(batch_size // 2, seed=1))
+    counter = {"batch": 0}
+
+    def batch():
+        counter["batch"] += 1
+        fresh = synthetic_incidents(batch_size - len(known), seed=counter["batch"],
+                                    url_prefix=f"https://emergency.uw.edu/new/{counter['batch']}/")
+        return known + list(fresh)
+
+    def fresh_copy():
+        shutil.copyfile(corpus_path, target)
+        _clear_sidecars(target)
+
+    results = []
+    timings = _time(lambda: append_incidents_to_csv(batch(), target), repeat, setup=fresh_copy)
+    results.append(_result('append_incidents_to_csv_cold_index', rows, timings, batch_size=batch_size))
+
+    fresh_copy()
+    append_incidents_to_csv(batch(), target)
+    timings = _time(lambda: append_incidents_to_csv(batch(), target), repeat)
+    results.append(_result('append_incidents_to_csv_warm_index', rows, timings, batch_size=batch_size))
+    return results
+
+
+def bench_geocode_csv_data(corpus_path, rows, repeat, work_dir):
+    from geocode_incidents import geocode_csv_data
+
+    target = os.path.join(work_dir, 'geocode.csv')
+    state = {}
+
+    def setup():
+        shutil.copyfile(corpus_path, target)
+        state["backend"] = OfflineGeocoderBackend()
+        state["cache"] = GeocodeCache(':memory:')
+        state["engine"] = GeocodingEngine(state["backend"], cache=state["cache"],
+                                          rate_limit_per_second=1000000, max_workers=4)
+
+    def run():
+        state["counts"] = geocode_csv_data(target, engine=state["engine"])
+
+    timings = _time(run, repeat, setup=setup)
+    processed, updated = state["counts"]
+    results = [_result('geocode_csv_data_cold_cache', rows, timings, processed=processed, updated=updated,
+                       backend_calls=state["backend"].calls)]
+
+    # Same run again with the cache the previous run filled: no backend calls.
+    def setup_warm():
+        shutil.copyfile(corpus_path, target)
+        state["backend"].calls = 0
+
+    timings = _time(run, repeat, setup=setup_warm)
+    results.append(_result('geocode_csv_data_warm_cache', rows, timings, backend_calls=state["backend"].calls))
+    return results
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_fetch_and_parse_rss(rows, repeat, work_dir, feed_items):
+    from app.feed_fetcher import FeedFetcher
+    from app.rss_fetcher import fetch_and_parse_rss, parse_rss_items
+
+    feed_dir = os.path.join(work_dir, 'feeds')
+    os.makedirs(feed_dir, exist_ok=True)
+    feed = rss_feed_bytes(feed_items, first_index=rows)
+    with open(os.path.join(feed_dir, 'feed.xml'), 'wb') as feed_file:
+        feed_file.write(feed)
+
+    # A local stand-in for the feed server.
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=feed_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    feed_url = f"http://127.0.0.1:{server.server_port}/feed.xml"
+    state_path = os.path.join(work_dir, 'feed_state.json')
+    results = []
+    try:
+        def new_fetcher():
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            return FeedFetcher([feed_url], state_path)
+
+        fetchers = {}
+        timings = _time(lambda: fetch_and_parse_rss(fetchers["current"]), repeat,
+                        setup=lambda: fetchers.update(current=new_fetcher()))
+        results.append(_result('fetch_and_parse_rss_full', rows, timings, feed_items=feed_items, feed_bytes=len(feed)))
+
+        fetcher = new_fetcher()
+        fetch_and_parse_rss(fetcher)
+        timings = _time(lambda: fetch_and_parse_rss(fetcher), repeat)
+        results.append(_result('fetch_and_parse_rss_not_modified', rows, timings, feed_items=feed_items))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    timings = _time(lambda: parse_rss_items(feed), repeat)
+    results.append(_result('parse_rss_items', rows, timings, feed_items=feed_items))
+
+    # Only the newest 10% of the feed is new; parsing stops at the first stored link.
+    known_from = rows + feed_items - feed_items // 10
+    prefix = "https://emergency.uw.edu/synthetic/"
+    is_known = lambda url: int(url[len(prefix):]) <= known_from
+    timings = _time(lambda: parse_rss_items(feed, is_known), repeat)
+    results.append(_result('parse_rss_items_early_stop', rows, timings, feed_items=feed_items,
+                           new_items=feed_items // 10))
+    return results
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints each scenario's median against the same scenario in a previous results file.
+
+    Returns:
+        int: The number of scenarios whose median grew by more than the threshold ratio.
+    """
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(r["scenario"], r["rows"]): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (commit {baseline['meta'].get('git_commit')}):")
+    for result in results:
+        old = previous.get((result["scenario"], result["rows"]))
+        if old is None:
+            print(f"  {result['scenario']:<40} {result['rows']:>8}  (new scenario)")
+            continue
+        ratio = result["median_seconds"] / old["median_seconds"] if old["median_seconds"] else float('inf')
+        flag = "  REGRESSION" if ratio > threshold else ""
+        if flag:
+            regressions += 1
+        print(f"  {result['scenario']:<40} {result['rows']:>8}  {old['median_seconds']:.4f}s -> "
+              f"{result['median_seconds']:.4f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def run(rows_list, repeat, scenarios, feed_items, output_path, seed=0):
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='incident-bench-')
+    try:
+        for rows in rows_list:
+            corpus_path = os.path.join(work_dir, f'incidents_{rows}.csv')
+            print(f"Generating a {rows}-row synthetic corpus...")
+            write_incidents_csv(corpus_path, rows, seed=seed)
+
+            if 'get_incidents' in scenarios:
+                results.extend(bench_get_incidents(corpus_path, rows, repeat))
+            if 'append_incidents_to_csv' in scenarios:
+                results.extend(bench_append_incidents_to_csv(corpus_path, rows, repeat, work_dir))
+            if 'geocode_csv_data' in scenarios:
+                results.extend(bench_geocode_csv_data(corpus_path, rows, repeat, work_dir))
+            if 'fetch_and_parse_rss' in scenarios:
+                results.extend(bench_fetch_and_parse_rss(rows, repeat, work_dir, feed_items))
+            for result in results:
+                if result["rows"] == rows:
+                    print(f"  {result['scenario']:<40} median {result['median_seconds']:.4f}s  "
+                          f"min {result['min_seconds']:.4f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"\nResults written to {output_path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the incident map's hot paths on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                        help="Corpus sizes to benchmark, e.g. --rows 10000 100000 1000000 (default: 10000).")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per scenario (default: 5).")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--feed-items', type=int, default=500, help="Items in the synthetic RSS feed (default: 500).")
+    parser.add_argument('--output', help="Results JSON path (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="Compare medians with a previous results file.")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Median slowdown ratio reported as a regression by --compare (default: 1.10).")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Only warnings and errors from the code under test, so the report stays readable
+    # (set LOG_LEVEL=INFO to see everything).
+    configure_logging(level=os.environ.get('LOG_LEVEL', 'WARNING'))
+    output_path = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    results = run(args.rows, args.repeat, args.scenarios, args.feed_items, output_path, args.seed)
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+# The benchmarks run from a checkout, so make the project root importable.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from incident_repository import CSV_FIELDNAMES
+
+# Building blocks for plausible-looking incidents around the UW campus.
+STREETS = [
+    "University Way NE", "Brooklyn Ave NE", "15th Ave NE", "NE 45th St", "NE 42nd St",
+    "Roosevelt Way NE", "11th Ave NE", "NE Campus Pkwy", "Stevens Way NE", "Montlake Blvd NE",
+    "NE Pacific St", "Eastlake Ave E", "NE 50th St", "Ravenna Ave NE", "17th Ave NE",
+]
+INCIDENT_TYPES = [
+    "Robbery", "Burglary", "Vehicle prowl", "Assault", "Suspicious person",
+    "Theft", "Harassment", "Fire alarm", "Medical emergency", "Indecent exposure",
+]
+START_DATE = datetime(2015, 1, 1, 8, 0)
+
+
+def _address(rng, address_pool_size):
+    # A bounded pool of block numbers per street, so addresses repeat the way real
+    # ones do and the geocode cache / deduplication have something to work with.
+    block = rng.randrange(address_pool_size // len(STREETS) + 1)
+    return f"{4000 + block * 10} block of {rng.choice(STREETS)}"
+
+
+def synthetic_incidents(rows, seed=0, geocoded_fraction=0.5, address_pool_size=2000,
+                        url_prefix="https://emergency.uw.edu/synthetic/"):
+    """
+    Yields synthetic incident dictionaries with the incidents.csv columns.
+
+    Args:
+        rows (int): Number of incidents.
+        seed (int): Random seed; the same seed always produces the same corpus.
+        geocoded_fraction (float): Fraction of rows that already have coordinates.
+        address_pool_size (int): Roughly how many distinct addresses to draw from.
+        url_prefix (str): Prefix of the (unique) source_url of each row.
+    """
+    rng = random.Random(seed)
+    for index in range(rows):
+        occurred = START_DATE + timedelta(minutes=index * 37 + rng.randrange(30))
+        incident_type = rng.choice(INCIDENT_TYPES)
+        address = _address(rng, address_pool_size)
+        geocoded = rng.random() < geocoded_fraction
+        yield {
+            "id": str(index + 1),
+            "title": f"{incident_type} near {address}",
+            "post_date": occurred.date().isoformat(),
+            "incident_time_approx": occurred.strftime("%I:%M %p"),
+            "address_string": address,
+            "latitude": f"{47.64 + rng.random() * 0.04:.6f}" if geocoded else "",
+            "longitude": f"{-122.33 + rng.random() * 0.05:.6f}" if geocoded else "",
+            "summary_text": f"{incident_type} reported near {address}. Suspect left the area before officers arrived.",
+            "source_url": f"{url_prefix}{index + 1}",
+        }
+
+
+def write_incidents_csv(path, rows, seed=0, geocoded_fraction=0.5, address_pool_size=2000):
+    """
+    Writes a synthetic incidents.csv, streaming rows so even 1M-row files are
+    generated in constant memory.
+
+    Returns:
+        str: The path written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(synthetic_incidents(rows, seed, geocoded_fraction, address_pool_size))
+    return path
+
+
+def rss_feed_bytes(items, seed=0, first_index=0, url_prefix="https://emergency.uw.edu/synthetic/"):
+    """
+    Builds a synthetic RSS feed in the shape of the UW Alert blog feed: newest
+    item first, with the address leading the description and an
+    "Occurred ... at ..." sentence for the incident time.
+
+    Args:
+        items (int): Number of <item> elements.
+        seed (int): Random seed.
+        first_index (int): Index of the newest item; item links are
+            url_prefix + index, counting down, so they line up with
+            write_incidents_csv when the same prefix is used.
+        url_prefix (str): Prefix of each item's link.
+
+    Returns:
+        bytes: The feed XML.
+    """
+    rng = random.Random(seed)
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+             '<title>UW Alert Blog (synthetic)</title><link>https://emergency.uw.edu/</link>'
+             '<description>Synthetic benchmark feed</description>']
+    for offset in range(items):
+        index = first_index + items - offset
+        occurred = START_DATE + timedelta(minutes=index * 37)
+        incident_type = rng.choice(INCIDENT_TYPES)
+        address = _address(rng, 2000)
+        description = (f"{address}. Reported to UWPD: {incident_type} reported by a student. "
+                       f"Occurred {occurred.strftime('%A')} {occurred.month}/{occurred.day}/{occurred.strftime('%y')} "
+                       f"at {occurred.strftime('%I:%M %p')}.")
+        parts.append(
+            f"<item><title>{escape(incident_type)}</title><link>{escape(url_prefix)}{index}</link>"
+            f"<pubDate>{format_datetime(occurred)}</pubDate>"
+            f"<description>{escape(description)}</description></item>"
+        )
+    parts.append('</channel></rss>')
+    return ''.join(parts).encode('utf-8')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic incident data for benchmarking.")
+    parser.add_argument('--rows', type=int, default=10000, help="Rows in the generated incidents CSV (default: 10000).")
+    parser.add_argument('--csv', default='benchmarks/data/incidents_synthetic.csv', help="Output CSV path.")
+    parser.add_argument('--feed', help="Also write a synthetic RSS feed to this path.")
+    parser.add_argument('--feed-items', type=int, default=500, help="Items in the generated feed (default: 500).")
+    parser.add_argument('--geocoded-fraction', type=float, default=0.5, help="Fraction of rows with coordinates.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_incidents_csv(args.csv, args.rows, args.seed, args.geocoded_fraction)
+    print(f"Wrote {args.rows} synthetic incidents to {args.csv}")
+    if args.feed:
+        os.makedirs(os.path.dirname(os.path.abspath(args.feed)), exist_ok=True)
+        with open(args.feed, 'wb') as feed_file:
+            feed_file.write(rss_feed_bytes(args.feed_items, args.seed, first_index=args.rows))
+        print(f"Wrote a {args.feed_items}-item synthetic RSS feed to {args.feed}")
@@ -0,0 +1,91 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+if fcntl is not None:
+    def _lock_file(lock_file):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(lock_file):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+else:
+    def _lock_file(lock_file):
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue # LK_LOCK gives up after about 10 seconds; keep waiting.
+
+    def _unlock_file(lock_file):
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Exclusive lock held through a lock file, so it excludes other processes
+    (e.g. other WSGI workers, or geocode_incidents.py run from a shell) as well
+    as other threads of this process.
+
+    The lock is reentrant within a thread: a writer holding it can call helpers
+    that take it again. Use get_file_lock() so that every user of one path in a
+    process shares one FileLock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                lock_file = open(self.path, 'a+')
+                try:
+                    _lock_file(lock_file)
+                except BaseException:
+                    lock_file.close()
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._file = lock_file
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock_file(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get_file_lock(path):
+    """
+    Returns the process-wide FileLock for a lock file path.
+    """
+    path = os.path.abspath(path)
+    with _locks_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
@@ -0,0 +1,98 @@
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Default location of the cache database, next to the incidents CSV.
+DEFAULT_GEOCODE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'geocode_cache.sqlite3')
+
+# Addresses the geocoder could not resolve are retried after this long
+# (the address may be fixed upstream, or OpenStreetMap may gain the building).
+DEFAULT_NEGATIVE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# A cached geocoding result. latitude/longitude are both None for a cached "not found".
+CachedGeocode = collections.namedtuple('CachedGeocode', ['latitude', 'longitude'])
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_SPACE_BEFORE_COMMA_RE = re.compile(r"\s+,")
+
+
+def normalize_address(address):
+    """
+    Normalizes an address string so trivially different spellings share a cache entry.
+
+    "456  University Ave , Seattle, WA." and "456 university ave, seattle, wa"
+    both become "456 university ave, seattle, wa".
+    """
+    normalized = _WHITESPACE_RE.sub(" ", address.strip().lower())
+    normalized = _SPACE_BEFORE_COMMA_RE.sub(",", normalized)
+    return normalized.strip(" .,;")
+
+
+class GeocodeCache:
+    """
+    Persistent SQLite cache mapping normalized addresses to coordinates.
+
+    Successful lookups are kept forever; "not found" results expire after
+    negative_ttl_seconds. Transient failures (timeouts, service errors) should
+    not be stored at all. The connection is shared between threads behind a lock.
+    """
+
+    def __init__(self, db_path=DEFAULT_GEOCODE_CACHE_PATH, negative_ttl_seconds=DEFAULT_NEGATIVE_TTL_SECONDS):
+        """
+        Args:
+            db_path (str): Path to the SQLite database file; created if missing.
+                ":memory:" gives a throwaway cache.
+            negative_ttl_seconds (float): How long a "not found" result stays valid.
+        """
+        self.db_path = db_path
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                " address TEXT PRIMARY KEY,"
+                " latitude REAL,"
+                " longitude REAL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def get(self, address):
+        """
+        Looks up an address.
+
+        Returns:
+            CachedGeocode or None: The cached result, or None if the address is
+            not cached or its negative result has expired.
+        """
+        key = normalize_address(address)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, updated_at FROM geocode_cache WHERE address = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        latitude, longitude, updated_at = row
+        if latitude is None and time.time() - updated_at > self.negative_ttl_seconds:
+            return None
+        return CachedGeocode(latitude, longitude)
+
+    def put(self, address, latitude, longitude):
+        """
+        Stores a geocoding result. Pass latitude=longitude=None to record "not found".
+        """
+        key = normalize_address(address)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (address, latitude, longitude, updated_at) VALUES (?, ?, ?, ?)",
+                (key, latitude, longitude, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,111 +1,364 @@
-import csv
+import argparse
+import itertools
+import json
+import os
+import sys
 import time
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-import os # For temporary file operations
+
+from geocode_cache import GeocodeCache
+from geocoding_engine import GeocodingEngine, NominatimBackend
+from incident_repository import open_incident_repository, resolve_data_path
+from metrics import time_stage
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
 
 # Define the input/output CSV file path for when script is run directly
 DEFAULT_CSV_FILE_PATH = 'data/incidents.csv'
 
-def geocode_csv_data(csv_filepath):
+# Rows geocoded together by backfill_coordinates.
+DEFAULT_BACKFILL_CHUNK_SIZE = 1000
+# Chunks whose coordinates are written to the data file (and checkpointed) together.
+# Every write rewrites a CSV, so this bounds the number of rewrites; a crash loses
+# at most this many chunks of work, whose lookups are still in the geocode cache.
+DEFAULT_BACKFILL_CHUNKS_PER_WRITE = 10
+# The backfill checkpoint of data/incidents.csv is data/incidents.csv.backfill.json.
+CHECKPOINT_SUFFIX = '.backfill.json'
+
+# Shared Nominatim backend, created on first use rather than on every call.
+_default_backend = None
+
+def _get_default_backend():
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = NominatimBackend(user_agent="uw_incident_mapper/1.0")
+    return _default_backend
+
+def _run_with_engine(func, cache, engine):
+    # Builds the default Nominatim engine (and opens the on-disk cache) when the
+    # caller did not supply one, and closes the cache afterwards.
+    owns_cache = engine is None and cache is None
+    if owns_cache:
+        cache = GeocodeCache()
+    if engine is None:
+        engine = GeocodingEngine(_get_default_backend(), cache=cache)
+
+    try:
+        return func(engine)
+    finally:
+        if owns_cache:
+            cache.close()
+
+def geocode_csv_data(csv_filepath, cache=None, engine=None):
     """
-    Reads incident data from a given CSV file, geocodes addresses,
-    and updates the file with latitude and longitude information.
+    Reads incident data from a given CSV file (or SQLite incident database),
+    geocodes addresses, and updates the file with latitude and longitude information.
+
+    Addresses are looked up in the persistent geocode cache first; only cache
+    misses reach the geocoder. Misses are resolved concurrently by a
+    GeocodingEngine that keeps Nominatim's one-request-per-second limit.
 
     Args:
         csv_filepath (str): The path to the CSV file to process.
+        cache (GeocodeCache, optional): Cache to use. Defaults to the shared
+            on-disk cache in data/geocode_cache.sqlite3. Ignored if engine is given.
+        engine (GeocodingEngine, optional): Engine to use, e.g. one with an
+            OfflineGeocoderBackend. Defaults to Nominatim with the cache above.
+
+    Returns:
+        tuple: (processed_count, updated_count)
+    """
+    def run(eng):
+        with time_stage('geocode_csv', 'total'):
+            return _geocode_csv_data(csv_filepath, eng)
+
+    return _run_with_engine(run, cache, engine)
+
+def geocode_rows(rows, cache=None, engine=None, progress_callback=None):
+    """
+    Geocodes incident dictionaries in memory, filling in 'latitude'/'longitude'
+    for rows that have an address but no coordinates. Nothing is read from or
+    written to disk, so the cost depends only on the number of rows passed in.
+
+    Args:
+        rows (list): Incident dictionaries; updated in place.
+        cache (GeocodeCache, optional): See geocode_csv_data.
+        engine (GeocodingEngine, optional): See geocode_csv_data.
+        progress_callback (callable, optional): See GeocodingEngine.geocode_many.
 
     Returns:
         tuple: (processed_count, updated_count)
     """
-    # Initialize the Nominatim geocoder with a custom user agent
-    geolocator = Nominatim(user_agent="uw_incident_mapper/1.0")
-    
+    return _run_with_engine(lambda eng: _geocode_rows(rows, eng, progress_callback), cache, engine)
+
+def _geocode_rows(rows, engine, progress_callback=None):
     processed_count = 0
     updated_count = 0
 
+    # Collect the rows that need coordinates, then resolve all their addresses as one batch.
+    rows_to_geocode = []
+    for row in rows:
+        processed_count += 1
+        address = (row.get('address_string') or '').strip()
+        # Check if latitude or longitude are present and non-empty
+        lat_present = (row.get('latitude') or '').strip()
+        lon_present = (row.get('longitude') or '').strip()
+
+        # Geocode if address is present AND (latitude is missing OR longitude is missing)
+        if address and (not lat_present or not lon_present):
+            rows_to_geocode.append((row, address))
+
+    if rows_to_geocode:
+        logger.info("Geocoding rows with missing coordinates", rows=len(rows_to_geocode))
+        results = engine.geocode_many((address for _, address in rows_to_geocode), progress_callback=progress_callback)
+        for row, address in rows_to_geocode:
+            result = results.get(address)
+            if result is None:
+                continue # Lookup failed; the engine has already logged why.
+            if result.latitude is not None:
+                row['latitude'] = str(result.latitude)
+                row['longitude'] = str(result.longitude)
+                updated_count += 1
+                logger.info("Geocoded address", address=address, latitude=result.latitude, longitude=result.longitude)
+            else:
+                logger.warning("Could not geocode address: location not found", address=address)
+
+    return processed_count, updated_count
+
+def _geocode_csv_data(csv_filepath, engine):
+    repository = open_incident_repository(csv_filepath)
+
     try:
-        # Read the CSV file
-        with open(csv_filepath, mode='r', newline='', encoding='utf-8') as infile:
-            reader = csv.DictReader(infile)
-            data = list(reader)
-            header = reader.fieldnames
-            if not header: # Handle empty CSV file
-                print(f"Error: CSV file {csv_filepath} is empty or header is missing.")
-                return 0, 0
+        # Only rows with an address and missing coordinates are read into memory.
+        with time_stage('geocode_csv', 'scan'):
+            pending = list(repository.iter_missing_coordinates())
     except FileNotFoundError:
-        print(f"Error: The file {csv_filepath} was not found.")
+        logger.error("Data file not found", path=csv_filepath)
         return 0, 0
     except Exception as e:
-        print(f"An error occurred while reading the CSV file {csv_filepath}: {e}")
+        logger.error("Error reading the data file", path=csv_filepath, error=str(e))
         return 0, 0
 
-    updated_data = []
+    rows = [row for _, row in pending]
+    with time_stage('geocode_csv', 'geocode'):
+        processed_count, updated_count = _geocode_rows(rows, engine)
 
-    for row in data:
-        processed_count += 1
-        address = row.get('address_string', '').strip()
-        # Check if latitude or longitude are present and non-empty
-        lat_present = row.get('latitude', '').strip()
-        lon_present = row.get('longitude', '').strip()
+    if updated_count == 0:
+        # Nothing changed (e.g. every row was already geocoded), so leave the file untouched.
+        logger.info("Geocoding complete; no rows needed updating", path=csv_filepath, processed=processed_count)
+        return processed_count, 0
 
-        # Geocode if address is present AND (latitude is missing OR longitude is missing)
-        if address and (not lat_present or not lon_present):
-            try:
-                # Attempt to geocode the address
-                print(f"Geocoding address: {address}...")
-                location = geolocator.geocode(address, timeout=10)
-                time.sleep(1)  # Respect Nominatim's usage policy
-
-                if location:
-                    row['latitude'] = str(location.latitude)
-                    row['longitude'] = str(location.longitude)
-                    updated_count += 1
-                    print(f"Successfully geocoded: {address} -> ({location.latitude}, {location.longitude})")
-                else:
-                    print(f"Warning: Could not geocode address: {address}. Location not found.")
-            
-            except GeocoderTimedOut:
-                print(f"Warning: Geocoding timed out for address: {address}. Leaving lat/lon as is.")
-            except GeocoderServiceError as e:
-                print(f"Warning: Geocoding service error for address: {address} ({e}). Leaving lat/lon as is.")
-            except Exception as e:
-                print(f"Warning: An unexpected error occurred during geocoding for {address}: {e}. Leaving lat/lon as is.")
-        
-        updated_data.append(row)
-
-    # Write the updated data back to the CSV file using a temporary file
-    temp_file_path = csv_filepath + '.tmp'
+    updates = {
+        key: (row['latitude'], row['longitude'])
+        for key, row in pending
+        if (row.get('latitude') or '').strip() and (row.get('longitude') or '').strip()
+    }
     try:
-        with open(temp_file_path, mode='w', newline='', encoding='utf-8') as outfile:
-            if header: # Ensure header is not None
-                writer = csv.DictWriter(outfile, fieldnames=header)
-                writer.writeheader()
-                writer.writerows(updated_data)
-            else:
-                print(f"Error: Cannot write to CSV {csv_filepath}, header is missing.")
-                return processed_count, 0 # Return counts before successful write
-
-        # Replace the original file with the temporary file
-        os.replace(temp_file_path, csv_filepath)
-        print(f"\nGeocoding process complete for {csv_filepath}.")
-        print(f"Total addresses processed: {processed_count}")
-        print(f"Addresses successfully updated/verified with geocodes: {updated_count}")
+        with time_stage('geocode_csv', 'write'):
+            repository.update_coordinates(updates)
+        logger.info("Geocoding complete", path=csv_filepath, processed=processed_count, updated=updated_count)
         return processed_count, updated_count
 
     except Exception as e:
-        print(f"An error occurred while writing the updated CSV file {csv_filepath}: {e}")
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path) # Clean up temp file on error
+        logger.error("Error writing the updated data file", path=csv_filepath, error=str(e))
         return processed_count, 0 # Return updated_count as 0 due to write error
 
+def backfill_coordinates(csv_filepath, chunk_size=DEFAULT_BACKFILL_CHUNK_SIZE, checkpoint_path=None,
+                         restart=False, cache=None, engine=None, chunks_per_write=DEFAULT_BACKFILL_CHUNKS_PER_WRITE):
+    """
+    Geocodes the rows without coordinates of a data file of any size, a chunk
+    at a time, for backfilling large historical imports.
+
+    Unlike geocode_csv_data, which collects every pending row and writes once at
+    the end, rows are geocoded chunk_size at a time, and the coordinates of every
+    chunks_per_write chunks are written to the data file together. The position
+    reached is then saved in a checkpoint file, with the byte offset of that row
+    in a CSV, so neither the next chunk nor a resumed run reads the rows before
+    it again. Memory use depends on chunk_size and chunks_per_write, not on the
+    size of the file. If the run is interrupted, the next call resumes after the
+    last written chunk. The checkpoint is deleted once every row has been handled.
+
+    Progress (rows handled, throughput and the estimated time left) is logged
+    after every chunk.
+
+    Args:
+        csv_filepath (str): The CSV file (or SQLite incident database) to process.
+        chunk_size (int): Rows geocoded together.
+        checkpoint_path (str, optional): Checkpoint file. Defaults to the data
+            file's path plus CHECKPOINT_SUFFIX.
+        restart (bool): Ignore an existing checkpoint and start from the first row.
+        cache (GeocodeCache, optional): See geocode_csv_data.
+        engine (GeocodingEngine, optional): See geocode_csv_data.
+        chunks_per_write (int): Chunks written to the data file and checkpointed together.
+
+    Returns:
+        tuple: (processed_count, updated_count), counted since the backfill
+        started, including runs that were interrupted.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if chunks_per_write < 1:
+        raise ValueError("chunks_per_write must be at least 1")
+
+    def run(eng):
+        with time_stage('geocode_backfill', 'total'):
+            return _backfill_coordinates(csv_filepath, eng, chunk_size, chunks_per_write, checkpoint_path, restart)
+
+    return _run_with_engine(run, cache, engine)
+
+def _read_checkpoint(checkpoint_path):
+    try:
+        with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("Ignoring unreadable backfill checkpoint", path=checkpoint_path)
+        return None
+
+def _write_checkpoint(checkpoint_path, checkpoint):
+    # Written to a temporary file and renamed, so a crash never leaves half a checkpoint.
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+def _format_duration(seconds):
+    if seconds is None:
+        return 'unknown'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def _next_chunk(repository, start, chunk_size):
+    # Every chunk starts a new scan, so no file is held open while the chunk is
+    # geocoded and the data file replaced, and rows appended meanwhile are seen.
+    # A CSV scan seeks to where the previous one stopped (see scan_bookmark).
+    scan = repository.iter_missing_coordinates(start=start)
+    try:
+        return list(itertools.islice(scan, chunk_size))
+    finally:
+        scan.close()
+
+def _backfill_coordinates(csv_filepath, engine, chunk_size, chunks_per_write, checkpoint_path, restart):
+    repository = open_incident_repository(csv_filepath)
+    data_path = os.path.abspath(repository.path)
+    checkpoint_path = checkpoint_path or repository.path + CHECKPOINT_SUFFIX
+
+    checkpoint = None if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint.get('data_path') != data_path:
+        logger.warning("Ignoring backfill checkpoint of another data file", path=checkpoint_path,
+                       checkpoint_data_path=checkpoint.get('data_path'))
+        checkpoint = None
+    if checkpoint is None:
+        # next_key is the first row key not handled yet (see iter_missing_coordinates),
+        # scan_bookmark where a scan starting there can seek to (see scan_bookmark).
+        checkpoint = {"data_path": data_path, "next_key": None, "scan_bookmark": None, "processed": 0, "updated": 0}
+    else:
+        logger.info("Resuming backfill", path=data_path, next_key=checkpoint['next_key'],
+                    processed=checkpoint['processed'], updated=checkpoint['updated'])
+        repository.restore_scan_bookmark(checkpoint.get('scan_bookmark'))
+
+    try:
+        # One streaming pass to count what is left, for the time estimate. It
+        # moves the scan bookmark to the end, so the bookmark is put back afterwards.
+        with time_stage('geocode_backfill', 'scan'):
+            remaining = sum(1 for _ in repository.iter_missing_coordinates(start=checkpoint['next_key']))
+        repository.restore_scan_bookmark(checkpoint.get('scan_bookmark'))
+    except FileNotFoundError:
+        logger.error("Data file not found", path=csv_filepath)
+        return 0, 0
+    logger.info("Backfill started", path=data_path, pending=remaining, chunk_size=chunk_size,
+                chunks_per_write=chunks_per_write)
+
+    started = time.monotonic()
+    handled_this_run = 0
+    # Geocoded but not yet written: the next key to scan, the coordinates and the counts.
+    next_key = checkpoint['next_key']
+    pending_updates = {}
+    pending_chunks = pending_processed = pending_updated = 0
+    try:
+        while True:
+            with time_stage('geocode_backfill', 'scan'):
+                chunk = _next_chunk(repository, next_key, chunk_size)
+            if chunk:
+                with time_stage('geocode_backfill', 'geocode'):
+                    processed_count, updated_count = _geocode_rows([row for _, row in chunk], engine)
+                pending_updates.update(
+                    (key, (row['latitude'], row['longitude']))
+                    for key, row in chunk
+                    if (row.get('latitude') or '').strip() and (row.get('longitude') or '').strip()
+                )
+                next_key = chunk[-1][0] + 1
+                pending_chunks += 1
+                pending_processed += processed_count
+                pending_updated += updated_count
+
+            if pending_chunks and (pending_chunks >= chunks_per_write or not chunk):
+                with time_stage('geocode_backfill', 'write'):
+                    repository.update_coordinates(pending_updates)
+                # Only once the chunks are in the data file does the checkpoint move past them.
+                checkpoint['next_key'] = next_key
+                checkpoint['scan_bookmark'] = repository.scan_bookmark()
+                checkpoint['processed'] += pending_processed
+                checkpoint['updated'] += pending_updated
+                _write_checkpoint(checkpoint_path, checkpoint)
+                pending_updates = {}
+                pending_chunks = pending_processed = pending_updated = 0
+            if not chunk:
+                break
+
+            handled_this_run += len(chunk)
+            remaining = max(remaining - len(chunk), 0)
+            elapsed = time.monotonic() - started
+            rows_per_second = handled_this_run / elapsed if elapsed > 0 else 0.0
+            logger.info("Backfill progress", processed=checkpoint['processed'] + pending_processed,
+                        updated=checkpoint['updated'] + pending_updated, remaining=remaining,
+                        rows_per_second=round(rows_per_second, 2),
+                        eta=_format_duration(remaining / rows_per_second if rows_per_second else None))
+    except KeyboardInterrupt:
+        logger.warning("Backfill interrupted; run it again to resume from the last checkpoint",
+                       checkpoint=checkpoint_path, next_key=checkpoint['next_key'])
+        raise
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    # Rows that could not be geocoded stay without coordinates; a later run with restart=True retries them.
+    logger.info("Backfill complete", path=data_path, processed=checkpoint['processed'], updated=checkpoint['updated'],
+                seconds=round(time.monotonic() - started, 1))
+    return checkpoint['processed'], checkpoint['updated']
+
 if __name__ == '__main__':
-    print(f"Running geocoding for {DEFAULT_CSV_FILE_PATH}...")
-    # Ensure DEFAULT_CSV_FILE_PATH is correctly resolved if it's relative
-    # For this script, it's typically in the root, and data/ is a subdir.
-    # If this script moves, the path might need adjustment or be made absolute.
-    # current_dir = os.path.dirname(os.path.abspath(__file__))
-    # default_csv_abs_path = os.path.join(current_dir, DEFAULT_CSV_FILE_PATH)
-    
-    # Using the relative path directly, assuming script is run from project root
-    geocode_csv_data(DEFAULT_CSV_FILE_PATH)
+    parser = argparse.ArgumentParser(description="Geocode the incidents that have an address but no coordinates.")
+    parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV_FILE_PATH,
+                        help=f"CSV file or SQLite database to update (default: {DEFAULT_CSV_FILE_PATH})")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Work through the file in checkpointed chunks, resuming an interrupted backfill")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_BACKFILL_CHUNK_SIZE,
+                        help=f"Rows geocoded and committed together with --backfill (default: {DEFAULT_BACKFILL_CHUNK_SIZE})")
+    parser.add_argument('--chunks-per-write', type=int, default=DEFAULT_BACKFILL_CHUNKS_PER_WRITE,
+                        help="Chunks written to the data file and checkpointed together with --backfill "
+                             f"(default: {DEFAULT_BACKFILL_CHUNKS_PER_WRITE})")
+    parser.add_argument('--checkpoint', default=None,
+                        help=f"Checkpoint file for --backfill (default: the data file's path plus {CHECKPOINT_SUFFIX})")
+    parser.add_argument('--restart', action='store_true',
+                        help="With --backfill, ignore the checkpoint and start from the first row")
+    args = parser.parse_args()
+    configure_logging()
+
+    # Relative paths are taken relative to the project root (see resolve_data_path).
+    if not os.path.exists(resolve_data_path(args.csv_path)):
+        logger.error("Data file not found", path=resolve_data_path(args.csv_path))
+        sys.exit(1)
+    if args.backfill:
+        print(f"Backfilling coordinates for {args.csv_path}...")
+        try:
+            backfill_coordinates(args.csv_path, chunk_size=args.chunk_size, checkpoint_path=args.checkpoint,
+                                 restart=args.restart, chunks_per_write=args.chunks_per_write)
+        except KeyboardInterrupt:
+            sys.exit(130)
+    else:
+        print(f"Running geocoding for {args.csv_path}...")
+        geocode_csv_data(args.csv_path)
@@ -0,0 +1,259 @@
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from geocode_cache import CachedGeocode, normalize_address
+from metrics import GEOCODE_CACHE_LOOKUPS, GEOCODER_REQUESTS
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Nominatim's usage policy allows at most one request per second.
+DEFAULT_RATE_LIMIT_PER_SECOND = 1.0
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 2.0
+
+
+class TransientGeocodingError(Exception):
+    """
+    Raised by a backend for failures worth retrying (timeouts, 5xx responses, ...).
+    """
+
+
+class GeocodingTimeoutError(TransientGeocodingError):
+    """
+    A TransientGeocodingError caused by the service not answering in time.
+    """
+
+
+class GeocoderBackend:
+    """
+    Interface for geocoding services used by GeocodingEngine.
+
+    Implementations must be safe to call from several threads at once.
+    """
+
+    def geocode(self, address):
+        """
+        Resolves one address.
+
+        Returns:
+            tuple or None: (latitude, longitude), or None if the address was not found.
+
+        Raises:
+            TransientGeocodingError: If the lookup failed and may succeed on retry.
+        """
+        raise NotImplementedError
+
+
+class NominatimBackend(GeocoderBackend):
+    """
+    OpenStreetMap Nominatim via geopy.
+    """
+
+    def __init__(self, user_agent="uw_incident_mapper/1.0", timeout=10):
+        # Imported here so the engine (and the offline backend) work without geopy installed.
+        from geopy.geocoders import Nominatim
+
+        self._geolocator = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+
+    def geocode(self, address):
+        from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+
+        try:
+            location = self._geolocator.geocode(address, timeout=self.timeout)
+        except GeocoderTimedOut as e:
+            raise GeocodingTimeoutError(f"timed out: {e}") from e
+        except GeocoderServiceError as e:
+            raise TransientGeocodingError(f"service error: {e}") from e
+        if location is None:
+            return None
+        return location.latitude, location.longitude
+
+
+class OfflineGeocoderBackend(GeocoderBackend):
+    """
+    Local stand-in geocoder for testing and benchmarking without network access.
+
+    Addresses hash to stable coordinates around the UW campus. Latency and
+    failure rates can be simulated to exercise the engine's concurrency and retries.
+    """
+
+    def __init__(self, latency_seconds=0.0, failure_rate=0.0, not_found_rate=0.0, seed=None):
+        """
+        Args:
+            latency_seconds (float): Simulated round-trip time per lookup.
+            failure_rate (float): Probability (0..1) that a lookup raises TransientGeocodingError.
+            not_found_rate (float): Probability (0..1) that an address is unknown.
+                Decided per address, so repeated lookups agree.
+            seed (int, optional): Seed for the transient failure generator.
+        """
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.not_found_rate = not_found_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def geocode(self, address):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if fail:
+            raise TransientGeocodingError("simulated transient failure")
+
+        digest = hashlib.sha1(normalize_address(address).encode('utf-8')).digest()
+        if digest[0] / 256.0 < self.not_found_rate:
+            return None
+        # Spread results over roughly a 4 km square centred on campus.
+        latitude = 47.655 + (int.from_bytes(digest[1:4], 'big') / 0xFFFFFF - 0.5) * 0.04
+        longitude = -122.308 + (int.from_bytes(digest[4:7], 'big') / 0xFFFFFF - 0.5) * 0.06
+        return round(latitude, 6), round(longitude, 6)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available, then consumes it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class GeocodingEngine:
+    """
+    Geocodes batches of addresses concurrently behind a shared rate limit.
+
+    Identical addresses (after normalization) are looked up once per batch, the
+    cache is consulted before any backend call, and transient failures are
+    retried with exponential backoff. Requests still start no faster than the
+    rate limit allows, but a slow or timed-out request no longer holds up the
+    ones behind it.
+    """
+
+    def __init__(self, backend, cache=None, rate_limit_per_second=DEFAULT_RATE_LIMIT_PER_SECOND,
+                 max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS):
+        """
+        Args:
+            backend (GeocoderBackend): The geocoding service.
+            cache (GeocodeCache, optional): Persistent cache to read and populate.
+            rate_limit_per_second (float): Maximum backend requests per second, shared by all workers.
+            max_workers (int): Number of lookups allowed in flight at once.
+            max_retries (int): Retries after the first attempt for transient failures.
+            backoff_seconds (float): Delay before the first retry; doubles on each further retry.
+        """
+        self.backend = backend
+        self.cache = cache
+        self.rate_limiter = TokenBucket(rate_limit_per_second)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def _lookup(self, address):
+        """
+        Returns a CachedGeocode, or None if every attempt failed transiently.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                coordinates = self.backend.geocode(address)
+            except TransientGeocodingError as e:
+                outcome = 'timeout' if isinstance(e, GeocodingTimeoutError) else 'transient_error'
+                GEOCODER_REQUESTS.labels(outcome=outcome).inc()
+                if attempt == self.max_retries:
+                    logger.warning("Geocoding failed; leaving lat/lon as is", address=address,
+                                   attempts=attempt + 1, error=str(e))
+                    return None
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.1)
+                logger.warning("Geocoding attempt failed; retrying", address=address, attempt=attempt + 1,
+                               retry_in_seconds=round(delay, 1), error=str(e))
+                time.sleep(delay)
+                continue
+            except Exception as e:
+                GEOCODER_REQUESTS.labels(outcome='error').inc()
+                logger.warning("Unexpected geocoding error; leaving lat/lon as is", address=address, error=str(e))
+                return None
+
+            GEOCODER_REQUESTS.labels(outcome='not_found' if coordinates is None else 'found').inc()
+            if coordinates is None:
+                result = CachedGeocode(None, None)
+            else:
+                result = CachedGeocode(coordinates[0], coordinates[1])
+            if self.cache is not None:
+                self.cache.put(address, result.latitude, result.longitude)
+            return result
+        return None
+
+    def geocode_many(self, addresses, progress_callback=None):
+        """
+        Geocodes a batch of addresses.
+
+        Args:
+            addresses (iterable): Address strings; duplicates are looked up once.
+            progress_callback (callable, optional): Called as progress_callback(completed, total)
+                after each geocoder lookup finishes (cache hits are not counted).
+
+        Returns:
+            dict: Maps each resolvable input address to a CachedGeocode (latitude and
+            longitude are None if the address was not found). Addresses whose lookups
+            failed transiently on every attempt are left out.
+        """
+        addresses = list(addresses)
+        representatives = {}
+        for address in addresses:
+            representatives.setdefault(normalize_address(address), address)
+
+        results_by_key = {}
+        to_lookup = {}
+        for key, address in representatives.items():
+            cached = self.cache.get(address) if self.cache is not None else None
+            if cached is not None:
+                results_by_key[key] = cached
+            else:
+                to_lookup[key] = address
+        if self.cache is not None:
+            GEOCODE_CACHE_LOOKUPS.labels(result='hit').inc(len(results_by_key))
+            GEOCODE_CACHE_LOOKUPS.labels(result='miss').inc(len(to_lookup))
+
+        if to_lookup:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._lookup, address): key for key, address in to_lookup.items()}
+                for completed, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    if result is not None:
+                        results_by_key[futures[future]] = result
+                    if progress_callback is not None:
+                        progress_callback(completed, len(futures))
+
+        results = {}
+        for address in addresses:
+            result = results_by_key.get(normalize_address(address))
+            if result is not None:
+                results[address] = result
+        return results
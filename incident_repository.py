@@ -0,0 +1,818 @@
+import csv
+import email.utils
+import errno
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from file_lock import get_file_lock
+from metrics import ROWS_SCANNED, ROWS_WRITTEN
+from shared_snapshot import publish_snapshot
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Project root; relative data paths are resolved against it.
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Default incident data file, relative to the project root.
+DEFAULT_INCIDENT_DATA_PATH = 'data/incidents.csv'
+
+# Define the expected CSV header
+CSV_FIELDNAMES = [
+    "id", "title", "post_date", "incident_time_approx", "address_string",
+    "latitude", "longitude", "summary_text", "source_url"
+]
+
+# File extensions that select the SQLite implementation in open_incident_repository.
+SQLITE_EXTENSIONS = ('.sqlite3', '.sqlite', '.db')
+
+# Bytes copied at a time from the unchanged start of a CSV by update_coordinates.
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def resolve_data_path(path):
+    """
+    Resolves a data file path. Absolute paths are returned unchanged; relative
+    paths are taken relative to the project root, so callers in app/ and at the
+    root agree on what "data/incidents.csv" means.
+    """
+    if os.path.isabs(path):
+        return path
+    return os.path.normpath(os.path.join(PROJECT_ROOT, path))
+
+
+def open_incident_repository(path=DEFAULT_INCIDENT_DATA_PATH):
+    """
+    Returns the repository implementation matching a data file's extension:
+    SqliteIncidentRepository for .sqlite3/.sqlite/.db, CsvIncidentRepository otherwise.
+    """
+    resolved_path = resolve_data_path(path)
+    if resolved_path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteIncidentRepository(resolved_path)
+    return CsvIncidentRepository(resolved_path)
+
+
+# post_date values that already start with an ISO date, e.g. "2024-05-01" or "2024-05-01T10:00:00".
+ISO_DATE_PREFIX_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+# Other date formats accepted on ingest, besides ISO dates and RFC 822 (RSS pubDate).
+OTHER_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%B %d, %Y', '%b %d, %Y')
+
+
+def normalize_post_date(value):
+    """
+    Normalizes a post_date to "YYYY-MM-DD", so that dates compare correctly as
+    strings. Accepts ISO dates and datetimes, RFC 822 dates as found in RSS
+    pubDate ("Mon, 01 Jul 2024 12:00:00 -0700"; the date in the sender's time
+    zone is kept) and US-style "7/1/2024".
+
+    Returns:
+        str: The normalized date, or the stripped input if it is not a recognized date.
+    """
+    value = (value or '').strip()
+    if ISO_DATE_PREFIX_RE.match(value):
+        try:
+            return datetime.strptime(value[:10], '%Y-%m-%d').date().isoformat()
+        except ValueError:
+            return value
+    try:
+        return email.utils.parsedate_to_datetime(value).date().isoformat()
+    except (TypeError, ValueError, IndexError):
+        pass
+    for date_format in OTHER_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return value
+
+
+def _normalized_for_storage(incident):
+    # Copy with post_date normalized, so stored dates are comparable and indexable.
+    return dict(incident, post_date=normalize_post_date(incident.get('post_date')))
+
+
+def _stored_row(incident):
+    # The row exactly as reading it back from the CSV returns it: every column, as a string.
+    incident = _normalized_for_storage(incident)
+    return {field: '' if incident.get(field) is None else str(incident.get(field)) for field in CSV_FIELDNAMES}
+
+
+def _in_bbox(incident, bbox):
+    try:
+        lat = float(incident.get('latitude') or '')
+        lon = float(incident.get('longitude') or '')
+    except ValueError:
+        return False
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+
+class IncidentRepository:
+    """
+    Storage interface for incidents.
+
+    Incidents are dictionaries keyed by CSV_FIELDNAMES with string values
+    ('' for missing values), whichever backend they come from.
+
+    Every write holds write_lock, which excludes writers in other processes too,
+    and regenerates the shared snapshot (shared_snapshot.py) that web workers
+    read instead of the data file.
+    """
+
+    @property
+    def write_lock(self):
+        """
+        The FileLock (on "<data file>.lock") serializing writers of this data file.
+        """
+        return get_file_lock(self.path + '.lock')
+
+    def _signature_or_none(self):
+        try:
+            return self.signature()
+        except FileNotFoundError:
+            return None
+
+    def signature(self):
+        """
+        Returns a value that changes whenever the stored data changes, used by
+        IncidentStore to decide when to reload.
+
+        Raises:
+            FileNotFoundError: If the backing file does not exist.
+        """
+        raise NotImplementedError
+
+    def iter_incidents(self):
+        """
+        Yields every incident in storage order.
+        """
+        raise NotImplementedError
+
+    def all_incidents(self):
+        """
+        Returns every incident as a list, in storage order.
+        """
+        return list(self.iter_incidents())
+
+    def count(self):
+        """
+        Returns the number of stored incidents.
+        """
+        return sum(1 for _ in self.iter_incidents())
+
+    def existing_source_urls(self, source_urls):
+        """
+        Returns the subset of source_urls that is already stored.
+        """
+        raise NotImplementedError
+
+    def add_incidents(self, incidents):
+        """
+        Appends incidents. Callers are expected to filter out known source URLs
+        with existing_source_urls first; URLs stored by another writer since then
+        are skipped. post_date is stored normalized by normalize_post_date.
+
+        Returns:
+            int: The number of incidents written.
+        """
+        raise NotImplementedError
+
+    def iter_missing_coordinates(self, start=None):
+        """
+        Yields (key, incident) for incidents that have an address but no coordinates,
+        in storage order. The key identifies the row for update_coordinates; keys
+        increase along the storage order.
+
+        Args:
+            start (optional): Only rows whose key is at least start are yielded,
+                e.g. to resume a scan after the last key already handled.
+
+        Raises:
+            FileNotFoundError: If the backing file does not exist, so that a
+                mistyped path is not mistaken for a file with nothing to geocode.
+        """
+        raise NotImplementedError
+
+    def scan_bookmark(self):
+        """
+        Returns where the last iter_missing_coordinates scan stopped (just after
+        the last row it yielded), as a JSON-serializable value for
+        restore_scan_bookmark, or None. Backends that look rows up by key have
+        no use for one and always return None.
+        """
+        return None
+
+    def restore_scan_bookmark(self, bookmark):
+        """
+        Makes a bookmark from scan_bookmark, possibly saved by another process,
+        the starting point of later iter_missing_coordinates scans that start at
+        or after it. A bookmark that no longer matches the data file is ignored.
+        """
+
+    def update_coordinates(self, updates):
+        """
+        Sets coordinates on existing rows.
+
+        Args:
+            updates (dict): Maps keys from iter_missing_coordinates to (latitude, longitude).
+
+        Returns:
+            int: The number of rows updated.
+        """
+        raise NotImplementedError
+
+    def find_incidents(self, bbox=None, since=None, until=None):
+        """
+        Returns incidents inside an optional bounding box and post_date range.
+
+        Args:
+            bbox (tuple, optional): (min_lon, min_lat, max_lon, max_lat).
+            since (str, optional): Inclusive lower bound on post_date ("YYYY-MM-DD").
+            until (str, optional): Inclusive upper bound on post_date ("YYYY-MM-DD").
+        """
+        matches = []
+        for incident in self.iter_incidents():
+            # Rows written before dates were normalized on ingest may hold other formats.
+            post_date = normalize_post_date(incident.get('post_date'))
+            if since is not None and post_date < since:
+                continue
+            if until is not None and post_date > until:
+                continue
+            if bbox is not None and not _in_bbox(incident, bbox):
+                continue
+            matches.append(incident)
+        return matches
+
+
+class SourceUrlIndex:
+    """
+    Persistent set of the source URLs stored in a CSV file, kept in two sidecar files:
+
+    * <csv>.urls: one source URL per line, appended to as rows are appended.
+    * <csv>.urls.json: the CSV size and mtime the .urls file corresponds to.
+
+    If the CSV no longer matches the recorded size/mtime (it was edited by hand,
+    or a writer crashed between the two updates), the index is rebuilt from the
+    CSV on the next lookup. The parsed set is also kept in memory per process, so
+    repeated dedup checks cost one stat call plus set lookups.
+    """
+
+    # Process-wide cache: index path -> (recorded CSV state, set of URLs).
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, csv_filepath):
+        self.csv_filepath = csv_filepath
+        self.index_path = csv_filepath + '.urls'
+        self.meta_path = csv_filepath + '.urls.json'
+
+    def csv_state(self):
+        try:
+            stat_result = os.stat(self.csv_filepath)
+        except FileNotFoundError:
+            return None
+        return [stat_result.st_size, stat_result.st_mtime_ns]
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, mode='r', encoding='utf-8') as meta_file:
+                return json.load(meta_file).get('csv_state')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, csv_state):
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, mode='w', encoding='utf-8') as meta_file:
+            json.dump({'csv_state': csv_state}, meta_file)
+        os.replace(temp_path, self.meta_path)
+
+    def _rebuild(self, csv_state):
+        urls = set()
+        if csv_state is not None:
+            with open(self.csv_filepath, mode='r', newline='', encoding='utf-8') as infile:
+                row_count = 0
+                for row in csv.DictReader(infile):
+                    row_count += 1
+                    if row.get('source_url'):
+                        urls.add(row['source_url'])
+                ROWS_SCANNED.labels(operation='source_url_index_rebuild').inc(row_count)
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, mode='w', encoding='utf-8') as index_file:
+            for url in urls:
+                index_file.write(url + '\n')
+        os.replace(temp_path, self.index_path)
+        self._write_meta(csv_state)
+        return urls
+
+    def load(self):
+        """
+        Returns the set of source URLs in the CSV, rebuilding the index if it is missing or stale.
+        """
+        csv_state = self.csv_state()
+        with self._cache_lock:
+            cached = self._cache.get(self.index_path)
+            if cached is not None and cached[0] == csv_state:
+                return cached[1]
+
+            if self._read_meta() == csv_state and os.path.exists(self.index_path):
+                with open(self.index_path, mode='r', encoding='utf-8') as index_file:
+                    urls = {line.rstrip('\n') for line in index_file if line.strip()}
+            else:
+                logger.info("Rebuilding source_url index", path=self.csv_filepath)
+                urls = self._rebuild(csv_state)
+            self._cache[self.index_path] = (csv_state, urls)
+            return urls
+
+    def record_append(self, csv_state_before, source_urls):
+        """
+        Adds the URLs of rows just appended to the CSV. If the index did not match
+        the CSV as it was before the append, it is left stale to be rebuilt on the next load.
+        """
+        csv_state_after = self.csv_state()
+        with self._cache_lock:
+            if self._read_meta() != csv_state_before or not os.path.exists(self.index_path):
+                self._cache.pop(self.index_path, None)
+                return
+            new_urls = [url for url in source_urls if url]
+            with open(self.index_path, mode='a', encoding='utf-8') as index_file:
+                for url in new_urls:
+                    index_file.write(url + '\n')
+            self._write_meta(csv_state_after)
+            cached = self._cache.get(self.index_path)
+            if cached is not None and cached[0] == csv_state_before:
+                cached[1].update(new_urls)
+                self._cache[self.index_path] = (csv_state_after, cached[1])
+            else:
+                self._cache.pop(self.index_path, None)
+
+    def record_rewrite(self, csv_state_before):
+        """
+        Marks the index as current after a rewrite that did not change any source
+        URLs (e.g. filling in coordinates), so it does not need a rebuild.
+        """
+        csv_state_after = self.csv_state()
+        with self._cache_lock:
+            if self._read_meta() != csv_state_before:
+                return
+            self._write_meta(csv_state_after)
+            cached = self._cache.get(self.index_path)
+            if cached is not None and cached[0] == csv_state_before:
+                self._cache[self.index_path] = (csv_state_after, cached[1])
+
+
+class CsvIncidentRepository(IncidentRepository):
+    """
+    Incidents stored in a CSV file with a CSV_FIELDNAMES header.
+
+    Queries are full passes over the file, except dedup checks, which use a
+    persistent SourceUrlIndex. Rows are keyed by their position.
+
+    A CSV cannot be entered at a row position, so iter_missing_coordinates
+    remembers the byte offset at which it stopped (see scan_bookmark). A scan
+    starting at or after that row seeks there instead of parsing every row
+    before it. The bookmark holds for as long as the file is only appended to,
+    and update_coordinates carries it over to the file it writes.
+
+    The scan also remembers where the earliest row it yielded begins (the
+    rewrite anchor). update_coordinates copies the bytes before it unchanged,
+    in blocks, and only parses and re-encodes the rows from there on. The file
+    is still rewritten as a whole, which is cheap for the prefix but not free;
+    for millions of rows, SqliteIncidentRepository updates rows in place.
+    """
+
+    def __init__(self, csv_filepath):
+        self.path = csv_filepath
+        self.source_url_index = SourceUrlIndex(csv_filepath)
+        # {"inode", "size", "position", "offset"}: row position begins at byte
+        # offset of the file with that inode, as long as it is at least size bytes long.
+        self._scan_bookmark = None
+        # Same shape; position is the earliest row yielded since the last update_coordinates.
+        self._rewrite_anchor = None
+
+    def signature(self):
+        # os.replace (used by update_coordinates) changes the inode, appends change size/mtime.
+        stat_result = os.stat(self.path)
+        return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+    def iter_incidents(self):
+        try:
+            infile = open(self.path, mode='r', newline='', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with infile:
+            yield from csv.DictReader(infile)
+
+    def existing_source_urls(self, source_urls):
+        # Under the lock, as a stale index is rebuilt (and its sidecar files rewritten) on load.
+        with self.write_lock:
+            known_urls = self.source_url_index.load()
+        return {url for url in source_urls if url in known_urls}
+
+    def add_incidents(self, incidents):
+        if not incidents:
+            return 0
+        with self.write_lock:
+            # Another worker may have stored some of these since the caller's dedup check.
+            known_urls = self.source_url_index.load()
+            rows = []
+            for incident in incidents:
+                source_url = incident.get('source_url')
+                if source_url and source_url in known_urls:
+                    continue
+                rows.append(_stored_row(incident))
+            if not rows:
+                return 0
+
+            signature_before = self._signature_or_none()
+            csv_state_before = self.source_url_index.csv_state()
+            # Check if file exists and is empty to determine if header needs to be written
+            write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            # Ensure parent directory exists
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with open(self.path, mode='a', newline='', encoding='utf-8') as outfile:
+                writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(rows)
+            ROWS_WRITTEN.labels(operation='append').inc(len(rows))
+            self.source_url_index.record_append(csv_state_before, [row['source_url'] for row in rows])
+            publish_snapshot(self, signature_before, appended=rows)
+            return len(rows)
+
+    def scan_bookmark(self):
+        return dict(self._scan_bookmark) if self._scan_bookmark is not None else None
+
+    def restore_scan_bookmark(self, bookmark):
+        self._scan_bookmark = dict(bookmark) if bookmark else None
+
+    @staticmethod
+    def _bookmark_matches(bookmark, stat_result):
+        return (bookmark is not None and bookmark['inode'] == stat_result.st_ino
+                and bookmark['size'] <= stat_result.st_size)
+
+    @staticmethod
+    def _starts_row(infile, header_length, offset, file_size):
+        # Only an offset right after a line break can be the start of a row.
+        if not header_length < offset <= file_size:
+            return False
+        infile.seek(offset - 1)
+        return infile.read(1) == b'\n'
+
+    def iter_missing_coordinates(self, start=None):
+        infile = open(self.path, mode='rb')
+        scanned = 0
+        with infile:
+            stat_result = os.fstat(infile.fileno())
+            header = infile.readline()
+            fieldnames = next(csv.reader([header.decode('utf-8')]), None)
+            if fieldnames is None:
+                return
+            position = 0
+            bookmark = self._scan_bookmark
+            if (start is not None and self._bookmark_matches(bookmark, stat_result) and bookmark['position'] <= start
+                    and self._starts_row(infile, len(header), bookmark['offset'], stat_result.st_size)):
+                position = bookmark['position']
+            else:
+                infile.seek(len(header))
+            offset = infile.tell()
+            row_start = offset
+
+            def lines():
+                # Counts the bytes read, so offset is where the next row begins.
+                nonlocal offset
+                for line in infile:
+                    offset += len(line)
+                    yield line.decode('utf-8')
+
+            try:
+                for position, incident in enumerate(csv.DictReader(lines(), fieldnames=fieldnames), position):
+                    # The reader pulls exactly the lines of one row, so row_start is where it began.
+                    scanned += 1
+                    incident_start, row_start = row_start, offset
+                    if start is not None and position < start:
+                        continue
+                    address = (incident.get('address_string') or '').strip()
+                    lat_present = (incident.get('latitude') or '').strip()
+                    lon_present = (incident.get('longitude') or '').strip()
+                    if address and (not lat_present or not lon_present):
+                        anchor = self._rewrite_anchor
+                        if not self._bookmark_matches(anchor, stat_result) or anchor['position'] > position:
+                            self._rewrite_anchor = {"inode": stat_result.st_ino, "size": stat_result.st_size,
+                                                    "position": position, "offset": incident_start}
+                        self._scan_bookmark = {"inode": stat_result.st_ino, "size": stat_result.st_size,
+                                               "position": position + 1, "offset": offset}
+                        yield position, incident
+            finally:
+                ROWS_SCANNED.labels(operation='missing_coordinates_scan').inc(scanned)
+
+    def update_coordinates(self, updates):
+        if not updates:
+            return 0
+        # Held from the read to the rename, so rows appended meanwhile are not lost.
+        with self.write_lock:
+            return self._update_coordinates(updates)
+
+    def _update_coordinates(self, updates):
+        signature_before = self.signature()
+        csv_state_before = self.source_url_index.csv_state()
+        patches = {}
+        row_count = 0
+        stat_result = os.stat(self.path)
+        bookmark = self._scan_bookmark if self._bookmark_matches(self._scan_bookmark, stat_result) else None
+        bookmark_offset = None
+
+        # Copy the file into a temporary file, changing the updated rows on the way,
+        # so memory use does not grow with the size of the file. The rows before
+        # the rewrite anchor are not updated and are copied as raw bytes; only the
+        # rows from there on are parsed and re-encoded.
+        temp_file_path = self.path + '.tmp'
+        try:
+            with open(self.path, mode='rb') as infile, open(temp_file_path, mode='wb') as outfile:
+                header = infile.readline()
+                fieldnames = next(csv.reader([header.decode('utf-8')]), None)
+                anchor = self._rewrite_anchor
+                if (fieldnames is not None and self._bookmark_matches(anchor, stat_result)
+                        and anchor['position'] <= min(updates)
+                        and self._starts_row(infile, len(header), anchor['offset'], stat_result.st_size)):
+                    start_position, start_offset = anchor['position'], anchor['offset']
+                else:
+                    start_position, start_offset = 0, len(header)
+                infile.seek(0)
+                remaining = start_offset
+                while remaining:
+                    block = infile.read(min(COPY_BLOCK_SIZE, remaining))
+                    outfile.write(block)
+                    remaining -= len(block)
+                if bookmark is not None and bookmark['position'] <= start_position:
+                    bookmark_offset = bookmark['offset'] if bookmark['position'] < start_position else start_offset
+
+                text_in = io.TextIOWrapper(infile, encoding='utf-8', newline='')
+                text_out = io.TextIOWrapper(outfile, encoding='utf-8', newline='')
+                reader = csv.DictReader(text_in, fieldnames=fieldnames)
+                writer = csv.DictWriter(text_out, fieldnames=fieldnames or CSV_FIELDNAMES)
+                for position, row in enumerate(reader, start_position):
+                    if bookmark is not None and position == bookmark['position']:
+                        text_out.flush()
+                        bookmark_offset = outfile.tell()
+                    coordinates = updates.get(position)
+                    if coordinates is not None:
+                        patches[position] = {'latitude': str(coordinates[0]), 'longitude': str(coordinates[1])}
+                        row.update(patches[position])
+                    writer.writerow(row)
+                    row_count += 1
+                text_out.flush()
+                if bookmark is not None and bookmark['position'] == start_position + row_count:
+                    bookmark_offset = outfile.tell()
+                # The wrappers would close the files they wrap; the with statement does that.
+                text_in.detach()
+                text_out.detach()
+            # Replace the original file with the temporary file
+            os.replace(temp_file_path, self.path)
+            # The prefix is unchanged, but every row of the old anchor's batch now has coordinates.
+            self._rewrite_anchor = None
+            if bookmark_offset is not None:
+                stat_result = os.stat(self.path)
+                self._scan_bookmark = dict(bookmark, inode=stat_result.st_ino, size=stat_result.st_size,
+                                           offset=bookmark_offset)
+            # The rows from the anchor on are read and rewritten to change len(patches) rows.
+            ROWS_SCANNED.labels(operation='coordinate_update').inc(row_count)
+            ROWS_WRITTEN.labels(operation='coordinate_update').inc(row_count)
+        except Exception:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path) # Clean up temp file on error
+            raise
+        # Only coordinates changed, so the source_url index is still accurate.
+        self.source_url_index.record_rewrite(csv_state_before)
+        publish_snapshot(self, signature_before, patches=patches)
+        return len(patches)
+
+
+class SqliteIncidentRepository(IncidentRepository):
+    """
+    Incidents stored in an SQLite database in WAL mode, so readers never block
+    the writer. source_url has a unique index (empty URLs are stored as NULL and
+    do not collide), and post_date and the coordinates are indexed, which turns
+    dedup checks, coordinate backfills and filters into index lookups.
+
+    The database is created by the first add_incidents (or by
+    migrate_csv_to_sqlite); until then every read raises FileNotFoundError.
+    """
+
+    def __init__(self, db_path):
+        # Nothing is created here: opening a mistyped path to read from it must
+        # fail rather than leave an empty database behind. Writers call create_schema.
+        self.path = db_path
+        self._schema_ready = False
+
+    def create_schema(self):
+        """
+        Creates the database file, its directory and the incidents table and
+        indexes if they do not exist yet. Called by add_incidents and by
+        migrate_csv_to_sqlite; safe to call repeatedly.
+        """
+        if self._schema_ready:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS incidents ("
+                    " rowid INTEGER PRIMARY KEY,"
+                    " id TEXT NOT NULL DEFAULT '',"
+                    " title TEXT NOT NULL DEFAULT '',"
+                    " post_date TEXT NOT NULL DEFAULT '',"
+                    " incident_time_approx TEXT NOT NULL DEFAULT '',"
+                    " address_string TEXT NOT NULL DEFAULT '',"
+                    " latitude REAL,"
+                    " longitude REAL,"
+                    " summary_text TEXT NOT NULL DEFAULT '',"
+                    " source_url TEXT)"
+                )
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS incidents_source_url ON incidents (source_url)")
+                conn.execute("CREATE INDEX IF NOT EXISTS incidents_post_date ON incidents (post_date)")
+                conn.execute("CREATE INDEX IF NOT EXISTS incidents_coordinates ON incidents (latitude, longitude)")
+        finally:
+            conn.close()
+        self._schema_ready = True
+
+    def _connect(self):
+        # A short-lived connection per operation keeps the repository safe to share
+        # between Flask request threads. sqlite3.connect would create a missing
+        # file, so that is checked first.
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(errno.ENOENT, "No such incident database", self.path)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _row_to_incident(row):
+        incident = {}
+        for field, value in zip(CSV_FIELDNAMES, row):
+            incident[field] = '' if value is None else str(value)
+        return incident
+
+    @staticmethod
+    def _coordinate(value):
+        try:
+            return float(value) if value not in (None, '') else None
+        except ValueError:
+            return None
+
+    def _select(self, where='', params=()):
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(CSV_FIELDNAMES)} FROM incidents {where} ORDER BY rowid", params
+            )
+            for row in cursor:
+                yield self._row_to_incident(row)
+        finally:
+            conn.close()
+
+    def signature(self):
+        # Committed WAL transactions grow the -wal file; checkpoints rewrite the main file.
+        stat_result = os.stat(self.path)
+        try:
+            wal_stat = os.stat(self.path + '-wal')
+            wal_signature = (wal_stat.st_mtime_ns, wal_stat.st_size)
+        except FileNotFoundError:
+            wal_signature = None
+        return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size, wal_signature)
+
+    def iter_incidents(self):
+        return self._select()
+
+    def count(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+        finally:
+            conn.close()
+
+    def existing_source_urls(self, source_urls):
+        wanted = [url for url in set(source_urls) if url]
+        found = set()
+        if not os.path.exists(self.path):
+            # Nothing is stored yet; the dedup check before the first add_incidents.
+            return found
+        conn = self._connect()
+        try:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                for (url,) in conn.execute(
+                        f"SELECT source_url FROM incidents WHERE source_url IN ({placeholders})", chunk):
+                    found.add(url)
+        finally:
+            conn.close()
+        return found
+
+    def add_incidents(self, incidents):
+        rows = [
+            (
+                incident.get('id') or '', incident.get('title') or '', normalize_post_date(incident.get('post_date')),
+                incident.get('incident_time_approx') or '', incident.get('address_string') or '',
+                self._coordinate(incident.get('latitude')), self._coordinate(incident.get('longitude')),
+                incident.get('summary_text') or '', incident.get('source_url') or None,
+            )
+            for incident in incidents
+        ]
+        if not rows:
+            return 0
+        with self.write_lock:
+            signature_before = self._signature_or_none()
+            self.create_schema()
+            conn = self._connect()
+            try:
+                with conn:
+                    max_rowid_before = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM incidents").fetchone()[0]
+                    before = conn.total_changes
+                    # The unique index makes this a no-op for URLs that are already stored.
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO incidents ({', '.join(CSV_FIELDNAMES)}) VALUES ({', '.join('?' * len(CSV_FIELDNAMES))})",
+                        rows,
+                    )
+                    inserted = conn.total_changes - before
+                ROWS_WRITTEN.labels(operation='append').inc(inserted)
+            finally:
+                conn.close()
+            if inserted:
+                # New rows get rowids above every existing one, so they come last in
+                # storage order and can be appended to the snapshot as they are.
+                appended = list(self._select("WHERE rowid > ?", (max_rowid_before,)))
+                publish_snapshot(self, signature_before, appended=appended)
+            return inserted
+
+    def iter_missing_coordinates(self, start=None):
+        conn = self._connect()
+        scanned = 0
+        try:
+            cursor = conn.execute(
+                f"SELECT rowid, {', '.join(CSV_FIELDNAMES)} FROM incidents"
+                " WHERE rowid >= ? AND address_string != '' AND (latitude IS NULL OR longitude IS NULL) ORDER BY rowid",
+                (start or 0,),
+            )
+            for row in cursor:
+                scanned += 1
+                yield row[0], self._row_to_incident(row[1:])
+        finally:
+            ROWS_SCANNED.labels(operation='missing_coordinates_scan').inc(scanned)
+            conn.close()
+
+    def update_coordinates(self, updates):
+        if not updates:
+            return 0
+        with self.write_lock:
+            signature_before = self._signature_or_none()
+            conn = self._connect()
+            try:
+                with conn:
+                    before = conn.total_changes
+                    conn.executemany(
+                        "UPDATE incidents SET latitude = ?, longitude = ? WHERE rowid = ?",
+                        [(float(lat), float(lon), rowid) for rowid, (lat, lon) in updates.items()],
+                    )
+                    changed = conn.total_changes - before
+                    row_count, max_rowid = conn.execute(
+                        "SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM incidents").fetchone()
+                ROWS_WRITTEN.labels(operation='coordinate_update').inc(changed)
+            finally:
+                conn.close()
+            if changed:
+                if row_count == max_rowid:
+                    # Rows are never deleted, so rowids run from 1 to row_count and
+                    # the row with rowid r is at position r - 1 of the snapshot.
+                    patches = {
+                        rowid - 1: {'latitude': str(float(lat)), 'longitude': str(float(lon))}
+                        for rowid, (lat, lon) in updates.items() if 1 <= rowid <= max_rowid
+                    }
+                    publish_snapshot(self, signature_before, patches=patches)
+                else:
+                    publish_snapshot(self)
+            return changed
+
+    def find_incidents(self, bbox=None, since=None, until=None):
+        clauses = []
+        params = []
+        if since is not None:
+            clauses.append("post_date >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("post_date <= ?")
+            params.append(until)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            clauses.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return list(self._select(where, params))
@@ -0,0 +1,277 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds, as used by the Prometheus client libraries.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+# Pipeline stages can take minutes (geocoding is rate limited to 1 request/s).
+PIPELINE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    """
+    Base class for a metric family: one metric name with a fixed set of label
+    names and one child per combination of label values.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labelvalues):
+        """
+        Returns the child for these label values, creating it on first use.
+        """
+        key = tuple(str(labelvalues[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default_child(self):
+        # Metrics without labels have a single child.
+        return self.labels()
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in children]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Makes the gauge report function() at scrape time instead of a stored value.
+        """
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def set_function(self, function):
+        self._default_child().set_function(function)
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            try:
+                value = child.get()
+            except Exception:
+                continue # A failing callback just leaves the sample out of this scrape.
+            if value is not None:
+                samples.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return samples
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last slot is +Inf.
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Context manager observing the wall-clock duration of its block.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+
+class Registry:
+    """
+    The set of metrics exposed by one process.
+
+    Metrics live in process memory, so with several server worker processes
+    each one reports its own numbers (scrape them individually).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- Metrics shared by the web app, the RSS pipeline and the geocoder ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'incident_map_http_request_duration_seconds',
+    'Time to produce a response (streamed bodies are timed until the first byte is ready).',
+    ['method', 'route', 'status'])
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    'incident_map_pipeline_stage_duration_seconds',
+    'Duration of each stage of the fetch and geocoding pipelines.',
+    ['pipeline', 'stage'], buckets=PIPELINE_BUCKETS)
+
+GEOCODER_REQUESTS = Counter(
+    'incident_map_geocoder_requests_total',
+    'Geocoder backend calls by outcome (found, not_found, timeout, transient_error, error).',
+    ['outcome'])
+
+GEOCODE_CACHE_LOOKUPS = Counter(
+    'incident_map_geocode_cache_lookups_total',
+    'Geocode cache lookups by result (hit or miss).',
+    ['result'])
+
+ROWS_SCANNED = Counter(
+    'incident_map_rows_scanned_total',
+    'Incident rows read or checked, by operation.',
+    ['operation'])
+
+ROWS_WRITTEN = Counter(
+    'incident_map_rows_written_total',
+    'Incident rows written, by operation.',
+    ['operation'])
+
+DATASET_ROWS = Gauge(
+    'incident_map_dataset_rows',
+    'Incidents in the dataset served by the web app, in total and with coordinates.',
+    ['kind'])
+
+
+@contextmanager
+def time_stage(pipeline, stage):
+    """
+    Times a block as one stage of a pipeline, e.g. time_stage('fetch', 'parse').
+    """
+    with PIPELINE_STAGE_SECONDS.labels(pipeline=pipeline, stage=stage).time():
+        yield
+
+
+def render_metrics():
+    return REGISTRY.render()
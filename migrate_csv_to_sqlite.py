@@ -0,0 +1,60 @@
+import argparse
+
+from incident_repository import CsvIncidentRepository, SqliteIncidentRepository, resolve_data_path
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+# Default source and destination, relative to the project root.
+DEFAULT_CSV_FILE_PATH = 'data/incidents.csv'
+DEFAULT_SQLITE_FILE_PATH = 'data/incidents.sqlite3'
+
+# Rows are inserted in batches so huge CSVs never have to fit in memory.
+BATCH_SIZE = 5000
+
+
+def migrate_csv_to_sqlite(csv_filepath, sqlite_filepath):
+    """
+    Copies every incident from a CSV file into an SQLite incident database.
+
+    Safe to re-run: rows whose source_url is already in the database are skipped
+    by its unique index.
+
+    Args:
+        csv_filepath (str): The CSV file to read.
+        sqlite_filepath (str): The SQLite database to create or extend.
+
+    Returns:
+        tuple: (read_count, inserted_count)
+    """
+    source = CsvIncidentRepository(resolve_data_path(csv_filepath))
+    destination = SqliteIncidentRepository(resolve_data_path(sqlite_filepath))
+    # Created up front, so that even an empty CSV leaves a database to serve from.
+    destination.create_schema()
+
+    read_count = 0
+    inserted_count = 0
+    batch = []
+    for incident in source.iter_incidents():
+        read_count += 1
+        batch.append(incident)
+        if len(batch) >= BATCH_SIZE:
+            inserted_count += destination.add_incidents(batch)
+            batch = []
+    inserted_count += destination.add_incidents(batch)
+
+    # Rows not inserted were skipped because their source_url was already present.
+    logger.info("Migration complete", source=source.path, destination=destination.path,
+                read=read_count, inserted=inserted_count, skipped=read_count - inserted_count)
+    return read_count, inserted_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="One-shot migration of the incidents CSV into an SQLite database.")
+    parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV_FILE_PATH,
+                        help=f"CSV file to read (default: {DEFAULT_CSV_FILE_PATH})")
+    parser.add_argument('sqlite_path', nargs='?', default=DEFAULT_SQLITE_FILE_PATH,
+                        help=f"SQLite database to write (default: {DEFAULT_SQLITE_FILE_PATH})")
+    args = parser.parse_args()
+    configure_logging()
+    migrate_csv_to_sqlite(args.csv_path, args.sqlite_path)
@@ -0,0 +1,429 @@
+import array
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+from metrics import ROWS_SCANNED, ROWS_WRITTEN
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# The snapshot of data/incidents.csv is named by the pointer file
+# data/incidents.csv.snapshot, which holds the current version v; the snapshot
+# itself is data/incidents.csv.snapshot.<v>.
+SNAPSHOT_SUFFIX = '.snapshot'
+MAGIC = b'UWINCSN1'
+# magic, dataset version, row count, JSON offset, JSON length, boundaries offset, meta offset, meta length
+HEADER = struct.Struct('<8sQQQQQQQ')
+# Number of dataset versions whose changed rows are remembered, i.e. how far
+# back /api/incidents?since_version= can answer with a delta.
+MAX_CHANGE_LOG_VERSIONS = 256
+# Unchanged rows are copied from the previous snapshot in blocks of this size.
+COPY_CHUNK_BYTES = 1 << 20
+# Attempts at replacing the pointer file while a reader has it open (Windows).
+POINTER_REPLACE_ATTEMPTS = 20
+
+
+def snapshot_path_for(data_path):
+    # The pointer file; see SNAPSHOT_SUFFIX.
+    return data_path + SNAPSHOT_SUFFIX
+
+
+def _version_path(pointer_path, version):
+    return f"{pointer_path}.{version}"
+
+
+def _read_pointer(pointer_path):
+    # Returns the version the pointer file names, or None if it is missing or unreadable.
+    try:
+        with open(pointer_path, 'rb') as pointer_file:
+            return int(pointer_file.read(32))
+    except (FileNotFoundError, PermissionError, ValueError):
+        return None
+
+
+def _write_pointer(pointer_path, version):
+    directory = os.path.dirname(os.path.abspath(pointer_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(pointer_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as pointer_file:
+            pointer_file.write(str(version).encode('ascii'))
+            pointer_file.flush()
+            os.fsync(pointer_file.fileno())
+        for attempt in range(POINTER_REPLACE_ATTEMPTS):
+            try:
+                os.replace(temp_path, pointer_path)
+                break
+            except PermissionError:
+                # On Windows a file cannot be replaced while it is open; readers
+                # only hold the pointer for as long as it takes to read it.
+                if attempt == POINTER_REPLACE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.01)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _remove_old_versions(pointer_path, current_version):
+    # Deletes every snapshot version but the current one. On POSIX a mapping
+    # outlives the file's name; on Windows a file that some process still has
+    # mapped cannot be deleted, and is left for a later publish to remove.
+    for path in glob.glob(glob.escape(pointer_path) + '.*'):
+        suffix = path[len(pointer_path) + 1:]
+        if not suffix.isdigit() or int(suffix) == current_version:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def normalize_signature(signature):
+    """
+    Returns a repository signature in the form it has after a round trip through
+    the snapshot's JSON metadata (tuples become lists), so the two compare equal.
+    """
+    return json.loads(json.dumps(signature))
+
+
+def encode_row(incident):
+    return json.dumps(incident, separators=(',', ':')).encode('utf-8')
+
+
+def _position_ranges(positions):
+    # [3, 4, 5, 9] -> [[3, 6], [9, 10]]
+    ranges = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] = position + 1
+        else:
+            ranges.append([position, position + 1])
+    return ranges
+
+
+class MappedSnapshot:
+    """
+    A snapshot file, memory-mapped read-only.
+
+    The file holds every incident as one JSON array, followed by the offset of
+    each row in it and a JSON metadata block:
+
+        header | [row0,row1,...] | row boundaries (uint64) | metadata
+
+    Every process maps the same file, so the operating system keeps one copy of
+    the data in its page cache however many workers serve it. The full
+    /api/incidents body is a slice of the mapping, and a row is decoded only
+    when it is read.
+
+    Writers never modify or replace a snapshot file; each version is written
+    to a file of its own, and a small pointer file names the current one (see
+    SNAPSHOT_SUFFIX). A mapping stays valid, on its version, for as long as it
+    is open, and no file is ever renamed over one that is mapped, which
+    Windows would refuse.
+    """
+
+    def __init__(self, path):
+        """
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If the file is not a snapshot this code can read.
+        """
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.version, self.row_count, json_offset, json_length,
+             boundaries_offset, meta_offset, meta_length) = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an incident snapshot")
+            meta = json.loads(self._mmap[meta_offset:meta_offset + meta_length])
+            if meta.get('byteorder') != sys.byteorder:
+                raise ValueError(f"{path} was written on a machine with a different byte order")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise ValueError(f"{path} is not a readable incident snapshot") from None
+
+        self._view = memoryview(self._mmap)
+        self.json_body = self._view[json_offset:json_offset + json_length]
+        # boundaries[i] is where row i starts; row i ends one byte (',' or ']') before boundaries[i + 1].
+        self._boundaries_view = self._view[boundaries_offset:boundaries_offset + 8 * (self.row_count + 1)]
+        self.boundaries = self._boundaries_view.cast('Q')
+        self.source_signature = meta['source_signature']
+        self.content_hash = meta['content_hash']
+        self.change_log = [(version, ranges) for version, ranges in meta['change_log']]
+        self.change_log_base = meta['change_log_base']
+        self.created = datetime.fromisoformat(meta['created'])
+        self.incidents = MappedIncidents(self)
+
+    def raw_row(self, position):
+        """
+        Returns the JSON encoding of one row, as bytes.
+        """
+        return self._mmap[self.boundaries[position]:self.boundaries[position + 1] - 1]
+
+    def changed_positions(self, since_version):
+        """
+        Returns the sorted positions of the rows appended or changed after
+        since_version, or None if the change log does not reach back that far.
+        """
+        if since_version == self.version:
+            return []
+        if since_version < self.change_log_base or since_version > self.version:
+            return None
+        positions = set()
+        for version, ranges in self.change_log:
+            if version > since_version:
+                for start, end in ranges:
+                    positions.update(range(start, end))
+        return sorted(positions)
+
+    def close(self):
+        """
+        Unmaps the file. Only for snapshots nothing else refers to any more.
+        """
+        self.boundaries.release()
+        self._boundaries_view.release()
+        self.json_body.release()
+        self._view.release()
+        self._mmap.close()
+
+
+class MappedIncidents(Sequence):
+    """
+    The rows of a MappedSnapshot as a read-only sequence of incident
+    dictionaries, decoded from the mapping on every access.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return self._snapshot.row_count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[index] for index in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("incident position out of range")
+        return json.loads(self._snapshot.raw_row(position))
+
+    def raw_json(self, position):
+        """
+        Returns the JSON encoding of one row without decoding it.
+        """
+        return self._snapshot.raw_row(position)
+
+
+def open_snapshot(pointer_path):
+    """
+    Maps the snapshot version the pointer file names, or returns None if there
+    is none or it is unreadable.
+    """
+    version = _read_pointer(pointer_path)
+    while version is not None:
+        try:
+            return MappedSnapshot(_version_path(pointer_path, version))
+        except FileNotFoundError:
+            # A writer published a newer version and removed this one since the
+            # pointer was read; follow the pointer again.
+            current = _read_pointer(pointer_path)
+            if current == version:
+                return None
+            version = current
+        except ValueError:
+            return None
+    return None
+
+
+class _SnapshotWriter:
+    # Writes a snapshot version to a temporary path; finish() renames it to the
+    # version's file, which does not exist yet, and points the pointer file at it.
+
+    def __init__(self, pointer_path, version):
+        self.pointer_path = pointer_path
+        self.version = version
+        self.path = _version_path(pointer_path, version)
+        self.temp_path = self.path + '.tmp'
+        self.file = open(self.temp_path, 'wb')
+        self.file.write(b'\0' * HEADER.size)
+        self.offset = HEADER.size
+        self.boundaries = array.array('Q')
+        self.hasher = hashlib.sha1()
+        self.row_count = 0
+        self._write(b'[')
+
+    def _write(self, data):
+        self.file.write(data)
+        self.hasher.update(data)
+        self.offset += len(data)
+
+    def add_row(self, row_bytes):
+        if self.row_count:
+            self._write(b',')
+        self.boundaries.append(self.offset)
+        self._write(row_bytes)
+        self.row_count += 1
+
+    def add_rows_from(self, snapshot, start, end):
+        # Copies rows start..end-1 of another snapshot, with their separators, as blocks of bytes.
+        if start >= end:
+            return
+        if self.row_count:
+            self._write(b',')
+        shift = self.offset - snapshot.boundaries[start]
+        self.boundaries.extend(boundary + shift for boundary in snapshot.boundaries[start:end])
+        block_start = snapshot.boundaries[start]
+        block_end = snapshot.boundaries[end] - 1
+        for chunk_start in range(block_start, block_end, COPY_CHUNK_BYTES):
+            self._write(snapshot._view[chunk_start:min(chunk_start + COPY_CHUNK_BYTES, block_end)])
+        self.row_count += end - start
+
+    def finish(self, source_signature, change_log, change_log_base):
+        self._write(b']')
+        json_length = self.offset - HEADER.size
+        self.boundaries.append(self.offset)
+
+        padding = -self.offset % 8 # Keep the uint64 array aligned.
+        self.file.write(b'\0' * padding)
+        boundaries_offset = self.offset + padding
+        self.file.write(self.boundaries.tobytes())
+        meta_offset = boundaries_offset + 8 * len(self.boundaries)
+        meta = json.dumps({
+            "source_signature": source_signature,
+            "content_hash": self.hasher.hexdigest(),
+            "change_log": change_log,
+            "change_log_base": change_log_base,
+            "created": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+            "byteorder": sys.byteorder,
+        }).encode('utf-8')
+        self.file.write(meta)
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.version, self.row_count, HEADER.size, json_length,
+                                    boundaries_offset, meta_offset, len(meta)))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+        _write_pointer(self.pointer_path, self.version)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def publish_snapshot(repository, signature_before=None, appended=(), patches=None):
+    """
+    Writes a new snapshot of a repository after its data changed. Must be called
+    with the repository's write_lock held, right after the write.
+
+    If the current snapshot matches the data as it was before the write
+    (signature_before), the new one is assembled from it: unchanged rows are
+    copied as bytes and only appended or patched rows are encoded, and the
+    change is recorded in the change log. Otherwise, or without signature_before,
+    every row is read from the repository and the change log starts over.
+
+    Args:
+        repository (IncidentRepository): The repository that was written to.
+        signature_before: repository.signature() from before the write.
+        appended (list): Rows appended by the write, as they are now stored.
+        patches (dict, optional): Maps positions of rows changed in place to {field: new value}.
+
+    Returns:
+        int: The new dataset version.
+    """
+    path = snapshot_path_for(repository.path)
+    previous = open_snapshot(path)
+    try:
+        # Versions are milliseconds since the epoch, or one more than the previous
+        # version, so they keep increasing even if the snapshot file is deleted.
+        version = max(previous.version + 1 if previous is not None else 0, int(time.time() * 1000))
+        reuse = (previous is not None and signature_before is not None
+                 and previous.source_signature == normalize_signature(signature_before))
+
+        writer = _SnapshotWriter(path, version)
+        try:
+            if reuse:
+                patches = patches or {}
+                patched = sorted(position for position in patches if position < previous.row_count)
+                start = 0
+                for position in patched:
+                    writer.add_rows_from(previous, start, position)
+                    incident = previous.incidents[position]
+                    incident.update(patches[position])
+                    writer.add_row(encode_row(incident))
+                    start = position + 1
+                writer.add_rows_from(previous, start, previous.row_count)
+                for incident in appended:
+                    writer.add_row(encode_row(incident))
+                ROWS_WRITTEN.labels(operation='snapshot_update').inc(len(patched) + len(appended))
+
+                changed = _position_ranges(patched)
+                if writer.row_count > previous.row_count:
+                    changed.append([previous.row_count, writer.row_count])
+                change_log = [[logged_version, ranges] for logged_version, ranges in previous.change_log]
+                change_log.append([version, changed])
+                change_log_base = previous.change_log_base
+                if len(change_log) > MAX_CHANGE_LOG_VERSIONS:
+                    # Deltas can still start at the newest version that is dropped.
+                    change_log_base = change_log[-MAX_CHANGE_LOG_VERSIONS - 1][0]
+                    change_log = change_log[-MAX_CHANGE_LOG_VERSIONS:]
+            else:
+                for incident in repository.iter_incidents():
+                    writer.add_row(encode_row(incident))
+                ROWS_SCANNED.labels(operation='snapshot_rebuild').inc(writer.row_count)
+                change_log, change_log_base = [], version
+            writer.finish(normalize_signature(repository.signature()), change_log, change_log_base)
+        except BaseException:
+            writer.abort()
+            raise
+    finally:
+        if previous is not None:
+            previous.close()
+    # After closing the previous version, so that it can be removed on Windows too.
+    _remove_old_versions(path, version)
+    return version
+
+
+def load_shared_snapshot(repository):
+    """
+    Returns a MappedSnapshot of the repository's current contents. If the
+    snapshot file is missing or does not match the data (e.g. the CSV was edited
+    by hand), it is rebuilt first, under the write lock, by whichever process
+    gets there first.
+
+    Raises:
+        FileNotFoundError: If the data file does not exist.
+    """
+    path = snapshot_path_for(repository.path)
+    signature = normalize_signature(repository.signature())
+    snapshot = open_snapshot(path)
+    if snapshot is not None and snapshot.source_signature == signature:
+        return snapshot
+    if snapshot is not None:
+        snapshot.close()
+
+    with repository.write_lock:
+        # Another process may have rebuilt it while we were waiting for the lock.
+        signature = normalize_signature(repository.signature())
+        snapshot = open_snapshot(path)
+        if snapshot is not None and snapshot.source_signature == signature:
+            return snapshot
+        if snapshot is not None:
+            snapshot.close()
+        logger.info("Rebuilding shared snapshot", path=path)
+        version = publish_snapshot(repository)
+        return MappedSnapshot(_version_path(path, version))
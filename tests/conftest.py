@@ -0,0 +1,46 @@
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import main
+from app.incident_store import IncidentStore
+from incident_repository import CSV_FIELDNAMES, CsvIncidentRepository
+
+
+def make_incident(number, geocoded=True, with_id=True):
+    """
+    Returns a stored incident row; rows appended from RSS have no id and get a "row-<n>" ref.
+    """
+    return {
+        "id": f"inc-{number}" if with_id else '',
+        "title": f"Incident {number}",
+        "post_date": f"2024-07-{number % 28 + 1:02d}",
+        "incident_time_approx": '',
+        "address_string": f"{4000 + number} 15th Ave NE",
+        "latitude": f"{47.65 + number / 10000:.6f}" if geocoded else '',
+        "longitude": f"{-122.31 + number / 10000:.6f}" if geocoded else '',
+        "summary_text": f"Summary {number}",
+        "source_url": f"http://feeds.test/{number}",
+    }
+
+
+@pytest.fixture
+def repository(tmp_path):
+    path = str(tmp_path / 'incidents.csv')
+    with open(path, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(make_incident(number, geocoded=number % 4 != 3, with_id=number % 5 != 4)
+                         for number in range(20))
+    return CsvIncidentRepository(path)
+
+
+@pytest.fixture
+def client(monkeypatch, repository):
+    # Serves the repository fixture instead of data/incidents.csv.
+    monkeypatch.setattr(main, 'incident_store', IncidentStore(repository))
+    return main.app.test_client()
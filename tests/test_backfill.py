@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+
+import pytest
+from conftest import make_incident
+
+from geocode_incidents import CHECKPOINT_SUFFIX, backfill_coordinates
+from geocoding_engine import GeocodingEngine, OfflineGeocoderBackend
+from incident_repository import CSV_FIELDNAMES
+from metrics import ROWS_SCANNED
+
+ROWS = 30
+
+
+class InterruptingBackend(OfflineGeocoderBackend):
+    # Stands in for Ctrl-C arriving during the lookup after `limit` successful ones.
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def geocode(self, address):
+        if self.calls >= self.limit:
+            raise KeyboardInterrupt
+        return super().geocode(address)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'incidents.csv')
+    with open(path, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(make_incident(number, geocoded=False) for number in range(ROWS))
+    return path
+
+
+def _engine(backend):
+    return GeocodingEngine(backend, rate_limit_per_second=1000, max_workers=1)
+
+
+def _geocoded_ids(csv_path):
+    with open(csv_path, newline='', encoding='utf-8') as infile:
+        return [row['id'] for row in csv.DictReader(infile) if row['latitude']]
+
+
+def test_interrupted_backfill_resumes_after_the_last_written_chunk(csv_path):
+    checkpoint_path = csv_path + CHECKPOINT_SUFFIX
+    # Chunks of 4 rows, written 2 chunks at a time: rows 0-7 are written, rows 8-11
+    # are geocoded but not written when the lookup of row 12 is interrupted.
+    with pytest.raises(KeyboardInterrupt):
+        backfill_coordinates(csv_path, chunk_size=4, chunks_per_write=2, engine=_engine(InterruptingBackend(12)))
+
+    assert _geocoded_ids(csv_path) == [f"inc-{number}" for number in range(8)]
+    with open(checkpoint_path, encoding='utf-8') as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    assert checkpoint['next_key'] == 8
+    assert (checkpoint['processed'], checkpoint['updated']) == (8, 8)
+    # The bookmark is the byte offset at which row 8 starts.
+    bookmark = checkpoint['scan_bookmark']
+    assert bookmark['position'] == 8
+    with open(csv_path, 'rb') as infile:
+        infile.seek(bookmark['offset'])
+        assert infile.readline().startswith(b'inc-8,')
+
+    backend = OfflineGeocoderBackend()
+    scanned = ROWS_SCANNED.labels(operation='missing_coordinates_scan')
+    scanned_before = scanned.value
+    assert backfill_coordinates(csv_path, chunk_size=4, chunks_per_write=2, engine=_engine(backend)) == (ROWS, ROWS)
+
+    assert backend.calls == ROWS - 8
+    # Each remaining row is parsed once to count it and once in its chunk; the
+    # rows before the bookmark are never read again.
+    assert scanned.value - scanned_before <= 2 * (ROWS - 8)
+    assert _geocoded_ids(csv_path) == [f"inc-{number}" for number in range(ROWS)]
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_restart_ignores_the_checkpoint(csv_path):
+    with pytest.raises(KeyboardInterrupt):
+        backfill_coordinates(csv_path, chunk_size=4, chunks_per_write=1, engine=_engine(InterruptingBackend(4)))
+
+    backend = OfflineGeocoderBackend()
+    processed, _ = backfill_coordinates(csv_path, chunk_size=4, restart=True, engine=_engine(backend))
+
+    # Rows 0-3 already have coordinates, so only the rest is looked up, but the
+    # counts no longer include the interrupted run.
+    assert processed == backend.calls == ROWS - 4
+
+
+def test_missing_data_file_is_an_error_not_an_empty_backfill(tmp_path):
+    path = str(tmp_path / 'missing.csv')
+    backend = OfflineGeocoderBackend()
+
+    assert backfill_coordinates(path, engine=_engine(backend)) == (0, 0)
+    assert backend.calls == 0
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + CHECKPOINT_SUFFIX)
@@ -0,0 +1,70 @@
+import shared_snapshot
+from conftest import make_incident
+
+
+def _version(client):
+    return int(client.get("/api/incidents").headers['X-Dataset-Version'])
+
+
+def _delta(client, since_version, query=''):
+    response = client.get(f"/api/incidents?since_version={since_version}{query}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_delta_at_the_current_version_is_empty(client):
+    version = _version(client)
+
+    assert _delta(client, version) == {"version": version, "reset": False, "incidents": [], "refs": []}
+
+
+def test_delta_holds_appended_and_geocoded_rows(client, repository):
+    version = _version(client)
+    repository.add_incidents([make_incident(20), make_incident(21, with_id=False)])
+    repository.update_coordinates({3: (47.66, -122.3)})
+
+    delta = _delta(client, version)
+
+    assert delta["reset"] is False
+    assert delta["version"] == _version(client) > version
+    assert [incident["title"] for incident in delta["incidents"]] == ["Incident 3", "Incident 20", "Incident 21"]
+    assert delta["incidents"][0]["latitude"] == "47.66"
+    assert delta["refs"] == ["inc-3", "inc-20", "row-21"]
+
+
+def test_delta_is_filtered_like_the_full_list(client, repository):
+    version = _version(client)
+    repository.add_incidents([make_incident(number) for number in range(20, 30)])
+
+    delta = _delta(client, version, "&since=2024-07-24&fields=title,post_date")
+
+    assert delta["incidents"] == [{"title": f"Incident {number}", "post_date": f"2024-07-{number % 28 + 1:02d}"}
+                                  for number in range(23, 28)]
+    assert delta["refs"] == [f"inc-{number}" for number in range(23, 28)]
+
+
+def test_unknown_version_asks_for_a_reset(client):
+    delta = _delta(client, 1)
+
+    assert delta["reset"] is True
+    assert delta["incidents"] == []
+    assert delta["version"] == _version(client)
+
+
+def test_version_older_than_the_change_log_asks_for_a_reset(monkeypatch, client, repository):
+    monkeypatch.setattr(shared_snapshot, 'MAX_CHANGE_LOG_VERSIONS', 2)
+    versions = [_version(client)]
+    for number in range(20, 23):
+        repository.add_incidents([make_incident(number)])
+        versions.append(_version(client))
+
+    # Only the last two versions' changes are kept: deltas can start at versions[1], not before.
+    assert _delta(client, versions[0])["reset"] is True
+    delta = _delta(client, versions[1])
+    assert delta["reset"] is False
+    assert delta["refs"] == ["inc-21", "inc-22"]
+
+
+def test_since_version_must_be_an_integer(client):
+    assert client.get("/api/incidents?since_version=yesterday").status_code == 400
+    assert client.get("/api/incidents?since_version=1&format=columnar").status_code == 400
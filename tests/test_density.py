@@ -0,0 +1,51 @@
+import copy
+
+from conftest import make_incident
+
+from app.density import MAX_DENSITY_ZOOM, DensityGrids, get_density_grids
+from app.incident_columns import IncidentColumns
+from app.incident_store import IncidentStore
+from metrics import ROWS_SCANNED
+
+
+def _rows():
+    rows = [make_incident(number, geocoded=number % 3 != 0) for number in range(40)]
+    rows[4]['post_date'] = '' # Counted in the totals, never in a date range.
+    return rows
+
+
+def test_updated_grids_match_a_rebuild():
+    rows = _rows()
+    grids = DensityGrids(IncidentColumns(rows))
+    levels_before = copy.deepcopy(grids.levels)
+
+    new_rows = [dict(row) for row in rows]
+    new_rows[0]['latitude'], new_rows[0]['longitude'] = '47.66', '-122.30' # Geocoded.
+    new_rows[1]['latitude'], new_rows[1]['longitude'] = '47.60', '-122.33' # Moved.
+    new_rows[2]['latitude'], new_rows[2]['longitude'] = '', '' # Lost its coordinates.
+    new_rows[5]['post_date'] = '2024-06-01' # Re-dated.
+    new_rows.extend(make_incident(number) for number in range(40, 44))
+    new_columns = IncidentColumns(new_rows)
+
+    updated = grids.updated(new_columns, [0, 1, 2, 5, 40, 41, 42, 43])
+
+    assert updated.levels == DensityGrids(new_columns).levels
+    assert grids.levels == levels_before # The previous version's grids are left alone.
+    for zoom in (0, 12, MAX_DENSITY_ZOOM):
+        for since, until in [(None, None), ('2024-06-01', '2024-06-01'), ('2024-07-03', '2024-07-10')]:
+            assert (sorted(updated.query(zoom, -122.4, 47.5, -122.2, 47.7, since, until))
+                    == sorted(DensityGrids(new_columns).query(zoom, -122.4, 47.5, -122.2, 47.7, since, until)))
+
+
+def test_grids_of_a_new_dataset_version_are_updated_from_the_previous(repository):
+    store = IncidentStore(repository)
+    get_density_grids(store.get_snapshot())
+    applied = ROWS_SCANNED.labels(operation='density_update')
+    applied_before = applied.value
+
+    repository.add_incidents([make_incident(number) for number in range(20, 22)])
+    repository.update_coordinates({3: (47.66, -122.30)})
+    snapshot = store.get_snapshot()
+
+    assert get_density_grids(snapshot).levels == DensityGrids(IncidentColumns(snapshot.incidents)).levels
+    assert applied.value - applied_before == 3
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from geocode_cache import GeocodeCache
+from geocoding_engine import GeocoderBackend, GeocodingEngine, OfflineGeocoderBackend, TransientGeocodingError
+
+
+class FlakyBackend(GeocoderBackend):
+    # Fails the first `failures` lookups of every address, then answers.
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def geocode(self, address):
+        with self._lock:
+            attempt = self.attempts[address] = self.attempts.get(address, 0) + 1
+        if attempt <= self.failures:
+            raise TransientGeocodingError("try again")
+        return 47.65, -122.30
+
+
+def _engine(backend, **kwargs):
+    return GeocodingEngine(backend, rate_limit_per_second=1000, backoff_seconds=0, **kwargs)
+
+
+def test_duplicate_addresses_are_looked_up_once():
+    backend = OfflineGeocoderBackend()
+    addresses = ["4000 15th Ave NE", " 4000  15th ave ne", "1410 NE Campus Pkwy"]
+
+    results = _engine(backend).geocode_many(addresses)
+
+    assert backend.calls == 2
+    assert set(results) == set(addresses)
+    assert results[addresses[0]] == results[addresses[1]]
+
+
+def test_cached_addresses_skip_the_backend(tmp_path):
+    cache = GeocodeCache(str(tmp_path / 'geocode_cache.sqlite3'))
+    try:
+        first = _engine(OfflineGeocoderBackend(), cache=cache).geocode_many(["4000 15th Ave NE"])
+        backend = OfflineGeocoderBackend()
+        second = _engine(backend, cache=cache).geocode_many(["4000 15th Ave NE"])
+    finally:
+        cache.close()
+
+    assert backend.calls == 0
+    assert second == first
+
+
+def test_transient_failures_are_retried():
+    backend = FlakyBackend(failures=2)
+
+    results = _engine(backend, max_retries=2).geocode_many(["4000 15th Ave NE"])
+
+    assert backend.attempts["4000 15th Ave NE"] == 3
+    assert results["4000 15th Ave NE"].latitude == 47.65
+
+
+def test_addresses_failing_every_attempt_are_left_out():
+    backend = FlakyBackend(failures=10)
+
+    results = _engine(backend, max_retries=1).geocode_many(["4000 15th Ave NE", "1410 NE Campus Pkwy"])
+
+    assert results == {}
+    assert all(attempts == 2 for attempts in backend.attempts.values())
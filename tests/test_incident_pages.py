@@ -0,0 +1,57 @@
+from conftest import make_incident
+
+
+def _all_pages(client, query):
+    incidents, refs = [], []
+    cursor = None
+    while True:
+        response = client.get(f"/api/incidents?{query}" + (f"&cursor={cursor}" if cursor else ''))
+        assert response.status_code == 200
+        page = response.get_json()
+        incidents.extend(page["incidents"])
+        refs.extend(page["refs"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return incidents, refs
+
+
+def test_pages_cover_every_incident_once(client):
+    everything = client.get("/api/incidents").get_json()
+
+    incidents, refs = _all_pages(client, "limit=7")
+
+    assert incidents == everything
+    assert refs == [incident["id"] or f"row-{position}" for position, incident in enumerate(everything)]
+
+
+def test_page_refs_match_the_columnar_ids(client):
+    columnar = client.get("/api/incidents?format=columnar").get_json()
+
+    incidents, refs = _all_pages(client, "limit=6")
+
+    geocoded_refs = [ref for ref, incident in zip(refs, incidents) if incident["latitude"]]
+    assert geocoded_refs == columnar["ids"]
+
+
+def test_cursor_stays_valid_across_appends(client, repository):
+    first = client.get("/api/incidents?limit=15").get_json()
+    repository.add_incidents([make_incident(number) for number in range(20, 25)])
+
+    rest, _ = _all_pages(client, f"limit=15&cursor={first['next_cursor']}")
+
+    titles = [incident["title"] for incident in first["incidents"] + rest]
+    assert titles == [f"Incident {number}" for number in range(25)]
+
+
+def test_filtered_pages_only_hold_matches(client):
+    incidents, _ = _all_pages(client, "limit=2&since=2024-07-05&until=2024-07-09")
+
+    assert incidents
+    assert all("2024-07-05" <= incident["post_date"] <= "2024-07-09" for incident in incidents)
+    assert incidents == client.get("/api/incidents?since=2024-07-05&until=2024-07-09").get_json()
+
+
+def test_bad_pagination_parameters_are_rejected(client):
+    assert client.get("/api/incidents?cursor=not-a-cursor").status_code == 400
+    assert client.get("/api/incidents?limit=0").status_code == 400
+    assert client.get("/api/incidents?format=columnar&limit=5").status_code == 400
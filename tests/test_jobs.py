@@ -0,0 +1,71 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import jobs
+from app.jobs import JOB_FAILED, JOB_SUCCEEDED, JobManager
+
+
+def _wait_finished(manager, job_id):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job.finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_workers_share_job_records_and_coalesce(tmp_path):
+    # Two managers on one state file stand in for two WSGI worker processes.
+    path = str(tmp_path / 'incidents.csv.jobs.json')
+    first, second = JobManager(path), JobManager(path)
+    release = threading.Event()
+
+    def fetch(report_progress):
+        report_progress('fetching', "Fetching.")
+        release.wait(5)
+        return {"appended": 3}
+
+    job, created = first.submit('fetch', fetch)
+    joined, joined_created = second.submit('fetch', lambda report_progress: {"appended": 0})
+    assert created and not joined_created
+    assert joined.id == job.id
+    assert second.get(job.id).status in ('queued', 'running')
+
+    release.set()
+    finished = _wait_finished(second, job.id)
+    assert finished.status == JOB_SUCCEEDED
+    assert finished.result == {"appended": 3}
+
+    # Once the job has finished, the next submit starts a new one.
+    _, created_again = second.submit('fetch', lambda report_progress: None)
+    assert created_again
+
+
+def test_failed_job_records_error(tmp_path):
+    manager = JobManager(str(tmp_path / 'jobs.json'))
+
+    def fail(report_progress):
+        raise RuntimeError("feed down")
+
+    job, _ = manager.submit('fetch', fail)
+    finished = _wait_finished(manager, job.id)
+    assert finished.status == JOB_FAILED
+    assert finished.error == "feed down"
+
+
+def test_stale_job_is_replaced(tmp_path, monkeypatch):
+    path = str(tmp_path / 'jobs.json')
+    release = threading.Event()
+    job, _ = JobManager(path).submit('fetch', lambda report_progress: release.wait(5))
+
+    # As if the worker running the job had died without saving for too long.
+    monkeypatch.setattr(jobs, 'JOB_STALE_SECONDS', -1)
+    replacement, created = JobManager(path).submit('fetch', lambda report_progress: None)
+    release.set()
+    assert created
+    assert replacement.id != job.id
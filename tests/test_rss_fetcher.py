@@ -0,0 +1,159 @@
+import csv
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import rss_fetcher
+from app.feed_fetcher import FEED_DISALLOWED, FEED_OK, FeedFetcher, FeedStateStore, HttpResponse
+from geocoding_engine import GeocodingEngine, OfflineGeocoderBackend
+from incident_repository import CSV_FIELDNAMES, CsvIncidentRepository
+
+FEED_URL = "http://feeds.test/feed/"
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Test</title>
+<item><title>Theft</title><link>http://feeds.test/1</link><pubDate>Mon, 01 Jul 2024 12:00:00 +0000</pubDate>
+<description>4000 15th Ave NE. Reported to UWPD: bike stolen.</description></item>
+<item><title>Trespass</title><link>http://feeds.test/2</link><pubDate>Tue, 02 Jul 2024 12:00:00 +0000</pubDate>
+<description>1410 NE Campus Pkwy. Reported to UWPD: trespass.</description></item>
+</channel></rss>"""
+
+
+class FakeClient:
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, headers=None, allow_url=None):
+        if headers and headers.get('If-None-Match') == '"v1"':
+            return HttpResponse(304, {}, b'')
+        return HttpResponse(200, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jul 2024 12:00:00 GMT'}, self.body)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'incidents.csv')
+    with open(path, mode='w', newline='', encoding='utf-8') as outfile:
+        csv.DictWriter(outfile, fieldnames=CSV_FIELDNAMES).writeheader()
+    return path
+
+
+def _use_feed(monkeypatch, tmp_path, body):
+    fetcher = FeedFetcher([FEED_URL], str(tmp_path / 'feed_state.json'), client=FakeClient(body),
+                          respect_robots_txt=False)
+    monkeypatch.setattr(rss_fetcher, '_default_feed_fetcher', fetcher)
+    return fetcher
+
+
+def _fetch(csv_path):
+    engine = GeocodingEngine(OfflineGeocoderBackend(), rate_limit_per_second=1000)
+    return rss_fetcher.fetch_parse_and_geocode(csv_path, geocoding_engine=engine)
+
+
+def test_stored_feed_commits_validators(monkeypatch, tmp_path, csv_path):
+    fetcher = _use_feed(monkeypatch, tmp_path, FEED)
+
+    assert _fetch(csv_path)["appended"] == 2
+    assert fetcher.state.get(FEED_URL)['etag'] == '"v1"'
+
+
+def test_failed_append_leaves_validators_unset(monkeypatch, tmp_path, csv_path):
+    fetcher = _use_feed(monkeypatch, tmp_path, FEED)
+
+    def fail(self, incidents):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(CsvIncidentRepository, 'add_incidents', fail)
+    with pytest.raises(OSError):
+        _fetch(csv_path)
+    assert 'etag' not in fetcher.state.get(FEED_URL)
+
+    # The next fetch downloads the feed in full again and stores its items.
+    monkeypatch.undo()
+    fetcher = _use_feed(monkeypatch, tmp_path, FEED)
+    assert _fetch(csv_path)["appended"] == 2
+    assert fetcher.state.get(FEED_URL)['etag'] == '"v1"'
+
+
+def test_truncated_feed_leaves_validators_unset(monkeypatch, tmp_path, csv_path):
+    truncated = FEED[:FEED.index(b'<item><title>Trespass')] + b'<item><title>Tres'
+    fetcher = _use_feed(monkeypatch, tmp_path, truncated)
+
+    assert _fetch(csv_path)["appended"] == 1
+    assert 'etag' not in fetcher.state.get(FEED_URL)
+
+
+def test_feed_state_updates_merge_with_other_writers(tmp_path):
+    path = str(tmp_path / 'feed_state.json')
+    # Two stores on one file stand in for two processes.
+    first, second = FeedStateStore(path), FeedStateStore(path)
+    first.update("http://a.test/feed", etag='"a"')
+    second.update("http://b.test/feed", etag='"b"')
+    first.update("http://a.test/feed", failures=0)
+
+    assert first.get("http://b.test/feed") == {'etag': '"b"'}
+    assert second.get("http://a.test/feed") == {'etag': '"a"', 'failures': 0}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+class RedirectingHandler(BaseHTTPRequestHandler):
+    # /old moves permanently to /feed on the same host; /elsewhere to /feed on
+    # "localhost", whose robots.txt disallows everything.
+    def do_GET(self):
+        host = self.headers['Host'].split(':')[0]
+        port = self.server.server_address[1]
+        if self.path == '/robots.txt':
+            body = b"User-agent: *\nDisallow: /\n" if host == 'localhost' else b""
+            self._reply(200, body)
+        elif self.path == '/old':
+            self._reply(301, b"", location='/feed')
+        elif self.path == '/elsewhere':
+            self._reply(302, b"", location=f'http://localhost:{port}/feed')
+        elif self.path == '/loop':
+            self._reply(302, b"", location='/loop')
+        else:
+            self._reply(200, FEED)
+
+    def _reply(self, status, body, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RedirectingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_moved_feed_is_followed(tmp_path, feed_server):
+    fetcher = FeedFetcher([feed_server + '/old'], str(tmp_path / 'feed_state.json'))
+    result = fetcher.fetch_feed(feed_server + '/old')
+    assert result.status == FEED_OK
+    assert result.body == FEED
+
+
+def test_redirect_to_disallowed_host_is_not_followed(tmp_path, feed_server):
+    fetcher = FeedFetcher([feed_server + '/elsewhere'], str(tmp_path / 'feed_state.json'))
+    result = fetcher.fetch_feed(feed_server + '/elsewhere')
+    assert result.status == FEED_DISALLOWED
+
+
+def test_redirect_loop_is_a_failure(tmp_path, feed_server):
+    fetcher = FeedFetcher([feed_server + '/loop'], str(tmp_path / 'feed_state.json'))
+    result = fetcher.fetch_feed(feed_server + '/loop')
+    assert result.status == 'error'
+    assert 'redirects' in result.detail
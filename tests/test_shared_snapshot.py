@@ -0,0 +1,81 @@
+import glob
+import os
+
+import pytest
+from conftest import make_incident
+
+from shared_snapshot import MAX_CHANGE_LOG_VERSIONS, load_shared_snapshot, open_snapshot, snapshot_path_for
+
+
+def _current(repository):
+    return open_snapshot(snapshot_path_for(repository.path))
+
+
+def test_change_log_records_appended_and_patched_rows(repository):
+    base = load_shared_snapshot(repository)
+    repository.add_incidents([make_incident(20), make_incident(21)])
+    appended = _current(repository)
+    repository.update_coordinates({3: (47.66, -122.3), 7: (47.67, -122.31)})
+    patched = _current(repository)
+
+    assert appended.changed_positions(base.version) == [20, 21]
+    assert patched.changed_positions(appended.version) == [3, 7]
+    assert patched.changed_positions(base.version) == [3, 7, 20, 21]
+    assert patched.changed_positions(patched.version) == []
+    assert patched.incidents[3]['latitude'] == '47.66'
+    assert base.incidents[3]['latitude'] == '' # An open mapping keeps its version.
+    for snapshot in (base, appended, patched):
+        snapshot.close()
+
+
+def test_change_log_is_trimmed_to_its_last_versions(repository):
+    versions = [load_shared_snapshot(repository).version]
+    for number in range(20, 20 + MAX_CHANGE_LOG_VERSIONS + 1):
+        repository.add_incidents([make_incident(number)])
+        versions.append(_current(repository).version)
+    snapshot = _current(repository)
+
+    # The first write's changes were dropped, so deltas can start at its version but not before.
+    assert len(snapshot.change_log) == MAX_CHANGE_LOG_VERSIONS
+    assert snapshot.change_log_base == versions[1]
+    assert snapshot.changed_positions(versions[0]) is None
+    assert snapshot.changed_positions(versions[1]) == list(range(21, 20 + MAX_CHANGE_LOG_VERSIONS + 1))
+    assert snapshot.changed_positions(versions[-2]) == [20 + MAX_CHANGE_LOG_VERSIONS]
+    snapshot.close()
+
+
+def test_unknown_and_future_versions_have_no_delta(repository):
+    snapshot = load_shared_snapshot(repository)
+
+    assert snapshot.changed_positions(snapshot.version - 1) is None
+    assert snapshot.changed_positions(snapshot.version + 1) is None
+    snapshot.close()
+
+
+def test_hand_edited_data_is_rebuilt_with_a_fresh_change_log(repository):
+    load_shared_snapshot(repository).close()
+    repository.add_incidents([make_incident(20)])
+    with open(repository.path, 'a', encoding='utf-8', newline='') as outfile:
+        outfile.write('inc-99,Edited by hand,2024-07-01,,,,,,http://feeds.test/99\r\n')
+
+    snapshot = load_shared_snapshot(repository)
+
+    assert len(snapshot.incidents) == 22
+    assert snapshot.change_log == []
+    assert snapshot.changed_positions(snapshot.change_log_base) == []
+    snapshot.close()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="Windows keeps a version's file while it is mapped")
+def test_only_the_current_version_file_is_kept(repository):
+    first = load_shared_snapshot(repository)
+    repository.add_incidents([make_incident(20)])
+    repository.add_incidents([make_incident(21)])
+    current = _current(repository)
+
+    pointer = snapshot_path_for(repository.path)
+    assert glob.glob(pointer + '.*') == [f"{pointer}.{current.version}"]
+    assert not os.path.exists(f"{pointer}.{first.version}")
+    assert len(first.incidents) == 20 # Still readable after its file was removed.
+    for snapshot in (first, current):
+        snapshot.close()
@@ -0,0 +1,76 @@
+from conftest import make_incident
+
+from app.incident_columns import IncidentColumns, get_incident_columns
+from app.incident_store import IncidentStore
+from app.time_index import TimeIndex, get_time_index
+from metrics import ROWS_SCANNED
+
+
+def _rows():
+    rows = [make_incident(number) for number in range(40)]
+    rows[3]['post_date'] = '07/15/2024' # Stored before dates were normalized on ingest.
+    rows[7]['post_date'] = ''
+    return rows
+
+
+def _changed(rows):
+    # A later version: rows re-dated, dated and undated, one losing its coordinates, and rows appended.
+    rows = [dict(row) for row in rows]
+    rows[5]['post_date'] = '2024-06-30'
+    rows[9]['latitude'], rows[9]['longitude'] = '', ''
+    rows[11]['post_date'] = 'unknown'
+    rows[7]['post_date'] = '2024-07-20'
+    rows.extend(make_incident(number) for number in range(40, 43))
+    return rows, [5, 7, 9, 11, 40, 41, 42]
+
+
+def _assert_same_columns(columns, expected):
+    assert columns.refs == expected.refs
+    assert columns.lats == expected.lats
+    assert columns.lons == expected.lons
+    assert columns.post_dates == expected.post_dates
+
+
+def test_updated_columns_match_a_full_decode():
+    rows = _rows()
+    columns = IncidentColumns(rows)
+    before = list(columns.post_dates)
+    new_rows, changed = _changed(rows)
+
+    _assert_same_columns(columns.updated(new_rows, changed), IncidentColumns(new_rows))
+    assert columns.post_dates == before # The previous version's columns are left alone.
+
+
+def test_updated_index_matches_a_rebuild():
+    rows = _rows()
+    index = TimeIndex(IncidentColumns(rows))
+    new_rows, changed = _changed(rows)
+    new_columns = IncidentColumns(new_rows)
+
+    updated = index.updated(new_columns, changed)
+    rebuilt = TimeIndex(new_columns)
+
+    assert updated.dates == rebuilt.dates
+    assert updated.positions == rebuilt.positions
+    for since, until in [(None, None), ('2024-06-30', '2024-07-05'), ('2024-07-15', None), (None, '2024-07-01')]:
+        assert updated.query(since, until) == rebuilt.query(since, until)
+    assert index.query('2024-06-30', '2024-06-30') == [] # Unchanged by the update.
+
+
+def test_index_of_a_new_dataset_version_is_updated_from_the_previous(repository):
+    store = IncidentStore(repository)
+    first = store.get_snapshot()
+    get_time_index(first)
+    decoded = ROWS_SCANNED.labels(operation='columns_update')
+    decoded_before = decoded.value
+
+    repository.add_incidents([make_incident(number) for number in range(20, 23)])
+    repository.update_coordinates({3: (47.66, -122.30)})
+    second = store.get_snapshot()
+    index = get_time_index(second)
+
+    assert decoded.value - decoded_before == 4 # Only the appended rows and the geocoded one.
+    expected = TimeIndex(IncidentColumns(second.incidents))
+    assert index.dates == expected.dates
+    assert index.positions == expected.positions
+    _assert_same_columns(get_incident_columns(second), IncidentColumns(second.incidents))